@@ -0,0 +1,54 @@
+"""Benchmark of listing queries on the memory storage backend, with and
+without the columnar mode (requires NumPy)::
+
+    python benchmarks/memory_columnar.py [sizes...]
+"""
+import random
+import sys
+import time
+
+from cliquet.storage import Filter, Sort
+from cliquet.storage import memory
+from cliquet.utils import COMPARISON
+
+
+QUERIES = {
+    'filter': dict(filters=[Filter('age', 20, COMPARISON.MIN),
+                            Filter('score', 900, COMPARISON.LT)]),
+    'filter+sort': dict(filters=[Filter('age', 20, COMPARISON.MIN)],
+                        sorting=[Sort('score', -1)],
+                        limit=10),
+    'paginate': dict(sorting=[Sort('age', 1), Sort('last_modified', -1)],
+                     pagination_rules=[[Filter('age', 50, COMPARISON.GT)]],
+                     limit=10),
+}
+
+
+def fill(storage, size):
+    random.seed(42)
+    storage.set_indexed_fields('bench', ('age', 'score'))
+    for i in range(size):
+        record = {'age': random.randint(0, 100),
+                  'score': random.randint(0, 1000)}
+        storage.create('bench', 'parent', record)
+
+
+def main(sizes):
+    for size in sizes:
+        storages = [('rows', memory.Memory()),
+                    ('columnar', memory.Memory(columnar=True))]
+        for name, storage in storages:
+            fill(storage, size)
+
+        for query, kwargs in sorted(QUERIES.items()):
+            for name, storage in storages:
+                start = time.time()
+                storage.get_all('bench', 'parent', **kwargs)
+                elapsed = (time.time() - start) * 1000
+                print('%8d %-12s %-10s %10.2f msec' % (size, query, name,
+                                                       elapsed))
+
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]]
+    main(sizes or [10000, 100000, 1000000])
@@ -0,0 +1,42 @@
+"""Benchmark of the write throughput of the memory storage backend, for
+each fsync policy of the persistence layer::
+
+    python benchmarks/memory_persistence.py [number of writes]
+"""
+import shutil
+import sys
+import tempfile
+import time
+
+from cliquet.storage import memory
+from cliquet.storage.persistence import Persistence
+
+
+def writes(storage, size):
+    start = time.time()
+    for i in range(size):
+        record = storage.create('bench', 'parent', {'number': i})
+        if i % 10 == 0:
+            storage.delete('bench', 'parent', record['id'])
+    return size / (time.time() - start)
+
+
+def main(size):
+    writes(memory.Memory(), size)  # Warm up.
+    print('%-10s %10.0f writes/sec' % ('disabled',
+                                       writes(memory.Memory(), size)))
+
+    for fsync in ('never', 'batch', 'always'):
+        path = tempfile.mkdtemp()
+        try:
+            persistence = Persistence(path, fsync=fsync)
+            storage = memory.Memory(persistence=persistence)
+            throughput = writes(storage, size)
+            persistence.close()
+        finally:
+            shutil.rmtree(path)
+        print('%-10s %10.0f writes/sec' % (fsync, throughput))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,84 @@
+"""Micro-benchmark of the filtering and sorting of records by the memory
+based storages.
+
+Compares the per-record cost of the compiled plans with the naive
+evaluation of filters and sort fields::
+
+    python benchmarks/memory_plans.py [number of records]
+"""
+import operator
+import random
+import sys
+import timeit
+
+from cliquet.storage import Filter, Sort
+from cliquet.storage import memory
+from cliquet.utils import COMPARISON
+
+
+FILTERS = [Filter('age', 20, COMPARISON.MIN),
+           Filter('status', 'archived', COMPARISON.NOT),
+           Filter('score', 900, COMPARISON.LT)]
+SORTING = [Sort('age', -1), Sort('last_modified', 1)]
+LIMIT = 10
+
+
+def naive_filters(records, filters):
+    operators = {
+        COMPARISON.LT: operator.lt,
+        COMPARISON.MAX: operator.le,
+        COMPARISON.EQ: operator.eq,
+        COMPARISON.NOT: operator.ne,
+        COMPARISON.MIN: operator.ge,
+        COMPARISON.GT: operator.gt,
+    }
+    for record in records:
+        matches = [operators[f.operator](record.get(f.field), f.value)
+                   for f in filters]
+        if all(matches):
+            yield record
+
+
+def naive_sorting(records, sorting):
+    result = list(records)
+    if not result:
+        return result
+    first = result[0]
+
+    def column(name):
+        return lambda r: r.get(name, first.get(name, float('inf')))
+
+    for sort in reversed(sorting):
+        result = sorted(result, key=column(sort.field),
+                        reverse=sort.direction < 0)
+    return result
+
+
+def naive(records):
+    return naive_sorting(naive_filters(records, FILTERS), SORTING)[:LIMIT]
+
+
+def compiled(records):
+    storage = memory.Memory()
+    return storage.apply_sorting(storage.apply_filters(records, FILTERS),
+                                 SORTING, LIMIT)
+
+
+def main(size):
+    random.seed(42)
+    records = [{'id': str(i),
+                'last_modified': i,
+                'age': random.randint(0, 100),
+                'score': random.randint(0, 1000),
+                'status': random.choice(['draft', 'published', 'archived'])}
+               for i in range(size)]
+    assert naive(records) == compiled(records)
+
+    for name, func in [('naive', naive), ('compiled', compiled)]:
+        timer = timeit.Timer(lambda: func(records))
+        best = min(timer.repeat(repeat=5, number=10)) / 10
+        print('%-10s %8.3f usec/record' % (name, best * 1e6 / size))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
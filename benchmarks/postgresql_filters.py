@@ -0,0 +1,86 @@
+"""Benchmark of the filtered lists of the PostgreSQL storage backend, with
+the plans chosen for typed comparisons on an indexed field::
+
+    python benchmarks/postgresql_filters.py [number of records]
+
+Records are inserted in bulk, with a ``price`` number between 0 and 999,
+and the ``price`` field is indexed (see ``cliquet migrate``).
+
+A PostgreSQL server is expected on ``localhost:5432``, with a ``testdb``
+database, which is flushed.
+"""
+import sys
+import time
+
+from cliquet.storage import Filter, Sort, postgresql
+from cliquet.utils import COMPARISON
+
+
+QUERIES = 20
+
+FILTERS = [
+    ('price = 500', [Filter('price', 500, COMPARISON.EQ)]),
+    ('price >= 990', [Filter('price', 990, COMPARISON.MIN)]),
+    ('price < 10', [Filter('price', 10, COMPARISON.LT)]),
+    ('price <> 500', [Filter('price', 500, COMPARISON.NOT)]),
+]
+
+
+def fill(storage, size):
+    query = """
+    INSERT INTO records (id, parent_id, collection_id, data)
+    SELECT md5(i::TEXT), 'parent', 'bench',
+           json_build_object('price', i %% 1000,
+                             'title', 'Record ' || i)::JSONB
+      FROM generate_series(1, %(size)s) AS i;
+    ANALYZE records;
+    """
+    with storage.connect() as cursor:
+        cursor.execute(query, dict(size=size))
+
+
+def plan(storage, filters):
+    sql, placeholders = storage._format_conditions(filters, 'id',
+                                                   'last_modified')
+    query = """
+    EXPLAIN SELECT id
+              FROM records
+             WHERE parent_id = 'parent'
+               AND collection_id = 'bench'
+               AND %s;
+    """ % sql
+    with storage.connect(readonly=True) as cursor:
+        cursor.execute(query, placeholders)
+        lines = [row[0] for row in cursor.fetchall()]
+    # Keep the nodes names, e.g. "Bitmap Heap Scan on records".
+    nodes = [line.split('  (')[0].strip(' ->') for line in lines
+             if 'cost=' in line]
+    return ' > '.join(nodes)
+
+
+def measure(storage, filters):
+    start = time.time()
+    for i in range(QUERIES):
+        storage.get_all('bench', 'parent', filters=filters,
+                        sorting=[Sort('price', 1)], limit=10)
+    return QUERIES / (time.time() - start)
+
+
+def main(size):
+    storage = postgresql.PostgreSQL(pool_size=1, max_fetch_size=10000,
+                                    host='localhost', user='postgres',
+                                    password='postgres', database='testdb')
+    storage.initialize_schema()
+    storage.flush()
+    fill(storage, size)
+    storage.set_indexed_fields('bench', ('price',))
+    storage.initialize_schema()
+    print('%-12s %12s  %s' % ('filter', 'queries/s', 'plan'))
+    for name, filters in FILTERS:
+        print('%-12s %12.2f  %s' % (name, measure(storage, filters),
+                                    plan(storage, filters)))
+    storage.flush()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
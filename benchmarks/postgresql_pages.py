@@ -0,0 +1,60 @@
+"""Benchmark of the first and deep pages of records sorted by timestamp
+with the PostgreSQL storage backend, with keyset pagination and with the
+generic pagination rules::
+
+    python benchmarks/postgresql_pages.py [number of records]
+
+A PostgreSQL server is expected on ``localhost:5432``, with a ``testdb``
+database, which is flushed.
+"""
+import sys
+import time
+
+import mock
+
+from cliquet.storage import postgresql, Filter, Sort
+from cliquet.utils import COMPARISON
+
+
+QUERIES = 20
+LIMIT = 10
+
+
+def pagination_rules(record):
+    return [[Filter('last_modified', record['last_modified'],
+                    COMPARISON.LT)]]
+
+
+def query(storage, page):
+    sorting = [Sort('last_modified', -1)]
+    records, _ = storage.get_all('bench', 'parent', sorting=sorting)
+    rules = pagination_rules(records[page * LIMIT - 1]) if page > 1 else None
+    start = time.time()
+    for i in range(QUERIES):
+        storage.get_all('bench', 'parent', sorting=sorting,
+                        pagination_rules=rules, limit=LIMIT)
+    return (time.time() - start) * 1000 / QUERIES
+
+
+def main(size):
+    storage = postgresql.PostgreSQL(pool_size=1, max_fetch_size=size,
+                                    host='localhost', user='postgres',
+                                    password='postgres', database='testdb')
+    storage.initialize_schema()
+    storage.flush()
+    for i in range(size):
+        storage.create('bench', 'parent', {'number': i})
+
+    pages = [1, size // LIMIT // 2, size // LIMIT]
+    print('%-8s %8s %14s' % ('', 'page', 'ms/query'))
+    for page in pages:
+        print('%-8s %8s %14.2f' % ('keyset', page, query(storage, page)))
+    with mock.patch.object(storage, '_format_keyset_pagination',
+                           return_value=None):
+        for page in pages:
+            print('%-8s %8s %14.2f' % ('rules', page, query(storage, page)))
+    storage.flush()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
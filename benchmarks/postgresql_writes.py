@@ -0,0 +1,66 @@
+"""Benchmark of the writes and of the collection timestamp reads with the
+PostgreSQL storage backend, in collections of increasing size::
+
+    python benchmarks/postgresql_writes.py [number of records]
+
+Run it before and after a schema migration to compare the triggers. Puts
+create records with a unicity rule, the way ``PUT`` requests do.
+
+A PostgreSQL server is expected on ``localhost:5432``, with a ``testdb``
+database, which is flushed.
+"""
+import sys
+import time
+import uuid
+
+from cliquet.storage import postgresql
+
+
+QUERIES = 1000
+
+
+def measure(storage, size):
+    start = time.time()
+    records = [storage.create('bench', 'parent', {'number': i})
+               for i in range(size)]
+    creates = size / (time.time() - start)
+
+    start = time.time()
+    for record in records[:QUERIES]:
+        storage.update('bench', 'parent', record['id'], {'number': 0})
+    updates = min(size, QUERIES) / (time.time() - start)
+
+    start = time.time()
+    for i in range(QUERIES):
+        storage.update('bench', 'parent', str(uuid.uuid4()),
+                       {'number': size + i}, unique_fields=('number',))
+    puts = QUERIES / (time.time() - start)
+
+    start = time.time()
+    for i in range(QUERIES):
+        storage.collection_timestamp('bench', 'parent')
+    timestamps = QUERIES / (time.time() - start)
+
+    start = time.time()
+    storage.delete_all('bench', 'parent')
+    deletes = (size + QUERIES) / (time.time() - start)
+    return creates, updates, puts, timestamps, deletes
+
+
+def main(size):
+    storage = postgresql.PostgreSQL(pool_size=1, max_fetch_size=size,
+                                    host='localhost', user='postgres',
+                                    password='postgres', database='testdb')
+    storage.initialize_schema()
+    print('%-8s %10s %10s %10s %12s %10s' % ('records', 'creates/s',
+                                             'updates/s', 'puts/s',
+                                             'timestamps/s', 'deletes/s'))
+    for records in (size // 100, size // 10, size):
+        storage.flush()
+        print('%-8s %10.0f %10.0f %10.0f %12.0f %10.0f' %
+              ((records,) + measure(storage, records)))
+    storage.flush()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,71 @@
+"""Benchmark of the encodings of records, with the memory used by the Redis
+storage backend and the encoding and decoding throughput::
+
+    python benchmarks/redis_codecs.py [number of records]
+
+A Redis server is expected on ``localhost:6379``, its database 5 is flushed.
+"""
+import random
+import sys
+import time
+
+from cliquet.serializers import Serializer
+from cliquet.storage import redis as redis_backend
+
+
+CONFIGURATIONS = [
+    ('json', None),
+    ('json', 256),
+    ('msgpack', None),
+    ('msgpack', 256),
+]
+
+
+def make_record(i):
+    return {
+        'title': 'Record number %s' % i,
+        'done': i % 2 == 0,
+        'price': random.random() * 100,
+        'tags': ['tag%s' % random.randint(0, 20) for _ in range(5)],
+        'description': ' '.join(random.choice(('lorem', 'ipsum', 'dolor'))
+                                for _ in range(random.randint(0, 100))),
+    }
+
+
+def throughput(serializer, records):
+    start = time.time()
+    encoded = [serializer.dumps(record) for record in records]
+    encoding = len(records) / (time.time() - start)
+    start = time.time()
+    for data in encoded:
+        serializer.loads(data)
+    decoding = len(records) / (time.time() - start)
+    return encoding, decoding
+
+
+def used_memory(storage, records):
+    storage.flush()
+    before = storage._client.info('memory')['used_memory']
+    for record in records:
+        storage.create('bench', 'parent', record)
+    memory = storage._client.info('memory')['used_memory'] - before
+    storage.flush()
+    return memory / 1024.0 / 1024.0
+
+
+def main(size):
+    records = [make_record(i) for i in range(size)]
+    options = dict(max_connections=1, host='localhost', port=6379, db=5)
+    print('%-8s %9s %10s %12s %12s' % ('codec', 'threshold', 'memory',
+                                       'encodings/s', 'decodings/s'))
+    for codec, threshold in CONFIGURATIONS:
+        serializer = Serializer(codec=codec, compression_threshold=threshold)
+        storage = redis_backend.Redis(serializer=serializer, **options)
+        memory = used_memory(storage, records)
+        encoding, decoding = throughput(serializer, records)
+        print('%-8s %9s %7.2f MB %12.0f %12.0f' % (codec, threshold, memory,
+                                                   encoding, decoding))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,109 @@
+"""Benchmark of concurrent writes on the same collection with the Redis
+storage backend, compared with the former implementation based on optimistic
+locking (WATCH/MULTI) and pipelines::
+
+    python benchmarks/redis_contention.py [threads] [writes per thread]
+
+A Redis server is expected on ``localhost:6379``, its database 5 is flushed.
+"""
+import itertools
+import sys
+import threading
+import time
+
+import redis
+
+from cliquet import utils
+from cliquet.storage import redis as redis_backend
+
+
+class OptimisticLockingRedis(redis_backend.Redis):
+    """Writes as they were performed before server-side scripts."""
+
+    retries = itertools.count()
+
+    def _bump_timestamp(self, collection_id, parent_id):
+        key = '{0}.{1}.timestamp'.format(collection_id, parent_id)
+        while 1:
+            with self._client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    previous = pipe.get(key)
+                    pipe.multi()
+                    current = utils.msec_time()
+                    if previous and int(previous) >= current:
+                        current = int(previous) + 1
+                    pipe.set(key, current)
+                    pipe.execute()
+                    return current
+                except redis.WatchError:
+                    next(self.retries)
+                    continue
+
+    def _save(self, collection_id, parent_id, object_id, record,
+              modified_field):
+        self.set_record_timestamp(collection_id, parent_id, record,
+                                  modified_field=modified_field)
+        prefix = '{0}.{1}'.format(collection_id, parent_id)
+        with self._client.pipeline() as multi:
+            multi.set('{0}.{1}.records'.format(prefix, object_id),
+                      self._encode(record))
+            multi.sadd('{0}.records'.format(prefix), object_id)
+            multi.zadd('{0}.records.timeline'.format(prefix),
+                       {object_id: record[modified_field]})
+            multi.execute()
+        return record
+
+
+def count_round_trips():
+    """Count the requests sent to the server, by patching the connections.
+    """
+    counter = itertools.count()
+    send = redis.Connection.send_packed_command
+
+    def counted(self, *args, **kwargs):
+        next(counter)
+        return send(self, *args, **kwargs)
+
+    redis.Connection.send_packed_command = counted
+    return counter
+
+
+def run(storage, threads, size):
+    storage.flush()
+
+    def writes():
+        for i in range(size):
+            record = storage.create('bench', 'parent', {'number': i})
+            storage.update('bench', 'parent', record['id'], {'number': -i})
+
+    workers = [threading.Thread(target=writes) for i in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (threads * size * 2) / (time.time() - start)
+
+
+def main(threads, size):
+    counter = count_round_trips()
+    options = dict(max_connections=threads, host='localhost', port=6379,
+                   db=5)
+    for name, factory in (('scripts', redis_backend.Redis),
+                          ('watch', OptimisticLockingRedis)):
+        storage = factory(**options)
+        before = next(counter)
+        retries = next(OptimisticLockingRedis.retries)
+        throughput = run(storage, threads, size)
+        round_trips = next(counter) - before - 2
+        retries = next(OptimisticLockingRedis.retries) - retries - 1
+        print('%-8s %8.0f writes/sec %6.2f round trips/write %6d retries' % (
+            name, throughput, round_trips / (threads * size * 2.0), retries))
+        storage.flush()
+
+
+if __name__ == '__main__':
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    main(threads, size)
@@ -0,0 +1,56 @@
+"""Benchmark of the memory used and the throughput of the Redis storage
+backend, with a key per record (``keys`` layout) and a hash per collection
+(``hash`` layout)::
+
+    python benchmarks/redis_layouts.py [number of records]
+
+A Redis server is expected on ``localhost:6379``, its database 5 is flushed.
+"""
+import sys
+import time
+
+from cliquet.storage import redis as redis_backend
+
+
+QUERIES = 20
+
+
+def used_memory(storage):
+    return storage._client.info('memory')['used_memory']
+
+
+def measure(storage, size):
+    storage.flush()
+    before = used_memory(storage)
+
+    start = time.time()
+    records = [storage.create('bench', 'parent', {'price': i})
+               for i in range(size)]
+    writes = size / (time.time() - start)
+
+    start = time.time()
+    for record in records[:1000]:
+        storage.get('bench', 'parent', record['id'])
+    reads = min(size, 1000) / (time.time() - start)
+
+    start = time.time()
+    for i in range(QUERIES):
+        storage.get_all('bench', 'parent', limit=10)
+    queries = QUERIES / (time.time() - start)
+
+    memory = (used_memory(storage) - before) / 1024.0 / 1024.0
+    storage.flush()
+    return memory, writes, reads, queries
+
+
+def main(size):
+    options = dict(max_connections=1, host='localhost', port=6379, db=5)
+    print('%-6s %10s %12s %12s %12s' % ('layout', 'memory', 'writes/s',
+                                        'reads/s', 'queries/s'))
+    for name, backend in sorted(redis_backend.LAYOUTS.items()):
+        result = measure(backend(**options), size)
+        print('%-6s %7.2f MB %12.0f %12.0f %12.2f' % ((name,) + result))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
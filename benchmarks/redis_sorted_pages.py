@@ -0,0 +1,42 @@
+"""Benchmark of paginated list queries sorted by a field with the Redis
+storage backend, with and without the sorted index of the field::
+
+    python benchmarks/redis_sorted_pages.py [number of records]
+
+A Redis server is expected on ``localhost:6379``, its database 5 is flushed.
+"""
+import random
+import sys
+import time
+
+from cliquet.storage import Sort
+from cliquet.storage import redis as redis_backend
+
+
+QUERIES = 20
+
+
+def query(storage):
+    sorting = [Sort('price', 1), Sort('last_modified', -1)]
+    start = time.time()
+    for i in range(QUERIES):
+        storage.get_all('bench', 'parent', sorting=sorting, limit=10)
+    return (time.time() - start) * 1000 / QUERIES
+
+
+def main(size):
+    options = dict(max_connections=1, host='localhost', port=6379, db=5)
+    indexed = redis_backend.Redis(**options)
+    indexed.flush()
+    indexed.set_indexed_fields('bench', ('price',))
+    for i in range(size):
+        indexed.create('bench', 'parent', {'price': random.randint(0, 1000)})
+
+    print('%-10s %10.2f ms/query' % ('index', query(indexed)))
+    print('%-10s %10.2f ms/query' % ('in memory',
+                                     query(redis_backend.Redis(**options))))
+    indexed.flush()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
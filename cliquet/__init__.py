@@ -27,7 +27,12 @@ DEFAULT_SETTINGS = {
     'cliquet.backoff': None,
     'cliquet.batch_max_requests': 25,
     'cliquet.cache_backend': 'cliquet.cache.redis',
+    'cliquet.cache_codec': 'json',
+    'cliquet.cache_compression_threshold': None,
     'cliquet.cache_pool_size': 10,
+    'cliquet.cache_pool_max_idle': None,
+    'cliquet.cache_pool_max_lifetime': None,
+    'cliquet.cache_pool_timeout': 30,
     'cliquet.cache_url': '',
     'cliquet.cors_origins': '*',
     'cliquet.eos': None,
@@ -56,6 +61,9 @@ DEFAULT_SETTINGS = {
     'cliquet.permission_backend': 'cliquet.permission.redis',
     'cliquet.permission_url': '',
     'cliquet.permission_pool_size': 10,
+    'cliquet.permission_pool_max_idle': None,
+    'cliquet.permission_pool_max_lifetime': None,
+    'cliquet.permission_pool_timeout': 30,
     'cliquet.profiler_dir': '/tmp',
     'cliquet.profiler_enabled': False,
     'cliquet.project_docs': '',
@@ -65,8 +73,23 @@ DEFAULT_SETTINGS = {
     'cliquet.statsd_prefix': 'cliquet',
     'cliquet.statsd_url': None,
     'cliquet.storage_backend': 'cliquet.storage.redis',
+    'cliquet.storage_codec': 'json',
+    'cliquet.storage_compression_threshold': None,
+    'cliquet.storage_columnar': False,
+    'cliquet.storage_fetch_chunk_size': 1000,
     'cliquet.storage_max_fetch_size': 10000,
+    'cliquet.storage_persistence_fsync': 'batch',
+    'cliquet.storage_persistence_fsync_interval': 1,
+    'cliquet.storage_persistence_path': '',
+    'cliquet.storage_persistence_snapshot_interval': 3600,
     'cliquet.storage_pool_size': 10,
+    'cliquet.storage_pool_max_idle': None,
+    'cliquet.storage_pool_max_lifetime': None,
+    'cliquet.storage_pool_timeout': 30,
+    'cliquet.storage_read_your_writes': True,
+    'cliquet.storage_redis_layout': 'keys',
+    'cliquet.storage_replica_urls': '',
+    'cliquet.storage_tombstones_retention': None,
     'cliquet.storage_url': '',
     'cliquet.userid_hmac_secret': '',
     'cliquet.version_prefix_redirect_enabled': True,
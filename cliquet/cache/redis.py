@@ -1,14 +1,13 @@
 from __future__ import absolute_import
 
-import redis
 from six.moves.urllib import parse as urlparse
 
 from cliquet.cache import CacheBase
-from cliquet.storage.redis import wrap_redis_error
-from cliquet.utils import json
+from cliquet.serializers import Serializer, load_from_settings
+from cliquet.storage.redis import RedisClient, wrap_redis_error
 
 
-class Redis(CacheBase):
+class Redis(RedisClient, CacheBase):
     """Cache backend implementation using Redis.
 
     Enable in configuration::
@@ -23,15 +22,18 @@ class Redis(CacheBase):
 
         cliquet.cache_pool_size = 50
 
+    *(Optional)* Values can be encoded with msgpack instead of JSON, and
+    compressed above a size threshold (in bytes)::
+
+        cliquet.cache_codec = msgpack
+        cliquet.cache_compression_threshold = 1024
+
     :noindex:
     """
 
     def __init__(self, *args, **kwargs):
+        self._serializer = kwargs.pop('serializer', None) or Serializer()
         super(Redis, self).__init__(*args, **kwargs)
-        maxconn = kwargs.pop('max_connections')
-        connection_pool = redis.BlockingConnectionPool(max_connections=maxconn)
-        self._client = redis.StrictRedis(connection_pool=connection_pool,
-                                         **kwargs)
 
     def initialize_schema(self):
         # Nothing to do.
@@ -51,7 +53,7 @@ class Redis(CacheBase):
 
     @wrap_redis_error
     def set(self, key, value, ttl=None):
-        value = json.dumps(value)
+        value = self._serializer.dumps(value)
         if ttl:
             self._client.psetex(key, int(ttl * 1000), value)
         else:
@@ -61,8 +63,7 @@ class Redis(CacheBase):
     def get(self, key):
         value = self._client.get(key)
         if value:
-            value = value.decode('utf-8')
-            return json.loads(value)
+            return self._serializer.loads(value)
 
     @wrap_redis_error
     def delete(self, key):
@@ -74,9 +75,11 @@ def load_from_config(config):
     uri = settings['cliquet.cache_url']
     uri = urlparse.urlparse(uri)
     pool_size = int(settings['cliquet.cache_pool_size'])
+    serializer = load_from_settings(settings, 'cliquet.cache')
 
     return Redis(max_connections=pool_size,
+                 serializer=serializer,
                  host=uri.hostname or 'localhost',
-                 port=uri.port or 6739,
+                 port=uri.port or 6379,
                  password=uri.password or None,
                  db=int(uri.path[1:]) if uri.path else 0)
@@ -49,7 +49,8 @@ class Collection(object):
             auth=self.auth)
 
     def get_records(self, filters=None, sorting=None, pagination_rules=None,
-                    limit=None, include_deleted=False, parent_id=None):
+                    limit=None, include_deleted=False, parent_id=None,
+                    count_total=True):
         """Fetch the collection records.
 
         Override to post-process records after feching them from storage.
@@ -80,11 +81,21 @@ class Collection(object):
 
         :param str parent_id: optional filter for parent id
 
+        :param bool count_total: Optionnally skip the count of records in
+            the result set, if the storage cannot obtain it cheaply. The
+            parameter is only passed to the storage backend if false.
+
         :returns: A tuple with the list of records in the current page,
-            the total number of records in the result set.
+            the total number of records in the result set (or ``None`` if
+            it was skipped).
         :rtype: tuple
         """
         parent_id = parent_id or self.parent_id
+        # Storage backends that always count may not accept the parameter.
+        options = {}
+        if not count_total:
+            options['count_total'] = False
+
         records, total_records = self.storage.get_all(
             collection_id=self.collection_id,
             parent_id=parent_id,
@@ -96,7 +107,8 @@ class Collection(object):
             id_field=self.id_field,
             modified_field=self.modified_field,
             deleted_field=self.deleted_field,
-            auth=self.auth)
+            auth=self.auth,
+            **options)
         return records, total_records
 
     def delete_records(self, filters=None, parent_id=None):
@@ -191,6 +191,13 @@ def setup_statsd(config):
         client.watch_execution_time(config.registry.cache, prefix='cache')
         client.watch_execution_time(config.registry.storage, prefix='storage')
 
+        # Report the usage of the backends connection pools.
+        for name in ('cache', 'permission', 'storage'):
+            backend = getattr(config.registry, name, None)
+            if hasattr(backend, 'statsd'):
+                backend.statsd = client
+                backend.statsd_prefix = name
+
         # Commit so that configured policy can be queried.
         config.commit()
         policy = config.registry.queryUtility(IAuthenticationPolicy)
@@ -2,11 +2,9 @@ from __future__ import absolute_import
 
 import os
 
-from six.moves.urllib import parse as urlparse
-
 from cliquet import logger
 from cliquet.permission import PermissionBase
-from cliquet.storage.postgresql import PostgreSQLClient
+from cliquet.storage.postgresql import PostgreSQLClient, get_client_kwargs
 
 
 class PostgreSQL(PostgreSQLClient, PermissionBase):
@@ -39,6 +37,15 @@ class PostgreSQL(PostgreSQLClient, PermissionBase):
 
         cliquet.permission_pool_size = 10
 
+    Connections are opened on demand. If they are all in use, requests wait
+    for one to be released, up to a timeout (in seconds), and fail with a
+    ``503`` error response. Connections can be closed when they were unused,
+    or opened, for too long (in seconds)::
+
+        cliquet.permission_pool_timeout = 30
+        cliquet.permission_pool_max_idle = 600
+        cliquet.permission_pool_max_lifetime = 3600
+
     .. note::
 
         Using a `dedicated connection pool <http://pgpool.net>`_ is still
@@ -194,17 +201,5 @@ class PostgreSQL(PostgreSQLClient, PermissionBase):
 
 def load_from_config(config):
     settings = config.get_settings()
-    uri = settings['cliquet.permission_url']
-    uri = urlparse.urlparse(uri)
-    pool_size = int(settings['cliquet.permission_pool_size'])
-
-    conn_kwargs = dict(pool_size=pool_size,
-                       host=uri.hostname,
-                       port=uri.port,
-                       user=uri.username,
-                       password=uri.password,
-                       database=uri.path[1:] if uri.path else '')
-    # Filter specified values only, to preserve PostgreSQL defaults
-    conn_kwargs = dict([(k, v) for k, v in conn_kwargs.items() if v])
-
-    return PostgreSQL(**conn_kwargs)
+    client_kwargs = get_client_kwargs(settings, 'permission')
+    return PostgreSQL(**client_kwargs)
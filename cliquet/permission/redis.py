@@ -1,13 +1,12 @@
 from __future__ import absolute_import
 
-import redis
 from six.moves.urllib import parse as urlparse
 
 from cliquet.permission import PermissionBase
-from cliquet.storage.redis import wrap_redis_error
+from cliquet.storage.redis import RedisClient, wrap_redis_error
 
 
-class Redis(PermissionBase):
+class Redis(RedisClient, PermissionBase):
     """Permission backend implementation using Redis.
 
     Enable in configuration::
@@ -25,13 +24,6 @@ class Redis(PermissionBase):
     :noindex:
     """
 
-    def __init__(self, *args, **kwargs):
-        super(Redis, self).__init__(*args, **kwargs)
-        maxconn = kwargs.pop('max_connections')
-        connection_pool = redis.BlockingConnectionPool(max_connections=maxconn)
-        self._client = redis.StrictRedis(connection_pool=connection_pool,
-                                         **kwargs)
-
     def initialize_schema(self):
         # Nothing to do.
         pass
@@ -98,6 +90,6 @@ def load_from_config(config):
 
     return Redis(max_connections=pool_size,
                  host=uri.hostname or 'localhost',
-                 port=uri.port or 6739,
+                 port=uri.port or 6379,
                  password=uri.password or None,
                  db=int(uri.path[1:]) if uri.path else 0)
@@ -16,8 +16,8 @@ from cliquet.errors import (http_error, raise_invalid, ERRORS,
 from cliquet.schema import ResourceSchema, PermissionsSchema
 from cliquet.storage import exceptions as storage_exceptions, Filter, Sort
 from cliquet.utils import (
-    COMPARISON, classname, native_value, decode64, encode64, json,
-    current_service
+    COMPARISON, native_value, decode64, encode64, json,
+    current_service, msec_time
 )
 
 
@@ -244,6 +244,19 @@ def register_resource(resource, settings=None, viewset=None, depth=1,
         for service in services:
             config.add_cornice_service(service)
 
+        # Let the storage backend index the fields used in lookups.
+        mapping = getattr(resource, 'mapping', None)
+        if mapping is not None:
+            indexed_fields = (tuple(mapping.get_option('indexed_fields')) +
+                              tuple(mapping.get_option('unique_fields')))
+            storage = config.registry.storage
+            collection_id = resource.get_collection_id()
+            if indexed_fields:
+                storage.set_indexed_fields(collection_id, indexed_fields)
+            unique_fields = tuple(mapping.get_option('unique_fields'))
+            if unique_fields:
+                storage.set_unique_fields(collection_id, unique_fields)
+
     info = venusian.attach(resource, callback, category='pyramid',
                            depth=depth)
     return callback
@@ -265,7 +278,7 @@ class BaseResource(object):
         self.collection = Collection(
             storage=request.registry.storage,
             id_generator=request.registry.id_generator,
-            collection_id=classname(self),
+            collection_id=self.get_collection_id(),
             parent_id=parent_id,
             auth=auth)
 
@@ -278,6 +291,18 @@ class BaseResource(object):
         logger.bind(collection_id=self.collection.collection_id,
                     collection_timestamp=self.timestamp)
 
+    @classmethod
+    def get_collection_id(cls):
+        """Return the id of the collection where the records of this
+        resource are stored (by default, the class name in lowercase).
+
+        The indexed and unique fields of the resource are declared to the
+        storage for this collection.
+
+        :rtype: str
+        """
+        return cls.__name__.lower()
+
     def is_known_field(self, field):
         """Return ``True`` if `field` is defined in the resource mapping.
 
@@ -317,27 +342,38 @@ class BaseResource(object):
         filters = self._extract_filters()
         sorting = self._extract_sorting()
         limit = self._extract_limit()
+        count_total = self._extract_count()
         filter_fields = [f.field for f in filters]
         include_deleted = self.collection.modified_field in filter_fields
 
         pagination_rules = self._extract_pagination_rules_from_token(
             limit, sorting)
 
+        # Collections that override ``get_records`` may not accept the
+        # parameter: it is only passed if the client skips the count.
+        options = {}
+        if not count_total:
+            options['count_total'] = False
+
         records, total_records = self.collection.get_records(
             filters=filters,
             sorting=sorting,
             limit=limit,
             pagination_rules=pagination_rules,
-            include_deleted=include_deleted)
+            include_deleted=include_deleted,
+            **options)
 
         next_page = None
-        if limit and len(records) == limit and total_records > limit:
+        # Without the total, a full page may be the last one.
+        is_full_page = limit and len(records) == limit
+        if is_full_page and (not count_total or total_records > limit):
             next_page = self._next_page_url(sorting, limit, records[-1])
             headers['Next-Page'] = next_page
 
         # Bind metric about response size.
         logger.bind(nb_records=len(records), limit=limit)
-        headers['Total-Records'] = ('%s' % total_records)
+        if count_total:
+            headers['Total-Records'] = ('%s' % total_records)
 
         body = {
             'data': records,
@@ -864,6 +900,15 @@ class BaseResource(object):
 
                 if param == '_since':
                     operator = COMPARISON.GT
+                    horizon = self._get_tombstones_horizon()
+                    if horizon is not None and value < horizon:
+                        error_details = {
+                            'name': param,
+                            'location': 'querystring',
+                            'description': ('_since is older than the '
+                                            'retention of deleted records')
+                        }
+                        raise_invalid(self.request, **error_details)
                 else:
                     operator = COMPARISON.LT
                 filters.append(
@@ -889,6 +934,27 @@ class BaseResource(object):
 
         return filters
 
+    def _get_tombstones_horizon(self):
+        """Return the timestamp before which deleted records may have been
+        purged from storage, or ``None`` if they are kept forever.
+        """
+        settings = self.request.registry.settings
+        retention = settings.get('cliquet.storage_tombstones_retention')
+        if not retention:
+            return None
+        return msec_time() - int(retention) * 1000
+
+    def _extract_count(self):
+        """Extract the ``_count`` value from QueryString parameters."""
+        count = native_value(self.request.GET.get('_count', True))
+        if not isinstance(count, bool):
+            error_details = {
+                'location': 'querystring',
+                'description': "_count should be a boolean"
+            }
+            raise_invalid(self.request, **error_details)
+        return count
+
     def _extract_sorting(self):
         """Extracts filters from QueryString parameters."""
         specified = self.request.GET.get('_sort', '').split(',')
@@ -27,6 +27,15 @@ class ResourceSchema(colander.MappingSchema):
         raised if unicity is about to be violated.
         """
 
+        indexed_fields = tuple()
+        """Fields that are frequently used to filter the records of the
+        collection. Storage backends may maintain indexes for them, in
+        order to speed up lookups.
+
+        With PostgreSQL, the indexes are created when ``cliquet migrate``
+        is run.
+        """
+
         readonly_fields = tuple()
         """Fields that cannot be updated. Values for fields will have to be
         provided either during record creation, through default values using
@@ -6,6 +6,8 @@ import warnings
 
 from pyramid.paster import bootstrap
 
+from cliquet.utils import msec_time
+
 
 def deprecated_init(env):
     message = '"cliquet init" is deprecated. Use "cliquet migrate" instead.'
@@ -24,6 +26,22 @@ def init_schema(env):
     permission_backend.initialize_schema()
 
 
+def purge_tombstones(env):
+    settings = env['registry'].settings
+    retention = settings.get('cliquet.storage_tombstones_retention')
+    if not retention:
+        logging.error('No retention of deleted records configured '
+                      '(cliquet.storage_tombstones_retention).')
+        return 1
+
+    before = msec_time() - int(retention) * 1000
+    storage_backend = env['registry'].storage
+    purged = storage_backend.purge_deleted(collection_id=None,
+                                           parent_id=None,
+                                           before=before)
+    logging.info('Purged %s deleted records.' % purged)
+
+
 def main():
     description = """\
     Cliquet administration commands.
@@ -42,11 +60,13 @@ def main():
     parser_deprecated_init.set_defaults(func=deprecated_init)
     parser_init_schema = subparsers.add_parser('migrate')
     parser_init_schema.set_defaults(func=init_schema)
+    parser_purge_tombstones = subparsers.add_parser('purge-tombstones')
+    parser_purge_tombstones.set_defaults(func=purge_tombstones)
 
     args = parser.parse_args(sys.argv[1:])
 
     env = bootstrap(args.ini_file)
-    args.func(env)
+    return args.func(env)
 
 
 if __name__ == '__main__':  # pragma: no cover
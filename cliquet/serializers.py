@@ -0,0 +1,106 @@
+"""Encoding of the values stored by the Redis storage and cache backends.
+
+Values are encoded as JSON text by default. They can be encoded with
+msgpack, and compressed with zlib above a size threshold. Encoded values
+start with a marker byte, which never starts a JSON text: values are
+decoded according to their marker, whatever the configured codec is, so
+that values stored with another codec (e.g. JSON before switching to
+msgpack) remain readable.
+"""
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+from cliquet.utils import json
+
+
+MSGPACK_MARKER = b'\x01'
+"""Marker of values encoded with msgpack."""
+
+COMPRESSED_MARKER = b'\x02'
+"""Marker of compressed values."""
+
+STAMPED_MARKER = b'\x03'
+"""Marker of records stamped by the Redis storage scripts.
+
+The marker is followed by the timestamp, a colon, the JSON encoded name of
+the timestamp field and a new line, before the encoded record.
+"""
+
+
+class JSONCodec(object):
+    """Encode values as JSON text."""
+
+    def dumps(self, value):
+        return json.dumps(value).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data.decode('utf-8'))
+
+
+class MsgpackCodec(object):
+    """Encode values with msgpack, a compact binary format."""
+
+    def __init__(self):
+        if msgpack is None:  # pragma: no cover
+            raise ImportError("The msgpack codec requires msgpack.")
+
+    def dumps(self, value):
+        return MSGPACK_MARKER + msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data[1:], raw=False)
+
+
+CODECS = {
+    'json': JSONCodec,
+    'msgpack': MsgpackCodec,
+}
+
+
+class Serializer(object):
+    """Encode values with the specified codec, and compress them if their
+    encoded size reaches `compression_threshold` bytes (never if ``None``).
+    """
+
+    def __init__(self, codec='json', compression_threshold=None):
+        if codec not in CODECS:
+            raise ValueError("Unknown codec %r" % codec)
+        self.codec = CODECS[codec]()
+        self.compression_threshold = compression_threshold
+
+    def dumps(self, value):
+        data = self.codec.dumps(value)
+        threshold = self.compression_threshold
+        if threshold is not None and len(data) >= threshold:
+            compressed = COMPRESSED_MARKER + zlib.compress(data)
+            if len(compressed) < len(data):
+                return compressed
+        return data
+
+    def loads(self, data):
+        marker = data[:1]
+        if marker == COMPRESSED_MARKER:
+            return self.loads(zlib.decompress(data[1:]))
+        if marker == MSGPACK_MARKER:
+            return MsgpackCodec().loads(data)
+        if marker == STAMPED_MARKER:
+            header, data = data[1:].split(b'\n', 1)
+            timestamp, field = header.split(b':', 1)
+            value = self.loads(data)
+            value[json.loads(field.decode('utf-8'))] = int(timestamp)
+            return value
+        return JSONCodec().loads(data)
+
+
+def load_from_settings(settings, prefix):
+    """Instantiate the serializer configured with the ``<prefix>_codec``
+    and ``<prefix>_compression_threshold`` settings.
+    """
+    codec = settings.get('%s_codec' % prefix) or 'json'
+    threshold = settings.get('%s_compression_threshold' % prefix)
+    threshold = int(threshold) if threshold not in (None, '') else None
+    return Serializer(codec=codec, compression_threshold=threshold)
@@ -32,6 +32,12 @@ class Client(object):
         else:
             return self._client.set(key, unique)
 
+    def gauge(self, key, value):
+        return self._client.gauge(key, value)
+
+    def timing(self, key, value):
+        return self._client.timing(key, value)
+
 
 def load_from_config(config):
     settings = config.get_settings()
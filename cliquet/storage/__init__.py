@@ -1,6 +1,9 @@
+import math
 import random
 from collections import namedtuple
 
+import six
+
 from . import generators
 
 
@@ -19,6 +22,21 @@ _HEARTBEAT_COLLECTION_ID = '__heartbeat__'
 _HEART_PARENT_ID = _HEARTBEAT_COLLECTION_ID
 _HEARTBEAT_RECORD = {'__heartbeat__': True}
 
+MAX_EXACT_INTEGER = 2 ** 53
+"""Integers beyond this limit cannot be stored in floats without losing
+precision."""
+
+
+def is_scalar(value):
+    """Return ``True`` if the value can be stored as a float (e.g. in
+    columns or scores), and compared exactly like its Python counterpart.
+    """
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, six.integer_types):
+        return -MAX_EXACT_INTEGER <= value <= MAX_EXACT_INTEGER
+    return isinstance(value, float) and not math.isnan(value)
+
 
 class StorageBase(object):
     """Storage abstraction used by resource views.
@@ -48,6 +66,30 @@ class StorageBase(object):
         """
         raise NotImplementedError
 
+    def set_indexed_fields(self, collection_id, fields):
+        """Declare the fields of the objects in this `collection_id` that are
+        frequently used in filters, so that the backend can maintain
+        indexes for them.
+
+        Backends are free to ignore this declaration.
+
+        :param str collection_id: the collection id.
+        :param tuple fields: the list of field names.
+        """
+        pass
+
+    def set_unique_fields(self, collection_id, fields):
+        """Declare the fields of the objects in this `collection_id` that
+        must remain unique, so that the backend can maintain indexes for
+        unicity checks.
+
+        Backends are free to ignore this declaration.
+
+        :param str collection_id: the collection id.
+        :param tuple fields: the list of field names.
+        """
+        pass
+
     def ping(self, request):
         """Test that storage is operationnal.
 
@@ -199,8 +241,33 @@ class StorageBase(object):
         """
         raise NotImplementedError
 
+    def purge_deleted(self, collection_id, parent_id, before=None,
+                      id_field=DEFAULT_ID_FIELD,
+                      modified_field=DEFAULT_MODIFIED_FIELD,
+                      auth=None):
+        """Delete the tombstones of the objects deleted in this
+        `collection_id` for this `parent_id`.
+
+        .. note::
+
+            This does not change the collection timestamp.
+
+        :param str collection_id: the collection id, or ``None`` for every
+            collection.
+        :param str parent_id: the collection parent, or ``None`` for every
+            parent.
+
+        :param int before: Optionnally only purge the tombstones whose
+            timestamp is strictly lower.
+
+        :returns: the number of purged tombstones.
+        :rtype: int
+        """
+        raise NotImplementedError
+
     def get_all(self, collection_id, parent_id, filters=None, sorting=None,
                 pagination_rules=None, limit=None, include_deleted=False,
+                count_total=True,
                 id_field=DEFAULT_ID_FIELD,
                 modified_field=DEFAULT_MODIFIED_FIELD,
                 deleted_field=DEFAULT_DELETED_FIELD,
@@ -234,8 +301,13 @@ class StorageBase(object):
         :param bool include_deleted: Optionnally include the deleted objects
             that match the filters.
 
+        :param bool count_total: Optionnally skip the count of matching
+            objects, if it cannot be obtained cheaply. It is only passed
+            (as ``False``) when clients skip the count.
+
         :returns: the limited list of objects, and the total number of
-            matching objects in the collection (deleted ones excluded).
+            matching objects in the collection (deleted ones excluded), or
+            ``None`` if backend skipped it.
         :rtype: tuple (list, integer)
         """
         raise NotImplementedError
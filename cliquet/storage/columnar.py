@@ -0,0 +1,243 @@
+"""Columnar representation of the records of the memory storage backend.
+
+Scalar fields are kept in NumPy arrays, so that filters are evaluated as
+vectorized boolean masks, and sorting is done with ``lexsort`` on the
+selected rows only.
+"""
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from cliquet.storage import is_scalar
+from cliquet.utils import COMPARISON
+
+
+INITIAL_CAPACITY = 64
+
+MISSING, SCALAR, MIXED = 0, 1, 2
+"""States of a value in a column."""
+
+ORDERING_OPERATORS = (COMPARISON.LT, COMPARISON.MAX,
+                      COMPARISON.MIN, COMPARISON.GT)
+
+
+def grow(array, capacity):
+    """Return a copy of the array, extended with zeros."""
+    result = numpy.zeros(capacity, dtype=array.dtype)
+    result[:len(array)] = array
+    return result
+
+
+class Column(object):
+    """Values of a field, indexed by row slot.
+
+    The number of missing and non-scalar values of the alive rows are
+    maintained, in order to know if the column can be used for a query.
+    """
+
+    def __init__(self, capacity):
+        self.values = numpy.zeros(capacity, dtype=numpy.float64)
+        self.states = numpy.zeros(capacity, dtype=numpy.int8)
+        self.missing = 0
+        self.mixed = 0
+
+    def resize(self, capacity):
+        self.values = grow(self.values, capacity)
+        self.states = grow(self.states, capacity)
+
+    def set(self, slot, record, field):
+        self.clear(slot)
+        if field not in record:
+            return
+        self.missing -= 1
+        if is_scalar(record[field]):
+            self.values[slot] = record[field]
+            self.states[slot] = SCALAR
+        else:
+            self.states[slot] = MIXED
+            self.mixed += 1
+
+    def clear(self, slot):
+        """Forget the value of the specified row, which is then considered
+        missing."""
+        state = self.states[slot]
+        if state == MISSING:
+            self.missing -= 1
+        elif state == MIXED:
+            self.mixed -= 1
+        self.states[slot] = MISSING
+        self.missing += 1
+
+    def remove(self, slot):
+        self.clear(slot)
+        self.missing -= 1
+
+
+class Columns(object):
+    """Rows of a collection, with a column per field.
+
+    Rows slots are reused after deletion. The insertion sequence of each
+    record is kept, in order to preserve the ordering of the row-wise path
+    (ie. the insertion order of the records in the store).
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self._capacity = INITIAL_CAPACITY
+        self._size = 0
+        self._ids = []
+        self._slots = {}
+        self._free = []
+        self._alive = numpy.zeros(self._capacity, dtype=bool)
+        self._seq = numpy.zeros(self._capacity, dtype=numpy.int64)
+        self._next_seq = 0
+
+    def _allocate(self):
+        if self._free:
+            return self._free.pop()
+
+        if self._size == self._capacity:
+            self._capacity *= 2
+            self._alive = grow(self._alive, self._capacity)
+            self._seq = grow(self._seq, self._capacity)
+            for column in self.columns.values():
+                column.resize(self._capacity)
+
+        slot = self._size
+        self._size += 1
+        self._ids.append(None)
+        return slot
+
+    def add_field(self, field, records):
+        """Add a column for `field`, filled with the values of the
+        `records` (by id) already stored."""
+        column = Column(self._capacity)
+        for object_id, slot in self._slots.items():
+            column.missing += 1
+            column.set(slot, records[object_id], field)
+        self.columns[field] = column
+
+    def add(self, object_id, record):
+        """Store the values of the record. If the record already exists,
+        its values are replaced and its insertion sequence is kept."""
+        slot = self._slots.get(object_id)
+        if slot is None:
+            slot = self._allocate()
+            self._slots[object_id] = slot
+            self._ids[slot] = object_id
+            self._alive[slot] = True
+            self._seq[slot] = self._next_seq
+            self._next_seq += 1
+            for column in self.columns.values():
+                column.missing += 1
+
+        for field, column in self.columns.items():
+            column.set(slot, record, field)
+
+    def remove(self, object_id):
+        slot = self._slots.pop(object_id)
+        for column in self.columns.values():
+            column.remove(slot)
+        self._alive[slot] = False
+        self._ids[slot] = None
+        self._free.append(slot)
+
+    def _mask(self, filters):
+        """Evaluate the filters as a boolean mask on rows slots.
+
+        :returns: the mask, or ``None`` if a filter cannot be vectorized.
+        """
+        mask = self._alive[:self._size].copy()
+        for f in filters:
+            column = self.columns.get(f.field)
+            if column is None or column.mixed or not is_scalar(f.value):
+                return None
+
+            values = column.values[:self._size]
+            present = column.states[:self._size] == SCALAR
+
+            if f.operator == COMPARISON.EQ:
+                mask &= present & (values == f.value)
+            elif f.operator == COMPARISON.NOT:
+                mask &= ~present | (values != f.value)
+            elif f.operator in ORDERING_OPERATORS and not column.missing:
+                if f.operator == COMPARISON.LT:
+                    mask &= values < f.value
+                elif f.operator == COMPARISON.MAX:
+                    mask &= values <= f.value
+                elif f.operator == COMPARISON.MIN:
+                    mask &= values >= f.value
+                else:
+                    mask &= values > f.value
+            else:
+                # Ordering comparisons with missing values are left to
+                # the row-wise path.
+                return None
+        return mask
+
+    def select(self, filters, sorting, pagination_rules, limit=None):
+        """Equivalent of
+        :meth:`cliquet.storage.memory.MemoryBasedStorage.extract_record_set`
+        on the columns.
+
+        :returns: the ids of the records of the current page and the total
+            number of matching records, or ``None`` if the query cannot be
+            vectorized.
+        :rtype: tuple
+        """
+        filtered = self._mask(filters)
+        if filtered is None:
+            return None
+        total_records = int(numpy.count_nonzero(filtered))
+
+        selected = filtered
+        rule_index = None
+        if pagination_rules:
+            unmatched = len(pagination_rules)
+            rule_index = numpy.full(self._size, unmatched, dtype=numpy.int64)
+            for i, rule in enumerate(pagination_rules):
+                mask = self._mask(rule)
+                if mask is None:
+                    return None
+                rule_index[filtered & mask & (rule_index == unmatched)] = i
+            paginated = rule_index < unmatched
+            if paginated.any():
+                selected = paginated
+            else:
+                # Like with filtering, an empty page falls back to the
+                # whole set.
+                rule_index = None
+
+        slots = numpy.flatnonzero(selected)
+
+        # Sort keys, from the most significant to the least one.
+        keys = []
+        for sort in sorting:
+            column = self.columns.get(sort.field)
+            if column is None or column.mixed:
+                return None
+            if not (column.states[slots] == SCALAR).all():
+                # Missing values depend on the first record.
+                return None
+            values = column.values[slots]
+            keys.append(-values if sort.direction < 0 else values)
+        if rule_index is not None:
+            keys.append(rule_index[slots])
+        keys.append(self._seq[slots])
+
+        if limit and limit < len(slots):
+            # Only rows whose first key is lower than the limit-th one
+            # can be part of the page.
+            primary = keys[0]
+            threshold = numpy.partition(primary, limit - 1)[limit - 1]
+            candidates = primary <= threshold
+            slots = slots[candidates]
+            keys = [key[candidates] for key in keys]
+
+        order = numpy.lexsort(keys[::-1])
+        if limit:
+            order = order[:limit]
+
+        ids = [self._ids[slot] for slot in slots[order]]
+        return ids, total_records
@@ -1,9 +1,19 @@
+import atexit
+import bisect
+import functools
+import heapq
 import operator
-from collections import defaultdict
+import threading
+from collections import defaultdict, namedtuple, OrderedDict
+
+import six
+from pyramid.settings import asbool
 
 from cliquet import utils
+from cliquet.storage import columnar as columnar_module
+from cliquet.storage.persistence import Persistence
 from cliquet.storage import (
-    StorageBase, exceptions, Filter,
+    StorageBase, exceptions, Filter, Sort,
     DEFAULT_ID_FIELD, DEFAULT_MODIFIED_FIELD, DEFAULT_DELETED_FIELD)
 from cliquet.utils import COMPARISON
 
@@ -12,6 +22,117 @@ def tree():
     return defaultdict(tree)
 
 
+def synchronized(method):
+    """Run the decorated method while holding the lock of the
+    ``(collection_id, parent_id)`` bucket.
+    """
+    @functools.wraps(method)
+    def wrapped(self, collection_id, parent_id, *args, **kwargs):
+        with self._bucket_lock(collection_id, parent_id):
+            return method(self, collection_id, parent_id, *args, **kwargs)
+    return wrapped
+
+
+TimelinePlan = namedtuple('TimelinePlan', ['lower', 'upper',
+                                           'page_lower', 'page_upper',
+                                           'reverse'])
+"""Inclusive timestamps bounds of a query that can be answered from
+the records timelines only."""
+
+
+class Timeline(object):
+    """Records ids, kept ordered by timestamp.
+
+    Since timestamps are bumped on each write, new entries are
+    most of the time appended at the end.
+    """
+    def __init__(self):
+        self._timestamps = []
+        self._ids = []
+        self._by_id = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, object_id, timestamp):
+        self.discard(object_id)
+        if not self._timestamps or timestamp >= self._timestamps[-1]:
+            self._timestamps.append(timestamp)
+            self._ids.append(object_id)
+        else:
+            i = bisect.bisect_right(self._timestamps, timestamp)
+            self._timestamps.insert(i, timestamp)
+            self._ids.insert(i, object_id)
+        self._by_id[object_id] = timestamp
+
+    def discard(self, object_id):
+        timestamp = self._by_id.pop(object_id, None)
+        if timestamp is None:
+            return
+        i = bisect.bisect_left(self._timestamps, timestamp)
+        while self._ids[i] != object_id:
+            i += 1
+        del self._timestamps[i]
+        del self._ids[i]
+
+    def remove_before(self, timestamp=None):
+        """Remove the entries whose timestamp is strictly lower than
+        `timestamp` (all if ``None``).
+
+        :returns: the ids of the removed entries.
+        """
+        stop = len(self._ids)
+        if timestamp is not None:
+            stop = bisect.bisect_left(self._timestamps, timestamp)
+        removed = self._ids[:stop]
+        del self._timestamps[:stop]
+        del self._ids[:stop]
+        for object_id in removed:
+            del self._by_id[object_id]
+        return removed
+
+    def _positions(self, lower, upper):
+        start = 0
+        if lower is not None:
+            start = bisect.bisect_left(self._timestamps, lower)
+        stop = len(self._timestamps)
+        if upper is not None:
+            stop = bisect.bisect_right(self._timestamps, upper)
+        return start, max(start, stop)
+
+    def count(self, lower=None, upper=None):
+        """Number of entries whose timestamp is within the inclusive bounds.
+        """
+        start, stop = self._positions(lower, upper)
+        return stop - start
+
+    def slice(self, lower=None, upper=None, reverse=False, limit=None):
+        """Entries whose timestamp is within the inclusive bounds.
+
+        :returns: the list of ``(timestamp, object_id)`` tuples, ordered
+            by timestamp.
+        """
+        start, stop = self._positions(lower, upper)
+        if limit:
+            if reverse:
+                start = max(start, stop - limit)
+            else:
+                stop = min(stop, start + limit)
+        entries = list(zip(self._timestamps[start:stop],
+                           self._ids[start:stop]))
+        if reverse:
+            entries.reverse()
+        return entries
+
+    def ordered(self, object_ids):
+        """Order the specified ids by timestamp (and by id if timestamps are
+        equal). Ids missing from the timeline are skipped.
+        """
+        by_id = self._by_id
+        present = [_id for _id in object_ids if _id in by_id]
+        return sorted(present, key=lambda _id: (by_id[_id], _id))
+
+
 class MemoryBasedStorage(StorageBase):
     """Abstract storage class, providing basic operations and
     methods for in-memory implementations of sorting and filtering.
@@ -77,35 +198,114 @@ class MemoryBasedStorage(StorageBase):
                                           id_field=id_field,
                                           for_creation=for_creation)
         for filters in unicity_rules:
-            existing, count = self.get_all(collection_id, parent_id,
-                                           filters=filters,
-                                           id_field=id_field)
-            if count > 0:
+            existing = self.find_unique_record(collection_id, parent_id,
+                                               filters, id_field)
+            if existing is not None:
                 field = filters[0].field
-                raise exceptions.UnicityError(field, existing[0])
+                raise exceptions.UnicityError(field, existing)
 
-    def apply_filters(self, records, filters):
-        """Filter the specified records, using basic iteration.
+    def find_unique_record(self, collection_id, parent_id, filters,
+                           id_field):
+        """Find a record that violates a unicity rule.
+
+        Backends can override this method to look the value up in an
+        index, instead of filtering the whole collection.
+
+        :param list filters: an equality filter on the unique field, and
+            optionally a filter excluding the record being updated.
+        :returns: the conflicting record, or ``None``.
         """
-        operators = {
-            COMPARISON.LT: operator.lt,
-            COMPARISON.MAX: operator.le,
-            COMPARISON.EQ: operator.eq,
-            COMPARISON.NOT: operator.ne,
-            COMPARISON.MIN: operator.ge,
-            COMPARISON.GT: operator.gt,
-        }
+        existing, count = self.get_all(collection_id, parent_id,
+                                       filters=filters,
+                                       id_field=id_field)
+        if count > 0:
+            return existing[0]
 
+    def apply_filters(self, records, filters):
+        """Filter the specified records, using a compiled predicate.
+        """
+        matches = compile_filters(filters)
         for record in records:
-            matches = [operators[f.operator](record.get(f.field), f.value)
-                       for f in filters]
-            if all(matches):
+            if matches(record):
                 yield record
 
-    def apply_sorting(self, records, sorting):
-        """Sort the specified records, using cumulative python sorting.
+    def get_timeline_plan(self, filters, sorting, pagination_rules,
+                          modified_field):
+        """Check if the query can be answered from the records timelines
+        only, ie. if filters and pagination rules are only ranges on the
+        `modified_field`, and if records are sorted by `modified_field`.
+
+        :returns: the timestamps bounds, or ``None`` if the query requires
+            records to be inspected.
+        :rtype: :class:`TimelinePlan`
         """
-        return apply_sorting(records, sorting)
+        lower, upper, remaining = get_timestamp_bounds(filters or [],
+                                                       modified_field)
+        if remaining:
+            return None
+
+        sorting = sorting or [Sort(modified_field, 1)]
+        if len(sorting) > 1 or sorting[0].field != modified_field:
+            return None
+        reverse = sorting[0].direction < 0
+
+        page_lower, page_upper = lower, upper
+        if pagination_rules:
+            if len(pagination_rules) > 1:
+                return None
+            page_filters = list(filters or []) + pagination_rules[0]
+            page_lower, page_upper, remaining = get_timestamp_bounds(
+                page_filters, modified_field)
+            if remaining:
+                return None
+
+        return TimelinePlan(lower, upper, page_lower, page_upper, reverse)
+
+    def extract_timeline_set(self, plan, records_timeline,
+                             deleted_timeline=None, limit=None):
+        """Equivalent of :meth:`extract_record_set` using the timelines
+        of records and tombstones, in ``O(log n + limit)``.
+
+        :returns: the list of ``(timestamp, object_id, deleted)`` tuples
+            of the current page, and the total number of matching records.
+        :rtype: tuple
+        """
+        total_records = records_timeline.count(plan.lower, plan.upper)
+        if deleted_timeline is not None:
+            total_records += deleted_timeline.count(plan.lower, plan.upper)
+
+        page_lower, page_upper = plan.page_lower, plan.page_upper
+        if (page_lower, page_upper) != (plan.lower, plan.upper):
+            paginated = records_timeline.count(page_lower, page_upper)
+            if deleted_timeline is not None:
+                paginated += deleted_timeline.count(page_lower, page_upper)
+            # Like with filtering, an empty page falls back to the whole set.
+            if paginated == 0:
+                page_lower, page_upper = plan.lower, plan.upper
+
+        page = records_timeline.slice(page_lower, page_upper,
+                                      reverse=plan.reverse, limit=limit)
+        entries = [(ts, _id, False) for (ts, _id) in page]
+
+        if deleted_timeline is not None:
+            filtered_deleted = deleted_timeline.count(page_lower, page_upper)
+            total_records -= filtered_deleted
+
+            page = deleted_timeline.slice(page_lower, page_upper,
+                                          reverse=plan.reverse, limit=limit)
+            entries += [(ts, _id, True) for (ts, _id) in page]
+            entries.sort(reverse=plan.reverse)
+
+        if limit:
+            entries = entries[:limit]
+
+        return entries, total_records
+
+    def apply_sorting(self, records, sorting, limit=None):
+        """Sort the specified records, using a composite sort key. If `limit`
+        is specified, only the first records are selected.
+        """
+        return apply_sorting(records, sorting, limit)
 
     def extract_record_set(self, collection_id, records,
                            filters, sorting, id_field, deleted_field,
@@ -113,29 +313,37 @@ class MemoryBasedStorage(StorageBase):
         """Take the list of records and handle filtering, sorting and
         pagination.
 
-        """
-        filtered = list(self.apply_filters(records, filters or []))
-        total_records = len(filtered)
+        Filtering, pagination rules and counts are obtained in a single
+        iteration. Sorting is partial if a limit is specified.
 
-        paginated = {}
-        for rule in pagination_rules or []:
-            values = list(self.apply_filters(filtered, rule))
-            paginated.update(dict(((x[id_field], x) for x in values)))
-
-        if paginated:
-            paginated = paginated.values()
-        else:
-            paginated = filtered
+        `records` can be any iterable of distinct records: they are
+        filtered as they are read, and only the first records of the page
+        (and of the filtered records, if none matches the pagination rules)
+        are kept in memory.
+        """
+        filtered = Selection(sorting or [], limit)
+        filtered_deleted = 0
+        paginated = Selection(sorting or [], limit)
+        paginated_deleted = 0
+        total_records = 0
+        total_paginated = 0
+        rules = [compile_filters(rule) for rule in pagination_rules or []]
 
-        sorted_ = self.apply_sorting(paginated, sorting or [])
+        for record in self.apply_filters(records, filters or []):
+            is_deleted = record.get(deleted_field) is True
+            filtered.add(record)
+            total_records += 1
+            filtered_deleted += is_deleted
 
-        filtered_deleted = len([r for r in sorted_
-                                if r.get(deleted_field) is True])
+            if any(matches(record) for matches in rules):
+                paginated.add(record)
+                total_paginated += 1
+                paginated_deleted += is_deleted
 
-        if limit:
-            sorted_ = list(sorted_)[:limit]
+        if not total_paginated:
+            return filtered.records(), total_records - filtered_deleted
 
-        return sorted_, total_records - filtered_deleted
+        return paginated.records(), total_records - paginated_deleted
 
 
 class Memory(MemoryBasedStorage):
@@ -147,22 +355,302 @@ class Memory(MemoryBasedStorage):
     Enable in configuration::
 
         cliquet.storage_backend = cliquet.storage.memory
+
+    Fields declared as indexed (see
+    :meth:`cliquet.storage.StorageBase.set_indexed_fields`) or unique (see
+    :meth:`cliquet.storage.StorageBase.set_unique_fields`) are maintained
+    in hash indexes, used to answer equality filters and unicity checks
+    without scanning the whole collection.
+
+    Records and tombstones are also kept ordered by timestamp, in order to
+    answer synchronization queries (e.g. ``_since``) without sorting the
+    whole collection.
+
+    With the *columnar* mode (requires NumPy), timestamps and indexed
+    fields are also kept in arrays, and filters, sorting and pagination of
+    records are vectorized when all the involved values are numbers::
+
+        cliquet.storage_columnar = true
+
+    Queries on other fields, or including tombstones, use the default path.
+
+    Operations on the records of a same ``(collection_id, parent_id)`` are
+    serialized with a lock, which makes the backend safe to use with
+    threaded servers.
+
+    Records can be kept across restarts, by logging every operation and
+    writing snapshots periodically in a folder::
+
+        cliquet.storage_persistence_path = /var/lib/cliquet/
+
+        # Flush the log on disk after each operation (always), every
+        # interval (batch), or let the operating system do it (never).
+        # cliquet.storage_persistence_fsync = batch
+        # cliquet.storage_persistence_fsync_interval = 1
+        # cliquet.storage_persistence_snapshot_interval = 3600
+
+    The pending operations are flushed when the process exits (see
+    :meth:`close`).
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, columnar=False, persistence=None, *args, **kwargs):
         super(Memory, self).__init__(*args, **kwargs)
-        self.flush()
+        if columnar and columnar_module.numpy is None:  # pragma: no cover
+            raise ImportError("The columnar mode requires NumPy.")
+        self._columnar = columnar
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._locks = {}
+        self._indexed_fields = defaultdict(set)
+        self._persistence = None
+        self._reset()
+
+        if persistence is not None:
+            self._recover(persistence)
+            # Start from a snapshot of the recovered records.
+            persistence.snapshot(self._dump)
+            persistence.start(self._dump)
+            self._persistence = persistence
+            atexit.register(self.close)
+
+    def close(self):
+        """Stop the background persistence tasks, and flush the pending
+        operations on disk."""
+        if self._persistence is not None:
+            self._persistence.close()
 
     def flush(self, auth=None):
-        self._store = tree()
-        self._cemetery = tree()
-        self._timestamps = defaultdict(dict)
+        self._reset()
+        if self._persistence is not None:
+            self._persistence.reset()
+
+    def _reset(self):
+        """Clear the data of every bucket while holding their locks, so
+        that operations in progress see either the previous or the flushed
+        data. The lock objects are kept, since other threads may be holding
+        or waiting for them.
+        """
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    locks = list(self._locks.values())
+                for lock in locks:
+                    lock.acquire()
+                try:
+                    with self._lock:
+                        # Retry if buckets were created meanwhile.
+                        if len(self._locks) == len(locks):
+                            self._clear()
+                            return
+                finally:
+                    for lock in reversed(locks):
+                        lock.release()
+
+    def _clear(self):
+        with self._lock:
+            self._modified_fields = {}
+            self._store = tree()
+            self._cemetery = tree()
+            self._indexes = tree()
+            self._timelines = defaultdict(lambda: defaultdict(Timeline))
+            self._cemetery_timelines = defaultdict(
+                lambda: defaultdict(Timeline))
+            self._timestamps = defaultdict(dict)
+            self._columns = defaultdict(dict)
+            for collection_id, parent_id in self._locks.keys():
+                self._create_bucket(collection_id, parent_id)
+
+    def _create_bucket(self, collection_id, parent_id):
+        # Since nested dicts entries are not created atomically, those of
+        # the bucket are created once, while holding the global lock.
+        self._store[collection_id][parent_id]
+        self._cemetery[collection_id][parent_id]
+        self._indexes[collection_id][parent_id]
+        self._timelines[collection_id][parent_id]
+        self._cemetery_timelines[collection_id][parent_id]
+        self._timestamps[collection_id]
+        self._columns[collection_id]
+
+    def _bucket_lock(self, collection_id, parent_id):
+        """Return the lock of the ``(collection_id, parent_id)`` bucket.
+        """
+        key = (collection_id, parent_id)
+        lock = self._locks.get(key)
+        if lock is not None:
+            return lock
+
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                self._create_bucket(collection_id, parent_id)
+                lock = self._locks[key] = threading.RLock()
+            return lock
+
+    def set_indexed_fields(self, collection_id, fields):
+        with self._lock:
+            new_fields = set(fields) - self._indexed_fields[collection_id]
+            self._indexed_fields[collection_id].update(new_fields)
+            parent_ids = list(self._store[collection_id].keys())
+
+        # Index the records that were stored before the declaration.
+        for parent_id in parent_ids:
+            with self._bucket_lock(collection_id, parent_id):
+                records = self._store[collection_id][parent_id]
+                for object_id, record in records.items():
+                    self._update_indexes(collection_id, parent_id,
+                                         object_id, new=record,
+                                         fields=new_fields)
+                columns = self._columns[collection_id].get(parent_id)
+                if columns is not None:
+                    for field in new_fields:
+                        columns.add_field(field, records)
+
+    def set_unique_fields(self, collection_id, fields):
+        # Values of unique fields are looked up in the hash indexes.
+        self.set_indexed_fields(collection_id, fields)
+
+    def find_unique_record(self, collection_id, parent_id, filters,
+                           id_field):
+        rule = filters[0]
+        indexed_fields = self._indexed_fields.get(collection_id, set())
+        if not is_indexable(rule.value) or (rule.field != id_field and
+                                            rule.field not in indexed_fields):
+            return super(Memory, self).find_unique_record(
+                collection_id, parent_id, filters, id_field)
 
+        collection = self._store[collection_id][parent_id]
+        candidates = self._lookup_indexes(collection_id, parent_id,
+                                          filters, id_field)
+        for _id in candidates:
+            if _id in collection:
+                return collection[_id]
+
+    @synchronized
+    def delete_all(self, collection_id, parent_id, *args, **kwargs):
+        return super(Memory, self).delete_all(collection_id, parent_id,
+                                              *args, **kwargs)
+
+    def purge_deleted(self, collection_id, parent_id, before=None,
+                      id_field=DEFAULT_ID_FIELD,
+                      modified_field=DEFAULT_MODIFIED_FIELD,
+                      auth=None):
+        with self._lock:
+            buckets = [(c, p) for (c, p) in self._locks.keys()
+                       if collection_id in (None, c) and
+                       parent_id in (None, p)]
+
+        purged = 0
+        for bucket_collection_id, bucket_parent_id in buckets:
+            with self._bucket_lock(bucket_collection_id, bucket_parent_id):
+                count = self._purge(bucket_collection_id, bucket_parent_id,
+                                    before)
+                if count > 0:
+                    self._persist('purge', bucket_collection_id,
+                                  bucket_parent_id, None, before,
+                                  modified_field)
+                purged += count
+        return purged
+
+    def _purge(self, collection_id, parent_id, before):
+        """Remove the tombstones older than `before` from the cemetery
+        and its timeline."""
+        cemetery = self._cemetery[collection_id][parent_id]
+        timeline = self._cemetery_timelines[collection_id][parent_id]
+        removed = timeline.remove_before(before)
+        for object_id in removed:
+            del cemetery[object_id]
+        return len(removed)
+
+    def _update_columns(self, collection_id, parent_id, object_id,
+                        record=None, modified_field=DEFAULT_MODIFIED_FIELD):
+        """Store the values of the record in the columns, or remove them
+        if `record` is ``None``.
+        """
+        if not self._columnar:
+            return
+
+        columns = self._columns[collection_id].get(parent_id)
+        if columns is None:
+            columns = columnar_module.Columns()
+            self._columns[collection_id][parent_id] = columns
+
+        if record is None:
+            columns.remove(object_id)
+            return
+
+        fields = self._indexed_fields[collection_id] | set([modified_field])
+        for field in fields - set(columns.columns.keys()):
+            columns.add_field(field, self._store[collection_id][parent_id])
+        columns.add(object_id, record)
+
+    def _update_indexes(self, collection_id, parent_id, object_id,
+                        old=None, new=None, fields=None):
+        """Remove the `old` values of the record from the indexes, and
+        add the `new` ones.
+        """
+        if fields is None:
+            fields = self._indexed_fields.get(collection_id)
+        if not fields:
+            return
+
+        indexes = self._indexes[collection_id][parent_id]
+        for field in fields:
+            index = indexes.setdefault(field, defaultdict(set))
+
+            if old is not None:
+                value = old.get(field)
+                if is_indexable(value) and value in index:
+                    index[value].discard(object_id)
+                    if not index[value]:
+                        del index[value]
+
+            if new is not None:
+                value = new.get(field)
+                if is_indexable(value):
+                    index[value].add(object_id)
+
+    def _lookup_indexes(self, collection_id, parent_id, filters, id_field):
+        """Use the indexes to reduce the set of records ids that can match
+        the specified filters.
+
+        :returns: the set of candidate ids (unordered), or ``None`` if no
+            index could be used.
+        """
+        indexed_fields = self._indexed_fields.get(collection_id, set())
+        indexes = self._indexes[collection_id][parent_id]
+
+        candidates = None
+        excluded = set()
+        for f in filters or []:
+            if not is_indexable(f.value):
+                continue
+
+            if f.field == id_field:
+                ids = set([f.value])
+            elif f.field in indexed_fields:
+                ids = indexes.get(f.field, {}).get(f.value, set())
+            else:
+                continue
+
+            if f.operator == COMPARISON.EQ:
+                candidates = ids if candidates is None else candidates & ids
+            elif f.operator == COMPARISON.NOT:
+                excluded |= ids
+
+        if candidates is None and not excluded:
+            return None
+
+        if candidates is None:
+            candidates = self._store[collection_id][parent_id].keys()
+        return set(candidates) - excluded
+
+    @synchronized
     def collection_timestamp(self, collection_id, parent_id, auth=None):
         ts = self._timestamps[collection_id].get(parent_id)
         if ts is not None:
             return ts
         return self._bump_timestamp(collection_id, parent_id)
 
+    @synchronized
     def _bump_timestamp(self, collection_id, parent_id):
         """Timestamp are base on current millisecond.
 
@@ -179,6 +667,7 @@ class Memory(MemoryBasedStorage):
         self._timestamps[collection_id][parent_id] = current
         return current
 
+    @synchronized
     def create(self, collection_id, parent_id, record, id_generator=None,
                unique_fields=None, id_field=DEFAULT_ID_FIELD,
                modified_field=DEFAULT_MODIFIED_FIELD, auth=None):
@@ -192,9 +681,12 @@ class Memory(MemoryBasedStorage):
         _id = record.setdefault(id_field, id_generator())
         self.set_record_timestamp(collection_id, parent_id, record,
                                   modified_field=modified_field)
-        self._store[collection_id][parent_id][_id] = record
+        self._put(collection_id, parent_id, _id, record, modified_field)
+        self._persist('put', collection_id, parent_id, _id, record,
+                      modified_field)
         return record
 
+    @synchronized
     def get(self, collection_id, parent_id, object_id,
             id_field=DEFAULT_ID_FIELD,
             modified_field=DEFAULT_MODIFIED_FIELD,
@@ -204,6 +696,7 @@ class Memory(MemoryBasedStorage):
             raise exceptions.RecordNotFoundError(object_id)
         return collection[object_id]
 
+    @synchronized
     def update(self, collection_id, parent_id, object_id, record,
                unique_fields=None, id_field=DEFAULT_ID_FIELD,
                modified_field=DEFAULT_MODIFIED_FIELD,
@@ -217,9 +710,13 @@ class Memory(MemoryBasedStorage):
 
         self.set_record_timestamp(collection_id, parent_id, record,
                                   modified_field=modified_field)
-        self._store[collection_id][parent_id][object_id] = record
+        self._put(collection_id, parent_id, object_id, record,
+                  modified_field)
+        self._persist('put', collection_id, parent_id, object_id, record,
+                      modified_field)
         return record
 
+    @synchronized
     def delete(self, collection_id, parent_id, object_id,
                id_field=DEFAULT_ID_FIELD,
                modified_field=DEFAULT_MODIFIED_FIELD,
@@ -232,23 +729,162 @@ class Memory(MemoryBasedStorage):
                                              parent_id,
                                              existing)
 
-        # Add to deleted items, remove from store.
-        self._cemetery[collection_id][parent_id][object_id] = existing.copy()
-        self._store[collection_id][parent_id].pop(object_id)
-
+        self._remove(collection_id, parent_id, object_id, existing,
+                     modified_field)
+        self._persist('delete', collection_id, parent_id, object_id,
+                      existing, modified_field)
         return existing
 
+    def _put(self, collection_id, parent_id, object_id, record,
+             modified_field):
+        """Store the record, and maintain indexes and timelines."""
+        self._modified_fields[(collection_id, parent_id)] = modified_field
+        existing = self._store[collection_id][parent_id].get(object_id)
+        self._store[collection_id][parent_id][object_id] = record
+        self._update_indexes(collection_id, parent_id, object_id,
+                             old=existing, new=record)
+        self._update_columns(collection_id, parent_id, object_id, record,
+                             modified_field)
+        timeline = self._timelines[collection_id][parent_id]
+        timeline.add(object_id, record[modified_field])
+
+    def _remove(self, collection_id, parent_id, object_id, tombstone,
+                modified_field):
+        """Replace the record by its tombstone, and maintain indexes and
+        timelines."""
+        self._cemetery[collection_id][parent_id][object_id] = tombstone.copy()
+        removed = self._store[collection_id][parent_id].pop(object_id, None)
+        if removed is not None:
+            self._update_indexes(collection_id, parent_id, object_id,
+                                 old=removed)
+            self._update_columns(collection_id, parent_id, object_id)
+        self._timelines[collection_id][parent_id].discard(object_id)
+        timeline = self._cemetery_timelines[collection_id][parent_id]
+        timeline.add(object_id, tombstone[modified_field])
+
+    def _persist(self, *operation):
+        if self._persistence is not None:
+            self._persistence.append(operation)
+
+    def _dump(self):
+        """Return the state of the storage, as written in snapshots."""
+        buckets = []
+        with self._lock:
+            keys = list(self._locks.keys())
+        for collection_id, parent_id in keys:
+            with self._bucket_lock(collection_id, parent_id):
+                buckets.append({
+                    'collection_id': collection_id,
+                    'parent_id': parent_id,
+                    'modified_field': self._modified_fields.get(
+                        (collection_id, parent_id), DEFAULT_MODIFIED_FIELD),
+                    'timestamp': self._timestamps[collection_id].get(
+                        parent_id),
+                    'records': dict(self._store[collection_id][parent_id]),
+                    'tombstones': dict(
+                        self._cemetery[collection_id][parent_id]),
+                })
+        return {'buckets': buckets}
+
+    def _recover(self, persistence):
+        """Load the latest snapshot, and replay the operations that were
+        logged after it."""
+        snapshot, operations = persistence.load()
+
+        for bucket in (snapshot or {}).get('buckets', []):
+            collection_id = bucket['collection_id']
+            parent_id = bucket['parent_id']
+            modified_field = bucket['modified_field']
+            with self._bucket_lock(collection_id, parent_id):
+                for object_id, record in bucket['records'].items():
+                    self._put(collection_id, parent_id, object_id, record,
+                              modified_field)
+                for object_id, record in bucket['tombstones'].items():
+                    timeline = self._cemetery_timelines[collection_id]
+                    self._cemetery[collection_id][parent_id][object_id] = (
+                        record)
+                    timeline[parent_id].add(object_id, record[modified_field])
+                self._restore_timestamp(collection_id, parent_id,
+                                        bucket['timestamp'])
+
+        for action, collection_id, parent_id, object_id, record, \
+                modified_field in operations:
+            with self._bucket_lock(collection_id, parent_id):
+                if action == 'purge':
+                    # The timestamp limit is logged instead of a record.
+                    self._purge(collection_id, parent_id, before=record)
+                    continue
+                if action == 'put':
+                    self._put(collection_id, parent_id, object_id, record,
+                              modified_field)
+                else:
+                    self._remove(collection_id, parent_id, object_id,
+                                 record, modified_field)
+                self._restore_timestamp(collection_id, parent_id,
+                                        record[modified_field])
+
+    def _restore_timestamp(self, collection_id, parent_id, timestamp):
+        current = self._timestamps[collection_id].get(parent_id)
+        if timestamp is not None and (current is None or timestamp > current):
+            self._timestamps[collection_id][parent_id] = timestamp
+
+    @synchronized
     def get_all(self, collection_id, parent_id, filters=None, sorting=None,
                 pagination_rules=None, limit=None, include_deleted=False,
+                count_total=True,
                 id_field=DEFAULT_ID_FIELD,
                 modified_field=DEFAULT_MODIFIED_FIELD,
                 deleted_field=DEFAULT_DELETED_FIELD,
                 auth=None):
-        records = list(self._store[collection_id][parent_id].values())
+        collection = self._store[collection_id][parent_id]
+        cemetery = self._cemetery[collection_id][parent_id]
+        timeline = self._timelines[collection_id][parent_id]
+        deleted_timeline = None
+        if include_deleted:
+            deleted_timeline = self._cemetery_timelines[collection_id][
+                parent_id]
+
+        plan = self.get_timeline_plan(filters, sorting, pagination_rules,
+                                      modified_field)
+        if plan is not None:
+            entries, count = self.extract_timeline_set(plan, timeline,
+                                                       deleted_timeline,
+                                                       limit)
+            records = [cemetery[_id] if is_deleted else collection[_id]
+                       for (_, _id, is_deleted) in entries]
+            return records, count
+
+        columns = self._columns[collection_id].get(parent_id)
+        if columns is not None and not include_deleted:
+            selected = columns.select(filters or [], sorting or [],
+                                      pagination_rules or [], limit)
+            if selected is not None:
+                ids, count = selected
+                return [collection[_id] for _id in ids], count
+
+        # Reduce the set of records using indexes.
+        candidates = self._lookup_indexes(collection_id, parent_id,
+                                          filters, id_field)
+        lower, upper, _ = get_timestamp_bounds(filters or [], modified_field)
+        bounded = lower is not None or upper is not None
+        if bounded:
+            # Records in range are read in the order of the timeline.
+            records = [collection[_id] for (_, _id)
+                       in timeline.slice(lower, upper)
+                       if candidates is None or _id in candidates]
+        elif candidates is None:
+            records = list(collection.values())
+        else:
+            # Candidates are a set: they are read in a deterministic order.
+            records = [collection[_id] for _id in timeline.ordered(candidates)]
 
         deleted = []
         if include_deleted:
-            deleted = list(self._cemetery[collection_id][parent_id].values())
+            if bounded:
+                deleted = [cemetery[_id] for (_, _id)
+                           in deleted_timeline.slice(lower, upper)]
+            else:
+                deleted = list(cemetery.values())
 
         records, count = self.extract_record_set(collection_id,
                                                  records + deleted,
@@ -286,27 +922,267 @@ def get_unicity_rules(collection_id, parent_id, record, unique_fields,
     return rules
 
 
-def apply_sorting(records, sorting):
-    """Sort the specified records, using cumulative python sorting.
+def get_timestamp_bounds(filters, modified_field):
+    """Convert the filters on `modified_field` into inclusive bounds.
+
+    :returns: a tuple with the lower and upper bounds (``None`` if unbounded)
+        and the list of filters that could not be converted.
+    :rtype: tuple
+    """
+    lower = upper = None
+    remaining = []
+    for f in filters:
+        is_timestamp = (isinstance(f.value, six.integer_types) and
+                        not isinstance(f.value, bool))
+        if f.field != modified_field or not is_timestamp:
+            remaining.append(f)
+        elif f.operator in (COMPARISON.GT, COMPARISON.MIN):
+            value = f.value + 1 if f.operator == COMPARISON.GT else f.value
+            lower = value if lower is None else max(lower, value)
+        elif f.operator in (COMPARISON.LT, COMPARISON.MAX):
+            value = f.value - 1 if f.operator == COMPARISON.LT else f.value
+            upper = value if upper is None else min(upper, value)
+        else:
+            remaining.append(f)
+    return lower, upper, remaining
+
+
+def is_indexable(value):
+    """Return ``True`` if the specified value can be stored in a hash index.
+
+    ``None`` values are never indexed, since missing fields are equal to
+    ``None``.
+    """
+    if value is None:
+        return False
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+PLANS_CACHE_SIZE = 128
+"""Number of compiled filters and sorting plans kept in memory."""
+
+OPERATORS = {
+    COMPARISON.LT: operator.lt,
+    COMPARISON.MAX: operator.le,
+    COMPARISON.EQ: operator.eq,
+    COMPARISON.NOT: operator.ne,
+    COMPARISON.MIN: operator.ge,
+    COMPARISON.GT: operator.gt,
+}
+
+
+def memoize(maxsize):
+    """Cache the results of the decorated function, keeping only the
+    `maxsize` most recently used ones.
+    """
+    def decorator(func):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        def wrapper(*args):
+            with lock:
+                result = cache.pop(args, None)
+            if result is None:
+                result = func(*args)
+            with lock:
+                cache.pop(args, None)
+                while len(cache) >= maxsize:
+                    cache.popitem(last=False)
+                cache[args] = result
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def always(record):
+    return True
+
+
+@memoize(maxsize=PLANS_CACHE_SIZE)
+def compile_filters_plan(signature):
+    """Build the predicate factory of the specified filters signature,
+    ie. the list of ``(field, operator)`` tuples.
+
+    :returns: a function that binds the filters values and returns the
+        predicate.
+    """
+    operators = [OPERATORS[op] for (field, op) in signature]
+    fields = [field for (field, op) in signature]
+
+    if len(signature) == 0:
+        return lambda values: always
+
+    if len(signature) == 1:
+        def bind_single(values):
+            field, op, value = fields[0], operators[0], values[0]
+
+            def predicate(record):
+                return op(record.get(field), value)
+            return predicate
+        return bind_single
+
+    def bind(values):
+        checks = tuple(zip(fields, operators, values))
+
+        def predicate(record):
+            get = record.get
+            for field, op, value in checks:
+                if not op(get(field), value):
+                    return False
+            return True
+        return predicate
+    return bind
+
+
+def compile_filters(filters):
+    """Return a predicate that short-circuits on the first filter
+    that does not match.
+    """
+    signature = tuple((f.field, f.operator) for f in filters)
+    values = [f.value for f in filters]
+    return compile_filters_plan(signature)(values)
+
+
+class ReverseOrder(object):
+    """Wrap a value to invert its ordering in sort keys."""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+@memoize(maxsize=PLANS_CACHE_SIZE)
+def compile_sorting_plan(signature):
+    """Build the sort key factory of the specified sorting signature,
+    ie. the list of ``(field, direction)`` tuples.
+
+    If all fields are sorted in the same direction, values are not wrapped
+    and the whole sort is reversed instead.
+
+    :returns: a function that binds the values used for missing fields,
+        and returns the key function and the reverse flag.
+    """
+    fields = [field for (field, direction) in signature]
+    reverse = all(direction < 0 for (field, direction) in signature)
+    wrapped = [(direction < 0) != reverse
+               for (field, direction) in signature]
+
+    if len(signature) == 1:
+        def bind_single(empties):
+            field, empty = fields[0], empties[0]
+
+            def sort_key(record):
+                return record.get(field, empty)
+            return sort_key, reverse
+        return bind_single
+
+    if not any(wrapped):
+        def bind_uniform(empties):
+            columns = tuple(zip(fields, empties))
+
+            def sort_key(record):
+                get = record.get
+                return tuple([get(field, empty) for field, empty in columns])
+            return sort_key, reverse
+        return bind_uniform
+
+    def bind(empties):
+        columns = tuple(zip(fields, empties, wrapped))
+
+        def sort_key(record):
+            get = record.get
+            return tuple([ReverseOrder(get(field, empty)) if wrap
+                          else get(field, empty)
+                          for field, empty, wrap in columns])
+        return sort_key, reverse
+    return bind
+
+
+def apply_sorting(records, sorting, limit=None, first_record=None):
+    """Sort the specified records on the fields of `sorting`.
+
+    If `limit` is specified, only the first records are selected, which
+    avoids sorting the whole list.
+
+    Missing values are replaced by those of `first_record` (by default,
+    the first of `records`).
     """
     result = list(records)
 
     if not result:
         return result
 
-    first_record = result[0]
+    if not sorting:
+        return result[:limit] if limit else result
+
+    if first_record is None:
+        first_record = result[0]
+    signature = tuple((sort.field, sort.direction) for sort in sorting)
+    empties = [first_record.get(sort.field, float('inf'))
+               for sort in sorting]
+    sort_key, reverse = compile_sorting_plan(signature)(empties)
+
+    if limit and limit < len(result):
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        return select(limit, result, key=sort_key)
+    return sorted(result, key=sort_key, reverse=reverse)
 
-    def column(first, record, name):
-        empty = first.get(name, float('inf'))
-        return record.get(name, empty)
 
-    for sort in reversed(sorting):
-        result = sorted(result,
-                        key=lambda r: column(first_record, r, sort.field),
-                        reverse=(sort.direction < 0))
+class Selection(object):
+    """First records of a stream, according to `sorting`.
+
+    If `limit` is specified, the buffer of records is reduced to the
+    first ones whenever it reaches twice the limit, so that at most
+    ``2 * limit`` records are kept in memory. Since partial sorts are
+    stable, the result is the same as :func:`apply_sorting` on the whole
+    stream.
+    """
+    def __init__(self, sorting, limit=None):
+        self.sorting = sorting
+        self.limit = limit
+        self._first = None
+        self._buffer = []
+
+    def add(self, record):
+        if self._first is None:
+            self._first = record
+        self._buffer.append(record)
+        if self.limit and len(self._buffer) >= 2 * self.limit:
+            self._buffer = apply_sorting(self._buffer, self.sorting,
+                                         self.limit, self._first)
 
-    return result
+    def records(self):
+        return apply_sorting(self._buffer, self.sorting, self.limit,
+                             self._first)
 
 
 def load_from_config(config):
-    return Memory()
+    settings = config.get_settings()
+    columnar = asbool(settings.get('cliquet.storage_columnar', False))
+
+    persistence = None
+    path = settings.get('cliquet.storage_persistence_path')
+    if path:
+        fsync = settings.get('cliquet.storage_persistence_fsync', 'batch')
+        fsync_interval = settings.get(
+            'cliquet.storage_persistence_fsync_interval', 1)
+        snapshot_interval = settings.get(
+            'cliquet.storage_persistence_snapshot_interval', 3600)
+        persistence = Persistence(path,
+                                  fsync=fsync,
+                                  fsync_interval=float(fsync_interval),
+                                  snapshot_interval=float(snapshot_interval))
+
+    return Memory(columnar=columnar, persistence=persistence)
@@ -0,0 +1,209 @@
+"""Durability layer of the memory storage backend.
+
+Operations are appended to a log, and compact snapshots of the whole
+storage are written periodically in the background. On startup, the latest
+snapshot is loaded and the operations of the log are replayed.
+
+Snapshots are taken without blocking writers: the log is rotated first,
+and since replaying an operation only sets the final state of a record,
+operations that were already part of the snapshot can be replayed safely.
+"""
+import os
+import threading
+import time
+
+from cliquet import logger
+from cliquet.utils import json
+
+
+FSYNC_POLICIES = ('always', 'batch', 'never')
+
+
+class Persistence(object):
+    """Append-only log of operations and snapshots, stored in the
+    `path` directory.
+
+    :param fsync: ``always`` to flush the log on disk after each operation,
+        ``batch`` to flush it every `fsync_interval` seconds, or ``never``
+        to leave it to the operating system.
+    :param snapshot_interval: number of seconds between snapshots.
+    """
+    SNAPSHOT = 'snapshot.json'
+    LOG = 'operations.log'
+    ROTATED_LOG = 'operations.log.1'
+
+    def __init__(self, path, fsync='batch', fsync_interval=1.0,
+                 snapshot_interval=3600):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("Unknown fsync policy %r" % fsync)
+
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.snapshot_interval = snapshot_interval
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        self._lock = threading.Lock()
+        self._log = None
+        self._dirty = False
+        self._operations = 0
+        self._last_snapshot = time.time()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open_log(self):
+        self._log = open(self._file(self.LOG), 'a')
+
+    def _sync(self):
+        self._log.flush()
+        if self.fsync != 'never':
+            os.fsync(self._log.fileno())
+        self._dirty = False
+
+    def _rotate(self):
+        log, rotated = self._file(self.LOG), self._file(self.ROTATED_LOG)
+        if not os.path.exists(rotated):
+            os.rename(log, rotated)
+            return
+
+        # A previous snapshot did not complete, its operations are kept.
+        with open(rotated, 'a') as f:
+            with open(log) as operations:
+                f.write(operations.read())
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(log)
+
+    def load(self):
+        """Read the latest snapshot and the operations logged after it.
+
+        :returns: the snapshot (``None`` if none was written) and the list
+            of operations to replay.
+        :rtype: tuple
+        """
+        snapshot = None
+        if os.path.exists(self._file(self.SNAPSHOT)):
+            with open(self._file(self.SNAPSHOT)) as f:
+                snapshot = json.loads(f.read())
+
+        operations = []
+        for name in (self.ROTATED_LOG, self.LOG):
+            if os.path.exists(self._file(name)):
+                operations.extend(self._read_log(self._file(name)))
+        return snapshot, operations
+
+    def _read_log(self, filepath):
+        with open(filepath) as f:
+            lines = f.read().splitlines()
+        for i, line in enumerate(lines):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                if i < len(lines) - 1:
+                    raise
+                # The last operation was not completely written.
+                logger.warning("Ignore truncated operation in %s" % filepath)
+
+    def append(self, operation):
+        """Add the `operation` to the log. It is flushed on disk according
+        to the fsync policy."""
+        line = json.dumps(operation) + '\n'
+        with self._lock:
+            if self._log is None:
+                self._open_log()
+            self._log.write(line)
+            self._dirty = True
+            self._operations += 1
+            if self.fsync == 'always':
+                self._sync()
+
+    def sync(self):
+        """Flush the pending operations on disk."""
+        with self._lock:
+            if self._log is not None and self._dirty:
+                self._sync()
+
+    def snapshot(self, dump):
+        """Write a snapshot of the storage atomically, and drop the
+        operations it contains from the log.
+
+        :param dump: function returning the JSON serializable state of
+            the storage.
+        """
+        with self._lock:
+            if self._log is None:
+                self._open_log()
+            self._sync()
+            self._log.close()
+            self._rotate()
+            self._open_log()
+            self._operations = 0
+            self._last_snapshot = time.time()
+
+        content = json.dumps(dump())
+        tmp = self._file(self.SNAPSHOT + '.tmp')
+        with open(tmp, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self._file(self.SNAPSHOT))
+        self._fsync_directory()
+        os.remove(self._file(self.ROTATED_LOG))
+
+    def _fsync_directory(self):
+        """Make sure the renaming of files is on disk."""
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def reset(self):
+        """Remove the snapshot and the operations."""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            for name in (self.SNAPSHOT, self.ROTATED_LOG):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._log = open(self._file(self.LOG), 'w')
+            self._dirty = False
+            self._operations = 0
+
+    def tick(self, dump):
+        """Periodic tasks: flush the pending operations and take a snapshot
+        if the interval has elapsed."""
+        if self.fsync != 'always':
+            self.sync()
+        elapsed = time.time() - self._last_snapshot
+        if self._operations > 0 and elapsed >= self.snapshot_interval:
+            self.snapshot(dump)
+
+    def start(self, dump):
+        """Run the periodic tasks in a background thread."""
+        def run():
+            while not self._stopped.wait(self.fsync_interval):
+                try:
+                    self.tick(dump)
+                except Exception as e:  # pragma: no cover
+                    logger.error(e)
+
+        self._thread = threading.Thread(target=run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Stop the background thread and flush the pending operations."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            if self._log is not None:
+                self._sync()
+                self._log.close()
+                self._log = None
@@ -0,0 +1,59 @@
+CREATE TABLE IF NOT EXISTS records_count (
+    parent_id TEXT NOT NULL,
+    collection_id TEXT NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (parent_id, collection_id)
+);
+
+DROP TRIGGER IF EXISTS tgr_records_count ON records;
+
+CREATE OR REPLACE FUNCTION count_records()
+RETURNS trigger AS $$
+DECLARE
+    uid TEXT;
+    resource TEXT;
+    delta INTEGER;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        uid := NEW.parent_id;
+        resource := NEW.collection_id;
+        delta := 1;
+    ELSE
+        uid := OLD.parent_id;
+        resource := OLD.collection_id;
+        delta := -1;
+    END IF;
+
+    LOOP
+        UPDATE records_count SET total = total + delta
+         WHERE parent_id = uid
+           AND collection_id = resource;
+        IF found THEN
+            RETURN NULL;
+        END IF;
+        -- First record of the collection: if another transaction inserts
+        -- the counter concurrently, try to update it again.
+        BEGIN
+            INSERT INTO records_count (parent_id, collection_id, total)
+            VALUES (uid, resource, delta);
+            RETURN NULL;
+        EXCEPTION WHEN unique_violation THEN
+            -- Do nothing, and loop.
+        END;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tgr_records_count
+AFTER INSERT OR DELETE ON records
+FOR EACH ROW EXECUTE PROCEDURE count_records();
+
+-- Count existing records.
+INSERT INTO records_count (parent_id, collection_id, total)
+SELECT parent_id, collection_id, COUNT(*)
+  FROM records
+ GROUP BY parent_id, collection_id;
+
+-- Bump storage schema version.
+INSERT INTO metadata (name, value) VALUES ('storage_schema_version', '8');
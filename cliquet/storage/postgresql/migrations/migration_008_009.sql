@@ -0,0 +1,84 @@
+CREATE TABLE IF NOT EXISTS timestamps (
+    parent_id TEXT NOT NULL,
+    collection_id TEXT NOT NULL,
+    last_modified TIMESTAMP NOT NULL,
+
+    PRIMARY KEY (parent_id, collection_id)
+);
+
+-- Initialize with the latest of records and deleted (and prevent
+-- concurrent writes until the triggers use it).
+LOCK TABLE records, deleted IN SHARE ROW EXCLUSIVE MODE;
+
+INSERT INTO timestamps (parent_id, collection_id, last_modified)
+SELECT parent_id, collection_id, MAX(last_modified)
+  FROM (SELECT parent_id, collection_id, last_modified
+          FROM records
+         UNION ALL
+        SELECT parent_id, collection_id, last_modified
+          FROM deleted) AS all_timestamps
+ GROUP BY parent_id, collection_id;
+
+
+CREATE OR REPLACE FUNCTION collection_timestamp(uid VARCHAR, resource VARCHAR)
+RETURNS TIMESTAMP AS $$
+DECLARE
+    ts TIMESTAMP;
+BEGIN
+    SELECT last_modified INTO ts
+      FROM timestamps
+     WHERE parent_id = uid
+       AND collection_id = resource;
+
+    -- Current if empty
+    RETURN coalesce(ts, localtimestamp);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_timestamp()
+RETURNS trigger AS $$
+DECLARE
+    current TIMESTAMP;
+BEGIN
+    --
+    -- This bumps the current timestamp to 1 msec in the future if the previous
+    -- timestamp is equal to the current one (or higher if was bumped already).
+    --
+    -- The collection timestamp is locked until the end of the transaction:
+    -- a bunch of requests from the same user on the same collection are
+    -- serialized, instead of getting the same timestamp.
+    -- See https://github.com/mozilla-services/cliquet/issues/25
+    --
+    LOOP
+        UPDATE timestamps
+           SET last_modified = CASE
+               WHEN last_modified >= localtimestamp
+               THEN last_modified + INTERVAL '1 milliseconds'
+               ELSE localtimestamp
+               END
+         WHERE parent_id = NEW.parent_id
+           AND collection_id = NEW.collection_id
+        RETURNING last_modified INTO current;
+        IF found THEN
+            EXIT;
+        END IF;
+        -- First write in the collection: if another transaction inserts
+        -- its timestamp concurrently, try to update it again.
+        BEGIN
+            current := localtimestamp;
+            INSERT INTO timestamps (parent_id, collection_id, last_modified)
+            VALUES (NEW.parent_id, NEW.collection_id, current);
+            EXIT;
+        EXCEPTION WHEN unique_violation THEN
+            -- Do nothing, and loop.
+        END;
+    END LOOP;
+
+    NEW.last_modified := current;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Bump storage schema version.
+INSERT INTO metadata (name, value) VALUES ('storage_schema_version', '9');
@@ -0,0 +1,136 @@
+--
+-- Store timestamps as milliseconds epoch integers, like in the HTTP API.
+--
+-- The integer columns were filled and indexed beforehand, without locking
+-- the tables (see ``migration_009_010_prepare.sql``): they only replace the
+-- current ones here.
+--
+LOCK TABLE records, deleted, timestamps IN ACCESS EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS tgr_records_last_modified ON records;
+DROP TRIGGER IF EXISTS tgr_deleted_last_modified ON deleted;
+DROP TRIGGER IF EXISTS tgr_records_last_modified_epoch ON records;
+DROP TRIGGER IF EXISTS tgr_deleted_last_modified_epoch ON deleted;
+DROP FUNCTION IF EXISTS copy_epoch_timestamp();
+
+-- Indexes of the previous columns are dropped with them. ``SET NOT NULL``
+-- would scan the tables while they are locked: the validated check
+-- constraints of the integer columns are kept instead.
+ALTER TABLE records DROP COLUMN last_modified;
+ALTER TABLE records RENAME COLUMN last_modified_epoch TO last_modified;
+ALTER INDEX idx_records_parent_id_collection_id_last_modified_bigint
+    RENAME TO idx_records_parent_id_collection_id_last_modified;
+ALTER INDEX idx_records_last_modified_bigint
+    RENAME TO idx_records_last_modified;
+
+ALTER TABLE deleted DROP COLUMN last_modified;
+ALTER TABLE deleted RENAME COLUMN last_modified_epoch TO last_modified;
+ALTER INDEX idx_deleted_parent_id_collection_id_last_modified_bigint
+    RENAME TO idx_deleted_parent_id_collection_id_last_modified;
+ALTER INDEX idx_deleted_last_modified_bigint
+    RENAME TO idx_deleted_last_modified;
+
+-- A single row per collection.
+ALTER TABLE timestamps
+    ALTER COLUMN last_modified SET DATA TYPE BIGINT
+    USING as_epoch(last_modified);
+
+
+DROP FUNCTION IF EXISTS collection_timestamp(VARCHAR, VARCHAR);
+CREATE FUNCTION collection_timestamp(uid VARCHAR, resource VARCHAR)
+RETURNS BIGINT AS $$
+DECLARE
+    ts BIGINT;
+BEGIN
+    SELECT last_modified INTO ts
+      FROM timestamps
+     WHERE parent_id = uid
+       AND collection_id = resource;
+
+    -- Current if empty
+    RETURN coalesce(ts, as_epoch(localtimestamp));
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION bump_timestamp()
+RETURNS trigger AS $$
+DECLARE
+    now_epoch BIGINT;
+    current BIGINT;
+    upserted TEXT;
+BEGIN
+    -- Upserts (``INSERT ... ON CONFLICT DO UPDATE``) keep the timestamp
+    -- bumped for the proposed insertion of the same row, which is marked
+    -- until the end of the transaction: it is not bumped twice. Any other
+    -- update is bumped.
+    IF TG_OP = 'UPDATE' AND NEW.last_modified <> OLD.last_modified THEN
+        BEGIN
+            upserted := current_setting('cliquet.upserted_row');
+        EXCEPTION WHEN undefined_object THEN
+            upserted := NULL;
+        END;
+        IF upserted = concat_ws('/', TG_TABLE_NAME, NEW.parent_id,
+                                NEW.collection_id, NEW.id,
+                                NEW.last_modified) THEN
+            PERFORM set_config('cliquet.upserted_row', '', true);
+            RETURN NEW;
+        END IF;
+    END IF;
+    --
+    -- This bumps the current timestamp to 1 msec in the future if the previous
+    -- timestamp is equal to the current one (or higher if was bumped already).
+    --
+    -- The collection timestamp is locked until the end of the transaction:
+    -- a bunch of requests from the same user on the same collection are
+    -- serialized, instead of getting the same timestamp.
+    -- See https://github.com/mozilla-services/cliquet/issues/25
+    --
+    now_epoch := as_epoch(localtimestamp);
+    LOOP
+        UPDATE timestamps
+           SET last_modified = CASE
+               WHEN last_modified >= now_epoch THEN last_modified + 1
+               ELSE now_epoch
+               END
+         WHERE parent_id = NEW.parent_id
+           AND collection_id = NEW.collection_id
+        RETURNING last_modified INTO current;
+        IF found THEN
+            EXIT;
+        END IF;
+        -- First write in the collection: if another transaction inserts
+        -- its timestamp concurrently, try to update it again.
+        BEGIN
+            current := now_epoch;
+            INSERT INTO timestamps (parent_id, collection_id, last_modified)
+            VALUES (NEW.parent_id, NEW.collection_id, current);
+            EXIT;
+        EXCEPTION WHEN unique_violation THEN
+            -- Do nothing, and loop.
+        END;
+    END LOOP;
+
+    NEW.last_modified := current;
+
+    IF TG_OP = 'INSERT' THEN
+        PERFORM set_config('cliquet.upserted_row',
+                           concat_ws('/', TG_TABLE_NAME, NEW.parent_id,
+                                     NEW.collection_id, NEW.id, current),
+                           true);
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tgr_records_last_modified
+BEFORE INSERT OR UPDATE ON records
+FOR EACH ROW EXECUTE PROCEDURE bump_timestamp();
+
+CREATE TRIGGER tgr_deleted_last_modified
+BEFORE INSERT OR UPDATE ON deleted
+FOR EACH ROW EXECUTE PROCEDURE bump_timestamp();
+
+-- Bump storage schema version.
+INSERT INTO metadata (name, value) VALUES ('storage_schema_version', '10');
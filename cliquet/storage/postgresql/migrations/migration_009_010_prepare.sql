@@ -0,0 +1,135 @@
+--
+-- Prepare the conversion of timestamps to milliseconds epoch integers,
+-- without locking the tables: integer columns are added next to the
+-- current ones, and filled by a trigger on writes. Existing rows are then
+-- converted by batches, before the columns are swapped by
+-- ``migration_009_010.sql`` (see ``PostgreSQL._convert_timestamps()``).
+--
+-- This file can be executed again if the conversion was interrupted.
+--
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1
+                     FROM information_schema.columns
+                    WHERE table_name = 'records'
+                      AND column_name = 'last_modified_epoch') THEN
+        ALTER TABLE records ADD COLUMN last_modified_epoch BIGINT;
+        -- Not validated here, in order to avoid scanning the table.
+        ALTER TABLE records ADD CONSTRAINT records_last_modified_not_null
+            CHECK (last_modified_epoch IS NOT NULL) NOT VALID;
+    END IF;
+    IF NOT EXISTS (SELECT 1
+                     FROM information_schema.columns
+                    WHERE table_name = 'deleted'
+                      AND column_name = 'last_modified_epoch') THEN
+        ALTER TABLE deleted ADD COLUMN last_modified_epoch BIGINT;
+        ALTER TABLE deleted ADD CONSTRAINT deleted_last_modified_not_null
+            CHECK (last_modified_epoch IS NOT NULL) NOT VALID;
+    END IF;
+END;
+$$;
+
+
+CREATE OR REPLACE FUNCTION bump_timestamp()
+RETURNS trigger AS $$
+DECLARE
+    current TIMESTAMP;
+    upserted TEXT;
+BEGIN
+    -- Rows are not modified by the conversion of their timestamp.
+    IF TG_OP = 'UPDATE' AND
+       NEW.last_modified_epoch IS DISTINCT FROM OLD.last_modified_epoch THEN
+        RETURN NEW;
+    END IF;
+    -- Upserts (``INSERT ... ON CONFLICT DO UPDATE``) keep the timestamp
+    -- bumped for the proposed insertion of the same row, which is marked
+    -- until the end of the transaction: it is not bumped twice. Any other
+    -- update is bumped.
+    IF TG_OP = 'UPDATE' AND NEW.last_modified <> OLD.last_modified THEN
+        BEGIN
+            upserted := current_setting('cliquet.upserted_row');
+        EXCEPTION WHEN undefined_object THEN
+            upserted := NULL;
+        END;
+        IF upserted = concat_ws('/', TG_TABLE_NAME, NEW.parent_id,
+                                NEW.collection_id, NEW.id,
+                                NEW.last_modified) THEN
+            PERFORM set_config('cliquet.upserted_row', '', true);
+            RETURN NEW;
+        END IF;
+    END IF;
+    --
+    -- This bumps the current timestamp to 1 msec in the future if the previous
+    -- timestamp is equal to the current one (or higher if was bumped already).
+    --
+    -- Timestamps are compared once rounded to the millisecond, so that
+    -- they remain unique once converted to integers.
+    --
+    -- The collection timestamp is locked until the end of the transaction:
+    -- a bunch of requests from the same user on the same collection are
+    -- serialized, instead of getting the same timestamp.
+    -- See https://github.com/mozilla-services/cliquet/issues/25
+    --
+    LOOP
+        UPDATE timestamps
+           SET last_modified = CASE
+               WHEN as_epoch(last_modified) >= as_epoch(localtimestamp)
+               THEN last_modified + INTERVAL '1 milliseconds'
+               ELSE localtimestamp
+               END
+         WHERE parent_id = NEW.parent_id
+           AND collection_id = NEW.collection_id
+        RETURNING last_modified INTO current;
+        IF found THEN
+            EXIT;
+        END IF;
+        -- First write in the collection: if another transaction inserts
+        -- its timestamp concurrently, try to update it again.
+        BEGIN
+            current := localtimestamp;
+            INSERT INTO timestamps (parent_id, collection_id, last_modified)
+            VALUES (NEW.parent_id, NEW.collection_id, current);
+            EXIT;
+        EXCEPTION WHEN unique_violation THEN
+            -- Do nothing, and loop.
+        END;
+    END LOOP;
+
+    NEW.last_modified := current;
+
+    IF TG_OP = 'INSERT' THEN
+        PERFORM set_config('cliquet.upserted_row',
+                           concat_ws('/', TG_TABLE_NAME, NEW.parent_id,
+                                     NEW.collection_id, NEW.id, current),
+                           true);
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION copy_epoch_timestamp()
+RETURNS trigger AS $$
+BEGIN
+    -- Integer timestamps set by the conversion are kept.
+    IF TG_OP = 'UPDATE' AND
+       NEW.last_modified_epoch IS DISTINCT FROM OLD.last_modified_epoch THEN
+        RETURN NEW;
+    END IF;
+    NEW.last_modified_epoch := as_epoch(NEW.last_modified);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Triggers of the same event fire in alphabetical order: the integer
+-- timestamp is copied once the timestamp was bumped.
+DROP TRIGGER IF EXISTS tgr_records_last_modified_epoch ON records;
+CREATE TRIGGER tgr_records_last_modified_epoch
+BEFORE INSERT OR UPDATE ON records
+FOR EACH ROW EXECUTE PROCEDURE copy_epoch_timestamp();
+
+DROP TRIGGER IF EXISTS tgr_deleted_last_modified_epoch ON deleted;
+CREATE TRIGGER tgr_deleted_last_modified_epoch
+BEFORE INSERT OR UPDATE ON deleted
+FOR EACH ROW EXECUTE PROCEDURE copy_epoch_timestamp();
@@ -0,0 +1,232 @@
+"""Pool of connections of the PostgreSQL backends.
+
+Connections are opened on demand, up to the size of the pool. When they
+are all in use, checkouts wait for a connection to be released, up to a
+timeout. Connections are closed when they have been idle, or open, for too
+long.
+
+Pools are reset in forked processes (e.g. preforking servers workers), so
+that connections opened before the fork are not shared among processes.
+"""
+import os
+import threading
+import time
+
+from cliquet.utils import psycopg2
+import psycopg2.pool
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """Raised when no connection was released before the checkout timeout.
+    """
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of PostgreSQL connections.
+
+    :param int size: maximum number of opened connections.
+    :param float timeout: number of seconds to wait for a connection to be
+        released when all are in use, or ``None`` to wait forever.
+    :param float max_idle: number of seconds after which unused connections
+        are closed, or ``None``.
+    :param float max_lifetime: number of seconds after which connections
+        are closed once released, or ``None``.
+    :param str name: the name of the pool, used in metrics keys.
+    """
+
+    def __init__(self, size, timeout=None, max_idle=None, max_lifetime=None,
+                 name='pool', **conn_kwargs):
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.name = name
+        self._conn_kwargs = conn_kwargs
+        # Connections of the parent process, after a fork.
+        self._inherited = []
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        # Released connections, with their release time. The last released
+        # is used first, so that the others can expire when load decreases.
+        self._idle = []
+        self._opened_at = {}
+        self._opening = 0
+        self._in_use = 0
+        self._waiting = 0
+        # Checkouts since the last call to collect(), and their duration.
+        self._checkouts = 0
+        self._checkouts_duration = 0.0
+        self._condition = threading.Condition()
+
+    def _check_pid(self):
+        """Forget the connections opened by the parent process, if the
+        current one was forked.
+
+        They are kept referenced and never closed: closing them would
+        terminate the parent sessions, since the sockets are shared.
+        """
+        if self._pid == os.getpid():
+            return
+        self._inherited.extend(conn for conn, _ in self._idle)
+        self._reset()
+
+    @property
+    def stats(self):
+        """Number of connections in use and idle, and of waiting checkouts.
+        """
+        self._check_pid()
+        with self._condition:
+            return dict(in_use=self._in_use,
+                        idle=len(self._idle),
+                        waiting=self._waiting)
+
+    def collect(self):
+        """Return the :attr:`stats`, with the number of checkouts since the
+        previous call, and their mean duration in msec (``None`` if there
+        was none).
+        """
+        stats = self.stats
+        with self._condition:
+            checkouts, duration = self._checkouts, self._checkouts_duration
+            self._checkouts = 0
+            self._checkouts_duration = 0.0
+        stats['checkouts'] = checkouts
+        stats['checkout_duration'] = None
+        if checkouts > 0:
+            stats['checkout_duration'] = int(duration * 1000 / checkouts)
+        return stats
+
+    def getconn(self):
+        """Checkout a connection, opening a new one if none is idle and the
+        pool is not full.
+
+        :raises: :class:`PoolTimeout` if no connection was released in time.
+        """
+        self._check_pid()
+        start = time.time()
+        deadline = None
+        if self.timeout is not None:
+            deadline = start + self.timeout
+
+        expired = []
+        try:
+            with self._condition:
+                self._waiting += 1
+                try:
+                    conn = self._checkout(deadline, expired)
+                finally:
+                    self._waiting -= 1
+                if conn is not None:
+                    self._count_checkout(start)
+        finally:
+            for idle in expired:
+                self._close(idle)
+
+        if conn is not None:
+            return conn
+
+        try:
+            conn = psycopg2.connect(**self._conn_kwargs)
+        except Exception:
+            with self._condition:
+                self._opening -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._opening -= 1
+            self._opened_at[id(conn)] = time.time()
+            self._in_use += 1
+            self._count_checkout(start)
+        return conn
+
+    def _count_checkout(self, start):
+        """Must be called with the lock held."""
+        self._checkouts += 1
+        self._checkouts_duration += time.time() - start
+
+    def _checkout(self, deadline, expired):
+        """Return an idle connection, or ``None`` if a new one can be opened.
+        Must be called with the lock held.
+        """
+        while True:
+            now = time.time()
+            idle = []
+            for conn, released_at in self._idle:
+                if self._is_expired(conn, released_at, now):
+                    del self._opened_at[id(conn)]
+                    expired.append(conn)
+                else:
+                    idle.append((conn, released_at))
+            self._idle = idle
+
+            if self._idle:
+                conn, _ = self._idle.pop()
+                self._in_use += 1
+                return conn
+
+            if len(self._opened_at) + self._opening < self.size:
+                self._opening += 1
+                return None
+
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - now
+                if remaining <= 0:
+                    msg = 'No connection released within %s seconds.'
+                    raise PoolTimeout(msg % self.timeout)
+            self._condition.wait(remaining)
+
+    def putconn(self, conn, close=False):
+        """Release a connection, and close it if `close` is ``True``, if it
+        was closed or if it expired.
+        """
+        self._check_pid()
+        if id(conn) not in self._opened_at:
+            # Checked out before the process was forked.
+            self._inherited.append(conn)
+            return
+
+        now = time.time()
+        with self._condition:
+            self._in_use -= 1
+            close = close or self._is_expired(conn, now, now)
+            if close:
+                self._opened_at.pop(id(conn), None)
+            else:
+                self._idle.append((conn, now))
+            self._condition.notify()
+        if close:
+            self._close(conn)
+
+    def closeall(self):
+        """Close the idle connections. The pool remains usable: connections
+        are opened again on demand.
+        """
+        self._check_pid()
+        with self._condition:
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            for conn in idle:
+                del self._opened_at[id(conn)]
+            self._condition.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def _is_expired(self, conn, released_at, now):
+        if conn.closed:
+            return True
+        if self.max_idle is not None and now - released_at > self.max_idle:
+            return True
+        opened_at = self._opened_at.get(id(conn), now)
+        if self.max_lifetime is not None:
+            return now - opened_at > self.max_lifetime
+        return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:  # pragma: no cover
+            pass
@@ -16,10 +16,8 @@ CREATE TABLE IF NOT EXISTS records (
     parent_id TEXT NOT NULL,
     collection_id TEXT NOT NULL,
 
-    -- Timestamp is relevant because adequate semantically.
-    -- Since the HTTP API manipulates integers, it could make sense
-    -- to replace the timestamp columns type by integer.
-    last_modified TIMESTAMP NOT NULL,
+    -- Milliseconds epoch integer, as manipulated by the HTTP API.
+    last_modified BIGINT NOT NULL,
 
     -- JSONB, 2x faster than JSON.
     data JSONB NOT NULL DEFAULT '{}'::JSONB,
@@ -30,8 +28,8 @@ CREATE TABLE IF NOT EXISTS records (
 DROP INDEX IF EXISTS idx_records_parent_id_collection_id_last_modified;
 CREATE UNIQUE INDEX idx_records_parent_id_collection_id_last_modified
     ON records(parent_id, collection_id, last_modified DESC);
-DROP INDEX IF EXISTS idx_records_last_modified_epoch;
-CREATE INDEX idx_records_last_modified_epoch ON records(as_epoch(last_modified));
+DROP INDEX IF EXISTS idx_records_last_modified;
+CREATE INDEX idx_records_last_modified ON records(last_modified);
 
 
 --
@@ -41,44 +39,45 @@ CREATE TABLE IF NOT EXISTS deleted (
     id TEXT NOT NULL,
     parent_id TEXT NOT NULL,
     collection_id TEXT NOT NULL,
-    last_modified TIMESTAMP NOT NULL,
+    last_modified BIGINT NOT NULL,
 
     PRIMARY KEY (id, parent_id, collection_id)
 );
 DROP INDEX IF EXISTS idx_deleted_parent_id_collection_id_last_modified;
 CREATE UNIQUE INDEX idx_deleted_parent_id_collection_id_last_modified
     ON deleted(parent_id, collection_id, last_modified DESC);
-DROP INDEX IF EXISTS idx_deleted_last_modified_epoch;
-CREATE INDEX idx_deleted_last_modified_epoch ON deleted(as_epoch(last_modified));
+DROP INDEX IF EXISTS idx_deleted_last_modified;
+CREATE INDEX idx_deleted_last_modified ON deleted(last_modified);
+
+
+--
+-- Current timestamp of each collection, maintained by triggers.
+--
+CREATE TABLE IF NOT EXISTS timestamps (
+    parent_id TEXT NOT NULL,
+    collection_id TEXT NOT NULL,
+    last_modified BIGINT NOT NULL,
+
+    PRIMARY KEY (parent_id, collection_id)
+);
 
 
 --
 -- Helper that returns the current collection timestamp.
 --
-CREATE OR REPLACE FUNCTION collection_timestamp(uid VARCHAR, resource VARCHAR)
-RETURNS TIMESTAMP AS $$
+DROP FUNCTION IF EXISTS collection_timestamp(VARCHAR, VARCHAR);
+CREATE FUNCTION collection_timestamp(uid VARCHAR, resource VARCHAR)
+RETURNS BIGINT AS $$
 DECLARE
-    ts_records TIMESTAMP;
-    ts_deleted TIMESTAMP;
+    ts BIGINT;
 BEGIN
-    --
-    -- This is fast because an index was created for ``parent_id``,
-    -- ``collection_id``, and ``last_modified`` with descending sorting order.
-    --
-    SELECT last_modified INTO ts_records
-      FROM records
-     WHERE parent_id = uid
-       AND collection_id = resource
-     ORDER BY last_modified DESC LIMIT 1;
-
-    SELECT last_modified INTO ts_deleted
-      FROM deleted
+    SELECT last_modified INTO ts
+      FROM timestamps
      WHERE parent_id = uid
-       AND collection_id = resource
-     ORDER BY last_modified DESC LIMIT 1;
+       AND collection_id = resource;
 
-    -- Latest of records/deleted or current if empty
-    RETURN coalesce(greatest(ts_deleted, ts_records), localtimestamp);
+    -- Current if empty
+    RETURN coalesce(ts, as_epoch(localtimestamp));
 END;
 $$ LANGUAGE plpgsql;
 
@@ -91,27 +90,70 @@ DROP TRIGGER IF EXISTS tgr_deleted_last_modified ON deleted;
 CREATE OR REPLACE FUNCTION bump_timestamp()
 RETURNS trigger AS $$
 DECLARE
-    previous TIMESTAMP;
-    current TIMESTAMP;
+    now_epoch BIGINT;
+    current BIGINT;
+    upserted TEXT;
 BEGIN
+    -- Upserts (``INSERT ... ON CONFLICT DO UPDATE``) keep the timestamp
+    -- bumped for the proposed insertion of the same row, which is marked
+    -- until the end of the transaction: it is not bumped twice. Any other
+    -- update is bumped.
+    IF TG_OP = 'UPDATE' AND NEW.last_modified <> OLD.last_modified THEN
+        BEGIN
+            upserted := current_setting('cliquet.upserted_row');
+        EXCEPTION WHEN undefined_object THEN
+            upserted := NULL;
+        END;
+        IF upserted = concat_ws('/', TG_TABLE_NAME, NEW.parent_id,
+                                NEW.collection_id, NEW.id,
+                                NEW.last_modified) THEN
+            PERFORM set_config('cliquet.upserted_row', '', true);
+            RETURN NEW;
+        END IF;
+    END IF;
     --
     -- This bumps the current timestamp to 1 msec in the future if the previous
     -- timestamp is equal to the current one (or higher if was bumped already).
     --
-    -- If a bunch of requests from the same user on the same collection
-    -- arrive in the same millisecond, the unicity constraint can raise
-    -- an error (operation is cancelled).
+    -- The collection timestamp is locked until the end of the transaction:
+    -- a bunch of requests from the same user on the same collection are
+    -- serialized, instead of getting the same timestamp.
     -- See https://github.com/mozilla-services/cliquet/issues/25
     --
-    previous := collection_timestamp(NEW.parent_id, NEW.collection_id);
-    current := localtimestamp;
-
-    IF previous >= current THEN
-        current := previous + INTERVAL '1 milliseconds';
-    END IF;
+    now_epoch := as_epoch(localtimestamp);
+    LOOP
+        UPDATE timestamps
+           SET last_modified = CASE
+               WHEN last_modified >= now_epoch THEN last_modified + 1
+               ELSE now_epoch
+               END
+         WHERE parent_id = NEW.parent_id
+           AND collection_id = NEW.collection_id
+        RETURNING last_modified INTO current;
+        IF found THEN
+            EXIT;
+        END IF;
+        -- First write in the collection: if another transaction inserts
+        -- its timestamp concurrently, try to update it again.
+        BEGIN
+            current := now_epoch;
+            INSERT INTO timestamps (parent_id, collection_id, last_modified)
+            VALUES (NEW.parent_id, NEW.collection_id, current);
+            EXIT;
+        EXCEPTION WHEN unique_violation THEN
+            -- Do nothing, and loop.
+        END;
+    END LOOP;
 
     NEW.last_modified := current;
 
+    IF TG_OP = 'INSERT' THEN
+        PERFORM set_config('cliquet.upserted_row',
+                           concat_ws('/', TG_TABLE_NAME, NEW.parent_id,
+                                     NEW.collection_id, NEW.id, current),
+                           true);
+    END IF;
+
     RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
@@ -124,6 +166,61 @@ CREATE TRIGGER tgr_deleted_last_modified
 BEFORE INSERT OR UPDATE ON deleted
 FOR EACH ROW EXECUTE PROCEDURE bump_timestamp();
 
+--
+-- Number of records per collection, maintained by triggers, in order to
+-- count the records of a collection without scanning them.
+--
+CREATE TABLE IF NOT EXISTS records_count (
+    parent_id TEXT NOT NULL,
+    collection_id TEXT NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (parent_id, collection_id)
+);
+
+DROP TRIGGER IF EXISTS tgr_records_count ON records;
+
+CREATE OR REPLACE FUNCTION count_records()
+RETURNS trigger AS $$
+DECLARE
+    uid TEXT;
+    resource TEXT;
+    delta INTEGER;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        uid := NEW.parent_id;
+        resource := NEW.collection_id;
+        delta := 1;
+    ELSE
+        uid := OLD.parent_id;
+        resource := OLD.collection_id;
+        delta := -1;
+    END IF;
+
+    LOOP
+        UPDATE records_count SET total = total + delta
+         WHERE parent_id = uid
+           AND collection_id = resource;
+        IF found THEN
+            RETURN NULL;
+        END IF;
+        -- First record of the collection: if another transaction inserts
+        -- the counter concurrently, try to update it again.
+        BEGIN
+            INSERT INTO records_count (parent_id, collection_id, total)
+            VALUES (uid, resource, delta);
+            RETURN NULL;
+        EXCEPTION WHEN unique_violation THEN
+            -- Do nothing, and loop.
+        END;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tgr_records_count
+AFTER INSERT OR DELETE ON records
+FOR EACH ROW EXECUTE PROCEDURE count_records();
+
 --
 -- Metadata table
 --
@@ -136,4 +233,4 @@ INSERT INTO metadata (name, value) VALUES ('created_at', NOW()::TEXT);
 
 -- Set storage schema version.
 -- Should match ``cliquet.storage.postgresql.PostgreSQL.schema_version``
-INSERT INTO metadata (name, value) VALUES ('storage_schema_version', '7');
+INSERT INTO metadata (name, value) VALUES ('storage_schema_version', '10');
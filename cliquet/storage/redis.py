@@ -1,14 +1,36 @@
 from __future__ import absolute_import
-from functools import wraps
+import itertools
+import math
+import os
+from collections import defaultdict, namedtuple
+from functools import partial, wraps
 
 import redis
+import six
 from six.moves.urllib import parse as urlparse
 
-from cliquet import utils
+from cliquet import logger, utils
+from cliquet.serializers import Serializer, load_from_settings
 from cliquet.storage import (
-    exceptions, DEFAULT_ID_FIELD,
+    exceptions, Filter, is_scalar, DEFAULT_ID_FIELD,
     DEFAULT_MODIFIED_FIELD, DEFAULT_DELETED_FIELD)
-from cliquet.storage.memory import MemoryBasedStorage
+from cliquet.storage.memory import MemoryBasedStorage, get_timestamp_bounds
+from cliquet.utils import COMPARISON
+
+
+def chunked(iterable, size):
+    """Split the iterable into lists of `size` items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def unique_records(records, id_field):
+    """List the records, keeping only the last one returned for each id."""
+    return list(dict((r[id_field], r) for r in records).values())
 
 
 def wrap_redis_error(func):
@@ -21,13 +43,673 @@ def wrap_redis_error(func):
     return wrapped
 
 
-class Redis(MemoryBasedStorage):
+class RedisClient(object):
+    """Base class of the Redis backends, which holds the client and its
+    connection pool.
+
+    The client is created on first use, and created again in forked
+    processes (e.g. preforking servers workers), so that the connections
+    opened before forking are not shared among processes. Connections are
+    opened on demand, up to `max_connections`.
+    """
+    def __init__(self, *args, **kwargs):
+        self._max_connections = kwargs.pop('max_connections')
+        self._client_kwargs = kwargs
+        self._client_pid = None
+        self._client_instance = None
+
+    @property
+    def _client(self):
+        pid = os.getpid()
+        if self._client_pid != pid:
+            # Concurrent first uses may create several clients: only the
+            # last one is kept, the others are garbage collected.
+            self._client_instance = self._create_client()
+            self._client_pid = pid
+        return self._client_instance
+
+    def _create_client(self):
+        connection_pool = redis.BlockingConnectionPool(
+            max_connections=self._max_connections, **self._client_kwargs)
+        return redis.StrictRedis(connection_pool=connection_pool)
+
+
+KEYS_LAYOUT = """
+-- Each record is stored in its own key, and the ids of the collection are
+-- kept in a set. `suffix` is either 'records' or 'deleted' (tombstones).
+local function store_record(prefix, suffix, id, encoded)
+    redis.call('SET', prefix .. '.' .. id .. '.' .. suffix, encoded)
+    redis.call('SADD', prefix .. '.' .. suffix, id)
+end
+
+local function remove_record(prefix, suffix, id)
+    if redis.call('DEL', prefix .. '.' .. id .. '.' .. suffix) == 0 then
+        return false
+    end
+    redis.call('SREM', prefix .. '.' .. suffix, id)
+    return true
+end
+
+local function records_ids(prefix, suffix)
+    return redis.call('SMEMBERS', prefix .. '.' .. suffix)
+end
+
+local function fetch_records(prefix, suffix, ids)
+    local keys = {}
+    for i, id in ipairs(ids) do
+        keys[i] = prefix .. '.' .. id .. '.' .. suffix
+    end
+    return redis.call('MGET', unpack(keys))
+end
+"""
+
+HASH_LAYOUT = """
+-- The records of a collection are stored in a single hash, by id.
+-- `suffix` is either 'records' or 'deleted' (tombstones).
+local function store_record(prefix, suffix, id, encoded)
+    redis.call('HSET', prefix .. '.' .. suffix .. '.hash', id, encoded)
+end
+
+local function remove_record(prefix, suffix, id)
+    return redis.call('HDEL', prefix .. '.' .. suffix .. '.hash', id) == 1
+end
+
+local function records_ids(prefix, suffix)
+    return redis.call('HKEYS', prefix .. '.' .. suffix .. '.hash')
+end
+
+local function fetch_records(prefix, suffix, ids)
+    return redis.call('HMGET', prefix .. '.' .. suffix .. '.hash',
+                      unpack(ids))
+end
+"""
+
+MIGRATE_LAYOUT_SCRIPT = """
+-- Move records from their own keys to the hash of their collection.
+--
+-- KEYS: ids set and hash of the collection.
+-- ARGV: records keys prefix and suffix, followed by the ids to move.
+-- Returns the number of records moved.
+local prefix, suffix = ARGV[1], ARGV[2]
+local moved = 0
+for i = 3, #ARGV do
+    local key = prefix .. '.' .. ARGV[i] .. '.' .. suffix
+    -- Keys of another type do not belong to the storage, and are kept.
+    if redis.call('TYPE', key).ok == 'string' then
+        redis.call('HSET', KEYS[2], ARGV[i], redis.call('GET', key))
+        redis.call('DEL', key)
+        moved = moved + 1
+    end
+    redis.call('SREM', KEYS[1], ARGV[i])
+end
+return moved
+"""
+
+SCRIPTS_PRELUDE = """
+-- Fetch the records by chunks, since the number of arguments of a command
+-- is limited in Lua.
+local function fetch_all_records(prefix, suffix, ids)
+    local result = {}
+    for i = 1, #ids, 1000 do
+        local chunk = {}
+        for j = i, math.min(i + 999, #ids) do
+            chunk[#chunk + 1] = ids[j]
+        end
+        -- Missing records are false, and kept to preserve positions.
+        for _, encoded in ipairs(fetch_records(prefix, suffix, chunk)) do
+            result[#result + 1] = encoded
+        end
+    end
+    return result
+end
+
+-- Timestamps are bumped like in the memory backend: if writes burst in, the
+-- collection timestamp slides into the future.
+local function bump_timestamp(timestamp_key, now)
+    local current = now
+    local previous = tonumber(redis.call('GET', timestamp_key))
+    if previous and previous >= current then
+        current = previous + 1
+    end
+    redis.call('SET', timestamp_key, string.format('%d', current))
+    return current
+end
+
+-- Remove a record from the unique index of the specified field. Unique
+-- indexes map encoded values to ids, and ids to encoded values.
+local function unindex_unique(prefix, id, field)
+    local ids_key = prefix .. '.records.unique.' .. field
+    local values_key = prefix .. '.records.unique_values.' .. field
+    local previous = redis.call('HGET', values_key, id)
+    if previous then
+        if redis.call('HGET', ids_key, previous) == id then
+            redis.call('HDEL', ids_key, previous)
+        end
+        redis.call('HDEL', values_key, id)
+    end
+end
+
+-- Remove a record from the sorted index of the specified field.
+local function unindex_sorted(prefix, id, field)
+    redis.call('ZREM', prefix .. '.records.sorted.' .. field, id)
+    redis.call('SREM', prefix .. '.records.unsorted.' .. field, id)
+end
+
+-- Remove a record from the sorted and unique indexes of the specified
+-- fields, and from every sorted index of the collection (the fields that
+-- have one are kept in a set), even if the caller does not index them.
+local function unindex_record(prefix, id, fields)
+    for _, field in ipairs(fields) do
+        unindex_sorted(prefix, id, field)
+        unindex_unique(prefix, id, field)
+    end
+    for _, field in ipairs(redis.call('SMEMBERS',
+                                      prefix .. '.records.sorted')) do
+        unindex_sorted(prefix, id, field)
+    end
+end
+
+-- Delete a record and replace it by a tombstone with its own timestamp.
+-- Returns the encoded tombstone, or nil if the record does not exist.
+local function delete_record(prefix, id, now, id_field, modified_field,
+                             deleted_field, fields)
+    if not remove_record(prefix, 'records', id) then
+        return nil
+    end
+    redis.call('ZREM', prefix .. '.records.timeline', id)
+    unindex_record(prefix, id, fields)
+
+    local current = bump_timestamp(prefix .. '.timestamp', now)
+    local tombstone = '{' .. cjson.encode(id_field) .. ':' ..
+                      cjson.encode(id) .. ',' ..
+                      cjson.encode(modified_field) .. ':' ..
+                      string.format('%d', current) .. ',' ..
+                      cjson.encode(deleted_field) .. ':true}'
+    store_record(prefix, 'deleted', id, tombstone)
+    redis.call('ZADD', prefix .. '.deleted.timeline', current, id)
+    return tombstone
+end
+"""
+
+BUMP_TIMESTAMP_SCRIPT = """
+-- Bump the collection timestamp.
+--
+-- KEYS: collection timestamp.
+-- ARGV: current time.
+return bump_timestamp(KEYS[1], tonumber(ARGV[1]))
+"""
+
+SAVE_SCRIPT = """
+-- Stamp a record with a new collection timestamp, and store it.
+--
+-- KEYS: collection timestamp.
+-- ARGV: records keys prefix, current time, record id, modified field,
+--       the record encoded without its modified field, number of sorted
+--       indexes, the indexed fields and their scores (empty if the value
+--       is not a number), followed by the unique fields and their encoded
+--       values (empty if the value cannot be indexed).
+local prefix, now, id = ARGV[1], tonumber(ARGV[2]), ARGV[3]
+local modified_field, encoded = ARGV[4], ARGV[5]
+
+local current = bump_timestamp(KEYS[1], now)
+
+-- The timestamp is inserted in the encoded record, instead of decoding and
+-- re-encoding it (which would alter numbers and empty lists). Binary
+-- encoded records are prefixed with a header (see ``cliquet.serializers``).
+if string.sub(encoded, 1, 1) ~= '{' then
+    encoded = '\\3' .. string.format('%d', current) .. ':' ..
+              cjson.encode(modified_field) .. '\\n' .. encoded
+else
+    local stamp = cjson.encode(modified_field) .. ':' ..
+                  string.format('%d', current)
+    if string.match(encoded, '^%s*{%s*}%s*$') then
+        encoded = '{' .. stamp .. '}'
+    else
+        encoded = '{' .. stamp .. ',' .. string.sub(encoded, 2)
+    end
+end
+
+store_record(prefix, 'records', id, encoded)
+redis.call('ZADD', prefix .. '.records.timeline', current, id)
+
+local sorted_fields_key = prefix .. '.records.sorted'
+local indexed = {}
+local first_unique = 7 + 2 * tonumber(ARGV[6])
+for i = 7, first_unique - 1, 2 do
+    local field, score = ARGV[i], ARGV[i + 1]
+    local sorted_key = prefix .. '.records.sorted.' .. field
+    local unsorted_key = prefix .. '.records.unsorted.' .. field
+    if score == '' then
+        redis.call('ZREM', sorted_key, id)
+        redis.call('SADD', unsorted_key, id)
+    else
+        redis.call('ZADD', sorted_key, score, id)
+        redis.call('SREM', unsorted_key, id)
+    end
+    redis.call('SADD', sorted_fields_key, field)
+    indexed[field] = true
+end
+
+-- The score of the record cannot be updated in the sorted indexes of the
+-- fields that the caller does not index: they are dropped, and rebuilt by
+-- the next query sorted on the field.
+for _, field in ipairs(redis.call('SMEMBERS', sorted_fields_key)) do
+    if not indexed[field] then
+        redis.call('DEL', prefix .. '.records.sorted.' .. field,
+                   prefix .. '.records.unsorted.' .. field)
+        redis.call('SREM', sorted_fields_key, field)
+    end
+end
+
+for i = first_unique, #ARGV, 2 do
+    local field, value = ARGV[i], ARGV[i + 1]
+    unindex_unique(prefix, id, field)
+    if value ~= '' then
+        redis.call('HSET', prefix .. '.records.unique.' .. field, value, id)
+        redis.call('HSET', prefix .. '.records.unique_values.' .. field,
+                   id, value)
+    end
+end
+return current
+"""
+
+DELETE_SCRIPT = """
+-- Delete a record, and replace it by a tombstone.
+--
+-- KEYS: collection timestamp.
+-- ARGV: records keys prefix, current time, record id, id, modified and
+--       deleted fields, followed by the indexed and unique fields.
+local fields = {}
+for i = 7, #ARGV do
+    fields[#fields + 1] = ARGV[i]
+end
+return delete_record(ARGV[1], ARGV[3], tonumber(ARGV[2]),
+                     ARGV[4], ARGV[5], ARGV[6], fields)
+"""
+
+DELETE_ALL_SCRIPT = """
+-- Delete records of a collection, and replace them by tombstones.
+--
+-- KEYS: collection timestamp.
+-- ARGV: records keys prefix, current time, id, modified and deleted fields,
+--       number of indexed and unique fields and these fields, followed by
+--       the ids of the records to delete (all if none).
+local prefix, now = ARGV[1], tonumber(ARGV[2])
+local id_field, modified_field, deleted_field = ARGV[3], ARGV[4], ARGV[5]
+
+local fields = {}
+local first_id = 7 + tonumber(ARGV[6])
+for i = 7, first_id - 1 do
+    fields[#fields + 1] = ARGV[i]
+end
+
+local ids = {}
+if #ARGV >= first_id then
+    for i = first_id, #ARGV do
+        ids[#ids + 1] = ARGV[i]
+    end
+else
+    ids = records_ids(prefix, 'records')
+end
+
+local tombstones = {}
+for _, id in ipairs(ids) do
+    local tombstone = delete_record(prefix, id, now, id_field,
+                                    modified_field, deleted_field, fields)
+    if tombstone then
+        tombstones[#tombstones + 1] = tombstone
+    end
+end
+return tombstones
+"""
+
+PURGE_SCRIPT = """
+-- Delete the tombstones of a collection older than a timestamp.
+--
+-- KEYS: tombstones timeline.
+-- ARGV: records keys prefix and exclusive timestamp limit (empty for all).
+-- Returns the number of purged tombstones.
+local prefix = ARGV[1]
+local ids
+if ARGV[2] == '' then
+    ids = records_ids(prefix, 'deleted')
+    redis.call('DEL', KEYS[1])
+else
+    local max = '(' .. ARGV[2]
+    ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', max)
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', max)
+end
+for _, id in ipairs(ids) do
+    remove_record(prefix, 'deleted', id)
+end
+return #ids
+"""
+
+QUERY_SCRIPT = """
+-- Select the page of records of a collection, ordered by a numeric field,
+-- and then optionally by timestamp.
+--
+-- KEYS: sorted index of the field and records timeline.
+-- ARGV: records keys prefix, bounds of the filtered scores, bounds of the
+--       scores after the pagination cursor, score and timestamp of the
+--       cursor if records with the same score may follow it (empty
+--       otherwise), '1' for descending order, direction of the timestamps
+--       ordering (0 if not sorted) and maximum number of records (0 if
+--       unlimited).
+-- Returns the number of filtered records, followed by the encoded records.
+local sorted_key, timeline_key = KEYS[1], KEYS[2]
+local prefix, lower, upper = ARGV[1], ARGV[2], ARGV[3]
+local page_lower, page_upper = ARGV[4], ARGV[5]
+local tie_score, tie_timestamp = tonumber(ARGV[6]), tonumber(ARGV[7])
+local reverse, secondary = ARGV[8] == '1', tonumber(ARGV[9])
+local limit = tonumber(ARGV[10])
+
+local total = redis.call('ZCOUNT', sorted_key, lower, upper)
+
+local function timestamp(id)
+    return tonumber(redis.call('ZSCORE', timeline_key, id))
+end
+
+-- Records with the same score as the cursor follow it if their timestamp
+-- does.
+local entries = {}
+if tie_score then
+    for _, id in ipairs(redis.call('ZRANGEBYSCORE', sorted_key,
+                                   ARGV[6], ARGV[6])) do
+        local ts = timestamp(id)
+        if (secondary > 0 and ts > tie_timestamp) or
+           (secondary < 0 and ts < tie_timestamp) then
+            entries[#entries + 1] = {id = id, score = tie_score, ts = ts}
+        end
+    end
+end
+
+local paginated = tie_score or page_lower ~= lower or page_upper ~= upper
+if paginated and #entries == 0 and
+   redis.call('ZCOUNT', sorted_key, page_lower, page_upper) == 0 then
+    -- Like with filtering, an empty page falls back to the whole set.
+    page_lower, page_upper = lower, upper
+end
+
+local function range(min, max, count)
+    local command, args = 'ZRANGEBYSCORE', {min, max}
+    if reverse then
+        command, args = 'ZREVRANGEBYSCORE', {max, min}
+    end
+    args[#args + 1] = 'WITHSCORES'
+    if count then
+        args[#args + 1] = 'LIMIT'
+        args[#args + 1] = 0
+        args[#args + 1] = count
+    end
+    return redis.call(command, sorted_key, unpack(args))
+end
+
+local count = nil
+if limit > 0 then
+    count = limit
+end
+local page = range(page_lower, page_upper, count)
+
+if count and #page == 2 * count and secondary ~= 0 then
+    -- Records with the same score as the last one of the page are
+    -- ordered by timestamp, they are all fetched.
+    local last = page[#page]
+    while #page > 0 and page[#page] == last do
+        page[#page], page[#page - 1] = nil, nil
+    end
+    for _, entry in ipairs(range(last, last)) do
+        page[#page + 1] = entry
+    end
+end
+
+for i = 1, #page, 2 do
+    entries[#entries + 1] = {id = page[i], score = tonumber(page[i + 1])}
+end
+
+if secondary ~= 0 then
+    for _, entry in ipairs(entries) do
+        entry.ts = entry.ts or timestamp(entry.id)
+    end
+end
+
+table.sort(entries, function (a, b)
+    if a.score ~= b.score then
+        if reverse then
+            return a.score > b.score
+        end
+        return a.score < b.score
+    end
+    if secondary ~= 0 and a.ts ~= b.ts then
+        if secondary < 0 then
+            return a.ts > b.ts
+        end
+        return a.ts < b.ts
+    end
+    if reverse then
+        return a.id > b.id
+    end
+    return a.id < b.id
+end)
+
+local ids = {}
+for i, entry in ipairs(entries) do
+    if count and i > count then
+        break
+    end
+    ids[#ids + 1] = entry.id
+end
+
+local result = {total}
+for _, record in ipairs(fetch_all_records(prefix, 'records', ids)) do
+    result[#result + 1] = record
+end
+return result
+"""
+
+
+SortedIndexPlan = namedtuple('SortedIndexPlan', ['field', 'lower', 'upper',
+                                                 'page_lower', 'page_upper',
+                                                 'tie', 'reverse',
+                                                 'secondary'])
+"""Query that can be answered from the sorted index of `field`. Bounds are
+``(score, exclusive)`` tuples (``None`` if unbounded), and `tie` is the
+``(score, timestamp)`` of the pagination cursor if the records with the
+same score are ordered by timestamp."""
+
+
+def tightest_lower(*bounds):
+    # Among equal scores, the exclusive bound is the tightest.
+    bounds = [b for b in bounds if b is not None]
+    return max(bounds) if bounds else None
+
+
+def tightest_upper(*bounds):
+    bounds = [b for b in bounds if b is not None]
+    return min(bounds, key=lambda b: (b[0], not b[1])) if bounds else None
+
+
+def get_score_bounds(filters, field):
+    """Convert the filters on `field` into bounds of scores.
+
+    :returns: the lower and upper bounds, or ``None`` if some filters
+        cannot be converted.
+    :rtype: tuple
+    """
+    lower = upper = None
+    for f in filters:
+        if f.field != field or not is_scalar(f.value):
+            return None
+        if f.operator in (COMPARISON.EQ, COMPARISON.GT, COMPARISON.MIN):
+            lower = tightest_lower(lower,
+                                   (f.value, f.operator == COMPARISON.GT))
+        if f.operator in (COMPARISON.EQ, COMPARISON.LT, COMPARISON.MAX):
+            upper = tightest_upper(upper,
+                                   (f.value, f.operator == COMPARISON.LT))
+        elif f.operator not in (COMPARISON.GT, COMPARISON.MIN):
+            return None
+    return lower, upper
+
+
+def is_within(score, lower, upper):
+    if lower is not None:
+        if score < lower[0] or (score == lower[0] and lower[1]):
+            return False
+    if upper is not None:
+        if score > upper[0] or (score == upper[0] and upper[1]):
+            return False
+    return True
+
+
+def format_score(score):
+    return repr(score) if isinstance(score, float) else str(score)
+
+
+def score_range(bound, unbounded):
+    """Format the bound for ``ZRANGEBYSCORE`` and ``ZCOUNT``."""
+    if bound is None:
+        return unbounded
+    score, exclusive = bound
+    return '(' + format_score(score) if exclusive else format_score(score)
+
+
+def encode_unique_value(value):
+    """Encode the value as a key of unique indexes.
+
+    :returns: the encoded value, or ``None`` if the value cannot be indexed
+        (missing or not scalar).
+    """
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        if value.is_integer():
+            # Equal numbers share the same key.
+            value = int(value)
+    elif not isinstance(value, (six.string_types, six.integer_types)):
+        return None
+    return utils.json.dumps(value)
+
+
+def get_sorted_index_plan(filters, sorting, pagination_rules,
+                          indexed_fields, modified_field):
+    """Check if the query can be answered from the sorted index of an
+    indexed field, ie. if records are sorted by this field (and then
+    optionally by `modified_field`), and if filters are only ranges on it.
+
+    Pagination rules are expected to be those of the resource, ie. a
+    cursor on the last record of the previous page.
+
+    :rtype: :class:`SortedIndexPlan`
+    """
+    if not sorting or len(sorting) > 2:
+        return None
+    field, direction = sorting[0]
+    if field not in indexed_fields or field == modified_field:
+        return None
+    secondary = 0
+    if len(sorting) == 2:
+        if sorting[1].field != modified_field:
+            return None
+        secondary = sorting[1].direction
+
+    bounds = get_score_bounds(filters or [], field)
+    if bounds is None:
+        return None
+    lower, upper = bounds
+    reverse = direction < 0
+
+    page_lower, page_upper, tie = lower, upper, None
+    if pagination_rules:
+        after = COMPARISON.LT if reverse else COMPARISON.GT
+        score = pagination_rules[-1][0].value
+        expected = [[Filter(field, score, after)]]
+        if secondary:
+            timestamp = pagination_rules[0][-1].value
+            next_ts = COMPARISON.LT if secondary < 0 else COMPARISON.GT
+            expected.insert(0, [Filter(field, score, COMPARISON.EQ),
+                                Filter(modified_field, timestamp, next_ts)])
+            if not isinstance(timestamp, six.integer_types) or \
+               isinstance(timestamp, bool):
+                return None
+        if not is_scalar(score) or pagination_rules != expected:
+            return None
+
+        if reverse:
+            page_upper = tightest_upper(upper, (score, True))
+        else:
+            page_lower = tightest_lower(lower, (score, True))
+        if secondary and is_within(score, lower, upper):
+            tie = (score, timestamp)
+
+    return SortedIndexPlan(field, lower, upper, page_lower, page_upper, tie,
+                           reverse, secondary)
+
+
+class RedisTimeline(object):
+    """Records ids ordered by timestamp, stored in a Redis sorted set.
+
+    Provides the same interface as :class:`cliquet.storage.memory.Timeline`.
+    """
+    def __init__(self, client, key):
+        self._client = client
+        self._key = key
+
+    def count(self, lower=None, upper=None):
+        return self._client.zcount(self._key,
+                                   '-inf' if lower is None else lower,
+                                   '+inf' if upper is None else upper)
+
+    def slice(self, lower=None, upper=None, reverse=False, limit=None):
+        lower = '-inf' if lower is None else lower
+        upper = '+inf' if upper is None else upper
+        kwargs = dict(withscores=True, score_cast_func=int)
+        if limit:
+            kwargs.update(start=0, num=limit)
+        if reverse:
+            entries = self._client.zrevrangebyscore(self._key, upper, lower,
+                                                    **kwargs)
+        else:
+            entries = self._client.zrangebyscore(self._key, lower, upper,
+                                                 **kwargs)
+        return [(ts, _id.decode('utf-8')) for (_id, ts) in entries]
+
+    def scan(self, lower=None, upper=None, count=1000):
+        """Iterate on the entries of the range by chunks of `count`.
+
+        Each chunk starts at the last timestamp of the previous one, and
+        skips the entries of this timestamp already returned. Entries are
+        thus returned once, and only one chunk is kept in memory.
+        """
+        lower = '-inf' if lower is None else lower
+        upper = '+inf' if upper is None else upper
+        returned = set()
+        while True:
+            num = count + len(returned)
+            entries = self._client.zrangebyscore(self._key, lower, upper,
+                                                 start=0, num=num,
+                                                 withscores=True,
+                                                 score_cast_func=int)
+            entries = [(ts, _id.decode('utf-8')) for (_id, ts) in entries]
+            for (ts, _id) in entries:
+                if ts != lower or _id not in returned:
+                    yield (ts, _id)
+            if len(entries) < num:
+                return
+            last = entries[-1][0]
+            if last != lower:
+                returned = set()
+            returned.update(_id for (ts, _id) in entries if ts == last)
+            lower = last
+
+
+class Redis(RedisClient, MemoryBasedStorage):
     """Storage backend implementation using Redis.
 
     .. warning::
 
         Useful for very low server load, but won't scale since records sorting
-        and filtering are performed in memory.
+        and filtering are performed in memory, except for the queries
+        mentioned below.
 
     Enable in configuration::
 
@@ -37,28 +719,143 @@ class Redis(MemoryBasedStorage):
 
         cliquet.storage_url = redis://localhost:6379/0
 
-    A threaded connection pool is enabled by default::
+    A threaded connection pool is enabled by default. Connections are opened
+    on demand, by each process of preforking servers::
 
         cliquet.storage_pool_size = 50
+
+    *(Optional)* When records are filtered and sorted in memory, they are
+    fetched and decoded by chunks, in order to bound the memory used per
+    request::
+
+        cliquet.storage_fetch_chunk_size = 1000
+
+    *(Optional)* Records can be encoded with msgpack instead of JSON, and
+    compressed above a size threshold (in bytes). Records stored with another
+    encoding remain readable::
+
+        cliquet.storage_codec = msgpack
+        cliquet.storage_compression_threshold = 1024
+
+    .. note::
+
+        Records ids are also kept in sorted sets by timestamp, so that
+        synchronization queries (e.g. ``_since``) only fetch the records
+        of the current page.
+
+        Records ids are kept in sorted sets by value for the numeric
+        fields declared as indexed (see
+        :meth:`cliquet.storage.StorageBase.set_indexed_fields`). Queries
+        sorted by one of them (and then by timestamp), and filtered on
+        ranges of it, are answered by a Lua script which only fetches the
+        records of the current page.
+
+        Values of the fields declared as unique (see
+        :meth:`cliquet.storage.StorageBase.set_unique_fields`) are mapped
+        to records ids in hashes, so that unicity checks are a single
+        lookup per field.
+
+        Write operations are performed by Lua scripts, which bump the
+        collection timestamp and store the records atomically, in a single
+        round trip.
     """
+    LAYOUT = KEYS_LAYOUT
+    """Lua functions to store and fetch records."""
+
+    _rebuild_attempts = 3
+    """Number of attempts to rebuild an index required by a query."""
 
     def __init__(self, *args, **kwargs):
+        self._chunk_size = kwargs.pop('chunk_size', 1000)
+        self._serializer = kwargs.pop('serializer', None) or Serializer()
         super(Redis, self).__init__(*args, **kwargs)
-        maxconn = kwargs.pop('max_connections')
-        connection_pool = redis.BlockingConnectionPool(max_connections=maxconn)
-        self._client = redis.StrictRedis(connection_pool=connection_pool,
-                                         **kwargs)
+        self._scripts = {}
+        self._indexed_fields = defaultdict(set)
+        self._unique_fields = defaultdict(set)
+        self._bump_timestamp_script = self._register(BUMP_TIMESTAMP_SCRIPT)
+        self._save_script = self._register(SAVE_SCRIPT)
+        self._delete_script = self._register(DELETE_SCRIPT)
+        self._delete_all_script = self._register(DELETE_ALL_SCRIPT)
+        self._purge_script = self._register(PURGE_SCRIPT)
+        self._query_script = self._register(QUERY_SCRIPT)
+
+    def _create_client(self):
+        client = super(Redis, self)._create_client()
+        # Scripts are registered again with the new client.
+        self._scripts = {}
+        return client
+
+    def _register(self, script):
+        """Return a function running the Lua `script` with the current
+        client."""
+        source = self.LAYOUT + SCRIPTS_PRELUDE + script
+
+        def run(keys, args):
+            client = self._client
+            if source not in self._scripts:
+                self._scripts[source] = client.register_script(source)
+            return self._scripts[source](keys=keys, args=args)
+        return run
+
+    def _count_ids(self, pipe, prefix, suffix):
+        """Add the command counting the records (or tombstones if `suffix`
+        is ``deleted``) of the collection to the pipeline."""
+        pipe.scard('{0}.{1}'.format(prefix, suffix))
+
+    def _fetch(self, prefix, suffix, ids):
+        """Fetch the encoded records with the specified ids (``None`` for
+        unknown ones)."""
+        keys = ['{0}.{1}.{2}'.format(prefix, _id, suffix) for _id in ids]
+        return self._client.mget(keys)
+
+    def _scan(self, prefix, suffix):
+        """Iterate on the encoded records of the collection, fetched by
+        chunks.
+
+        Records can be returned several times, and are thus only scanned
+        to rebuild the timelines.
+        """
+        ids = (_id.decode('utf-8') for _id in self._client.sscan_iter(
+            '{0}.{1}'.format(prefix, suffix), count=self._chunk_size))
+        for chunk in chunked(ids, self._chunk_size):
+            for encoded in self._fetch(prefix, suffix, chunk):
+                yield encoded
+
+    def _fetch_entries(self, prefix, entries):
+        """Fetch the records and tombstones of timeline entries, in a
+        single command."""
+        keys = ['{0}.{1}.{2}'.format(prefix, _id,
+                                     'deleted' if is_deleted else 'records')
+                for (_, _id, is_deleted) in entries]
+        return self._client.mget(keys) if keys else []
 
     def _encode(self, record):
-        return utils.json.dumps(record)
+        return self._serializer.dumps(record)
 
     def _decode(self, record):
-        return utils.json.loads(record.decode('utf-8'))
+        return self._serializer.loads(record)
 
     @wrap_redis_error
     def flush(self, auth=None):
         self._client.flushdb()
 
+    def set_indexed_fields(self, collection_id, fields):
+        # Sorted indexes of records stored before the declaration are
+        # rebuilt by the first query that scans the collection.
+        self._indexed_fields[collection_id].update(fields)
+
+    def set_unique_fields(self, collection_id, fields):
+        # Unique indexes of records stored before the declaration are
+        # rebuilt by the first unicity check.
+        self._unique_fields[collection_id].update(fields)
+
+    def _unindexed_fields(self, collection_id):
+        """Fields whose indexes must be updated when records are deleted.
+        """
+        fields = (self._indexed_fields.get(collection_id, set()) |
+                  self._unique_fields.get(collection_id, set()))
+        return sorted(fields)
+
     @wrap_redis_error
     def collection_timestamp(self, collection_id, parent_id, auth=None):
         timestamp = self._client.get(
@@ -70,24 +867,26 @@ class Redis(MemoryBasedStorage):
     @wrap_redis_error
     def _bump_timestamp(self, collection_id, parent_id):
         key = '{0}.{1}.timestamp'.format(collection_id, parent_id)
-        while 1:
-            with self._client.pipeline() as pipe:
-                try:
-                    pipe.watch(key)
-                    previous = pipe.get(key)
-                    pipe.multi()
-                    current = utils.msec_time()
-
-                    if previous and int(previous) >= current:
-                        current = int(previous) + 1
-                    pipe.set(key, current)
-                    pipe.execute()
-                    return current
-                except redis.WatchError:  # pragma: no cover
-                    # Our timestamp has been modified by someone else, let's
-                    # retry.
-                    # XXX: untested.
-                    continue
+        return self._bump_timestamp_script(keys=[key],
+                                           args=[utils.msec_time()])
+
+    def _save(self, collection_id, parent_id, object_id, record,
+              modified_field):
+        """Stamp and store the record with a server-side script."""
+        record.pop(modified_field, None)
+        prefix = '{0}.{1}'.format(collection_id, parent_id)
+        keys = ['{0}.timestamp'.format(prefix)]
+        indexed_fields = sorted(self._indexed_fields.get(collection_id, []))
+        args = [prefix, utils.msec_time(), object_id, modified_field,
+                self._encode(record), len(indexed_fields)]
+        for field in indexed_fields:
+            value = record.get(field)
+            args += [field, value if is_scalar(value) else '']
+        for field in sorted(self._unique_fields.get(collection_id, [])):
+            encoded = encode_unique_value(record.get(field))
+            args += [field, '' if encoded is None else encoded]
+        record[modified_field] = self._save_script(keys=keys, args=args)
+        return record
 
     @wrap_redis_error
     def create(self, collection_id, parent_id, record, id_generator=None,
@@ -101,34 +900,16 @@ class Redis(MemoryBasedStorage):
         record = record.copy()
         id_generator = id_generator or self.id_generator
         _id = record.setdefault(id_field, id_generator())
-        self.set_record_timestamp(collection_id, parent_id, record,
-                                  modified_field=modified_field)
-
-        record_key = '{0}.{1}.{2}.records'.format(collection_id,
-                                                  parent_id,
-                                                  _id)
-        with self._client.pipeline() as multi:
-            multi.set(
-                record_key,
-                self._encode(record)
-            )
-            multi.sadd(
-                '{0}.{1}.records'.format(collection_id, parent_id),
-                _id
-            )
-            multi.execute()
-
-        return record
+        return self._save(collection_id, parent_id, _id, record,
+                          modified_field)
 
     @wrap_redis_error
     def get(self, collection_id, parent_id, object_id,
             id_field=DEFAULT_ID_FIELD,
             modified_field=DEFAULT_MODIFIED_FIELD,
             auth=None):
-        record_key = '{0}.{1}.{2}.records'.format(collection_id,
-                                                  parent_id,
-                                                  object_id)
-        encoded_item = self._client.get(record_key)
+        prefix = '{0}.{1}'.format(collection_id, parent_id)
+        encoded_item = self._fetch(prefix, 'records', [object_id])[0]
         if encoded_item is None:
             raise exceptions.RecordNotFoundError(object_id)
 
@@ -143,25 +924,8 @@ class Redis(MemoryBasedStorage):
         record[id_field] = object_id
         self.check_unicity(collection_id, parent_id, record,
                            unique_fields=unique_fields, id_field=id_field)
-
-        self.set_record_timestamp(collection_id, parent_id, record,
-                                  modified_field=modified_field)
-
-        record_key = '{0}.{1}.{2}.records'.format(collection_id,
-                                                  parent_id,
-                                                  object_id)
-        with self._client.pipeline() as multi:
-            multi.set(
-                record_key,
-                self._encode(record)
-            )
-            multi.sadd(
-                '{0}.{1}.records'.format(collection_id, parent_id),
-                object_id
-            )
-            multi.execute()
-
-        return record
+        return self._save(collection_id, parent_id, object_id, record,
+                          modified_field)
 
     @wrap_redis_error
     def delete(self, collection_id, parent_id, object_id,
@@ -169,96 +933,475 @@ class Redis(MemoryBasedStorage):
                modified_field=DEFAULT_MODIFIED_FIELD,
                deleted_field=DEFAULT_DELETED_FIELD,
                auth=None):
-        record_key = '{0}.{1}.{2}.records'.format(collection_id,
-                                                  parent_id,
-                                                  object_id)
-        with self._client.pipeline() as multi:
-            multi.get(record_key)
-            multi.delete(record_key)
-            multi.srem(
-                '{0}.{1}.records'.format(collection_id, parent_id),
-                object_id
-            )
-            responses = multi.execute()
-
-        encoded_item = responses[0]
-        if encoded_item is None:
+        prefix = '{0}.{1}'.format(collection_id, parent_id)
+        keys = ['{0}.timestamp'.format(prefix)]
+        args = [prefix, utils.msec_time(), object_id,
+                id_field, modified_field, deleted_field]
+        args += self._unindexed_fields(collection_id)
+        tombstone = self._delete_script(keys=keys, args=args)
+        if tombstone is None:
             raise exceptions.RecordNotFoundError(object_id)
+        return self._decode(tombstone)
+
+    @wrap_redis_error
+    def delete_all(self, collection_id, parent_id, filters=None,
+                   id_field=DEFAULT_ID_FIELD,
+                   modified_field=DEFAULT_MODIFIED_FIELD,
+                   deleted_field=DEFAULT_DELETED_FIELD,
+                   auth=None):
+        """Delete the records of the collection with a server-side script,
+        in a constant number of round trips.
+        """
+        ids = []
+        if filters:
+            records, _ = self.get_all(collection_id, parent_id,
+                                      filters=filters,
+                                      id_field=id_field,
+                                      modified_field=modified_field,
+                                      deleted_field=deleted_field)
+            ids = [r[id_field] for r in records]
+            if not ids:
+                return []
+
+        prefix = '{0}.{1}'.format(collection_id, parent_id)
+        keys = ['{0}.timestamp'.format(prefix)]
+        fields = self._unindexed_fields(collection_id)
+        args = [prefix, utils.msec_time(),
+                id_field, modified_field, deleted_field, len(fields)]
+        args += fields + ids
+        tombstones = self._delete_all_script(keys=keys, args=args)
+        return [self._decode(t) for t in tombstones]
 
-        existing = self._decode(encoded_item)
-        self.set_record_timestamp(collection_id, parent_id, existing,
-                                  modified_field=modified_field)
-        existing = self.strip_deleted_record(collection_id, parent_id,
-                                             existing)
+    @wrap_redis_error
+    def purge_deleted(self, collection_id, parent_id, before=None,
+                      id_field=DEFAULT_ID_FIELD,
+                      modified_field=DEFAULT_MODIFIED_FIELD,
+                      auth=None):
+        """Delete the tombstones of each collection with a server-side
+        script. Collections are found from their tombstones timelines.
+        """
+        suffix = '.deleted.timeline'
+        if collection_id is not None and parent_id is not None:
+            keys = ['{0}.{1}{2}'.format(collection_id, parent_id, suffix)]
+        else:
+            pattern = '{0}.{1}{2}'.format(collection_id or '*',
+                                          parent_id or '*', suffix)
+            keys = (key.decode('utf-8') for key in
+                    self._client.scan_iter(match=pattern,
+                                           count=self._chunk_size))
+        purged = 0
+        for key in keys:
+            prefix = key[:-len(suffix)]
+            args = [prefix, '' if before is None else before]
+            purged += self._purge_script(keys=[key], args=args)
+        return purged
+
+    def find_unique_record(self, collection_id, parent_id, filters,
+                           id_field):
+        """Look the value up in the unique index of the field, or fetch
+        the record directly for ids.
+        """
+        rule = filters[0]
+        excluded = filters[1].value if len(filters) > 1 else None
+        prefix = '{0}.{1}'.format(collection_id, parent_id)
+        encoded = encode_unique_value(rule.value)
+
+        if rule.field == id_field:
+            _id = rule.value
+        elif (encoded is not None and
+              rule.field in self._unique_fields.get(collection_id, set())):
+            _id = self._lookup_unique_index(collection_id, parent_id,
+                                            rule.field, encoded, id_field)
+        else:
+            return super(Redis, self).find_unique_record(
+                collection_id, parent_id, filters, id_field)
 
-        deleted_record_key = '{0}.{1}.{2}.deleted'.format(collection_id,
-                                                          parent_id,
-                                                          object_id)
+        if _id is None or _id == excluded:
+            return None
+        encoded_record = self._fetch(prefix, 'records', [_id])[0]
+        if encoded_record is None:
+            return None
+        record = self._decode(encoded_record)
+        # The index entry may be outdated if records stored before the
+        # declaration were modified while it was rebuilt.
+        if record.get(rule.field) == rule.value:
+            return record
+
+    def _lookup_unique_index(self, collection_id, parent_id, field, encoded,
+                             id_field):
+        """Return the id of the record with the encoded value in the unique
+        index of the field, which is rebuilt if incomplete.
+
+        The index is only rebuilt if the collection was not written while
+        its records were read (see :meth:`_rebuild_indexes`), which is
+        retried a few times. The records read are used to answer otherwise.
+        """
+        prefix = '{0}.{1}'.format(collection_id, parent_id)
+        built_key = '{0}.records.unique'.format(prefix)
+        ids_key = '{0}.records.unique.{1}'.format(prefix, field)
         with self._client.pipeline() as multi:
-            multi.set(
-                deleted_record_key,
-                self._encode(existing)
-            )
-            multi.sadd(
-                '{0}.{1}.deleted'.format(collection_id, parent_id),
-                object_id
-            )
-            multi.execute()
-
-        return existing
+            multi.sismember(built_key, field)
+            multi.hget(ids_key, encoded)
+            multi.get('{0}.timestamp'.format(prefix))
+            built, _id, version = multi.execute()
+
+        if built:
+            return _id.decode('utf-8') if _id is not None else None
+
+        for attempt in range(self._rebuild_attempts):
+            if attempt > 0:
+                version = self._client.get('{0}.timestamp'.format(prefix))
+            records = self._get_records_set(collection_id, parent_id,
+                                            'records')
+            values = {}
+            for record in records:
+                value = encode_unique_value(record.get(field))
+                if value is not None:
+                    values[record[id_field]] = value
+            rebuild = partial(self._rebuild_unique_index, prefix=prefix,
+                              field=field, values=values)
+            if self._rebuild_indexes(prefix, version, [rebuild]):
+                break
+
+        ids = dict((value, _id) for (_id, value) in values.items())
+        return ids.get(encoded)
 
     @wrap_redis_error
     def get_all(self, collection_id, parent_id, filters=None, sorting=None,
                 pagination_rules=None, limit=None, include_deleted=False,
+                count_total=True,
                 id_field=DEFAULT_ID_FIELD,
                 modified_field=DEFAULT_MODIFIED_FIELD,
                 deleted_field=DEFAULT_DELETED_FIELD,
                 auth=None):
-        records_ids_key = '{0}.{1}.records'.format(collection_id, parent_id)
-        ids = self._client.smembers(records_ids_key)
+        prefix = '{0}.{1}'.format(collection_id, parent_id)
+        records_timeline_key = '{0}.records.timeline'.format(prefix)
+        deleted_timeline_key = '{0}.deleted.timeline'.format(prefix)
 
-        keys = ('{0}.{1}.{2}.records'.format(collection_id, parent_id,
-                                             _id.decode('utf-8'))
-                for _id in ids)
+        index_plan = None
+        if not include_deleted:
+            index_plan = get_sorted_index_plan(
+                filters, sorting, pagination_rules,
+                self._indexed_fields.get(collection_id, set()),
+                modified_field)
+        if index_plan is not None:
+            sorted_key = '{0}.records.sorted.{1}'.format(prefix,
+                                                         index_plan.field)
+            unsorted_key = '{0}.records.unsorted.{1}'.format(
+                prefix, index_plan.field)
 
-        if len(ids) == 0:
-            records = []
-        else:
-            encoded_results = self._client.mget(keys)
+        # Timelines and sorted indexes may be incomplete if records were
+        # stored before their introduction, or if a sorted index was
+        # dropped by a write that does not index its field. They are
+        # rebuilt below in this case.
+        with self._client.pipeline() as multi:
+            self._count_ids(multi, prefix, 'records')
+            multi.zcard(records_timeline_key)
+            self._count_ids(multi, prefix, 'deleted')
+            multi.zcard(deleted_timeline_key)
+            if index_plan is not None:
+                multi.zcard(sorted_key)
+                multi.scard(unsorted_key)
+            multi.get('{0}.timestamp'.format(prefix))
+            sizes = multi.execute()
+        version = sizes.pop()
+        records_indexed = sizes[0] == sizes[1]
+        deleted_indexed = sizes[2] == sizes[3]
+        timelines_indexed = records_indexed and (deleted_indexed or
+                                                 not include_deleted)
+        sorted_indexed = (index_plan is not None and
+                          sizes[0] == sizes[4] + sizes[5])
+
+        if records_indexed and sorted_indexed and sizes[5] == 0:
+            # Every record has a numeric value for the sorting field.
+            return self._get_sorted_page(collection_id, parent_id,
+                                         index_plan, limit)
+
+        plan = None
+        if timelines_indexed:
+            plan = self.get_timeline_plan(filters, sorting, pagination_rules,
+                                          modified_field)
+        if plan is not None:
+            timeline = RedisTimeline(self._client, records_timeline_key)
+            deleted_timeline = None
+            if include_deleted:
+                deleted_timeline = RedisTimeline(self._client,
+                                                 deleted_timeline_key)
+            entries, count = self.extract_timeline_set(plan, timeline,
+                                                       deleted_timeline,
+                                                       limit)
+            encoded_results = self._fetch_entries(prefix, entries)
             records = [self._decode(r) for r in encoded_results if r]
+            return records, count
+
+        lower, upper, _ = get_timestamp_bounds(filters or [], modified_field)
+        bounded = lower is not None or upper is not None
+        # Timelines are scanned up to the collection timestamp, so that
+        # records modified during the scan are not returned twice.
+        scan_upper = upper
+        if version is not None and (upper is None or int(version) < upper):
+            scan_upper = int(version)
+
+        records = self._get_records_set(collection_id, parent_id, 'records',
+                                        lower, scan_upper, records_indexed)
+        if not records_indexed:
+            # Timelines are rebuilt from the whole collection, which was
+            # scanned without them.
+            records = unique_records(records, id_field)
+        fetched_all = not (bounded and records_indexed)
+        rebuild_sorted_index = (index_plan is not None and
+                                not sorted_indexed and fetched_all)
+        rebuilds = []
+        if rebuild_sorted_index:
+            # Indexes are rebuilt from the whole collection.
+            records = list(records)
+        if not records_indexed:
+            rebuilds.append(partial(
+                self._rebuild_timeline, timeline_key=records_timeline_key,
+                records=records, id_field=id_field,
+                modified_field=modified_field))
+        if rebuild_sorted_index:
+            rebuilds.append(partial(
+                self._rebuild_sorted_index, prefix=prefix,
+                records=records, field=index_plan.field, id_field=id_field))
 
         deleted = []
         if include_deleted:
-            deleted_ids = '{0}.{1}.deleted'.format(collection_id, parent_id)
-            ids = self._client.smembers(deleted_ids)
+            deleted = self._get_records_set(collection_id, parent_id,
+                                            'deleted', lower, scan_upper,
+                                            deleted_indexed)
+            if not deleted_indexed:
+                deleted = unique_records(deleted, id_field)
+                rebuilds.append(partial(
+                    self._rebuild_timeline,
+                    timeline_key=deleted_timeline_key, records=deleted,
+                    id_field=id_field, modified_field=modified_field))
 
-            keys = ['{0}.{1}.{2}.deleted'.format(collection_id, parent_id,
-                                                 _id.decode('utf-8'))
-                    for _id in ids]
-
-            if len(keys) == 0:
-                deleted = []
-            else:
-                encoded_results = self._client.mget(keys)
-                deleted = [self._decode(r) for r in encoded_results if r]
+        if rebuilds:
+            self._rebuild_indexes(prefix, version, rebuilds)
 
         records, count = self.extract_record_set(collection_id,
-                                                 records + deleted,
+                                                 itertools.chain(records,
+                                                                 deleted),
                                                  filters, sorting,
                                                  id_field, deleted_field,
                                                  pagination_rules, limit)
 
         return records, count
 
+    def _get_records_set(self, collection_id, parent_id, suffix,
+                         lower=None, upper=None, use_timeline=False):
+        """Iterate on the records (or tombstones if `suffix` is ``deleted``)
+        of the collection, optionnally restricted to the specified range
+        of timestamps.
+
+        Ids are scanned incrementally, and records are fetched by chunks
+        as the generator is consumed. Unless `use_timeline` is true, records
+        can be returned several times.
+        """
+        prefix = '{0}.{1}'.format(collection_id, parent_id)
+        if use_timeline:
+            timeline = RedisTimeline(self._client, '{0}.{1}.timeline'.format(
+                prefix, suffix))
+            entries = timeline.scan(lower, upper, self._chunk_size)
+            ids = (_id for (_, _id) in entries)
+            encoded_records = (encoded
+                               for chunk in chunked(ids, self._chunk_size)
+                               for encoded in self._fetch(prefix, suffix,
+                                                          chunk))
+        else:
+            encoded_records = self._scan(prefix, suffix)
+
+        for encoded in encoded_records:
+            if encoded:
+                yield self._decode(encoded)
+
+    def _get_sorted_page(self, collection_id, parent_id, plan, limit=None):
+        """Fetch the records of the current page from the sorted index
+        of the plan field, with a server-side script.
+        """
+        prefix = '{0}.{1}'.format(collection_id, parent_id)
+        keys = ['{0}.records.sorted.{1}'.format(prefix, plan.field),
+                '{0}.records.timeline'.format(prefix)]
+        tie_score = tie_timestamp = ''
+        if plan.tie is not None:
+            tie_score, tie_timestamp = format_score(plan.tie[0]), plan.tie[1]
+        args = [prefix,
+                score_range(plan.lower, '-inf'),
+                score_range(plan.upper, '+inf'),
+                score_range(plan.page_lower, '-inf'),
+                score_range(plan.page_upper, '+inf'),
+                tie_score,
+                tie_timestamp,
+                1 if plan.reverse else 0,
+                plan.secondary,
+                limit or 0]
+        result = self._query_script(keys=keys, args=args)
+        records = [self._decode(r) for r in result[1:] if r]
+        return records, result[0]
+
+    def _rebuild_indexes(self, prefix, version, rebuilds):
+        """Run the `rebuilds` functions, which add the commands rebuilding
+        indexes to a transaction, unless the collection was written since
+        its timestamp `version` was read. The indexes would then miss these
+        writes, and are rebuilt by a later query instead.
+
+        :returns: ``True`` if the indexes were rebuilt.
+        :rtype: bool
+        """
+        timestamp_key = '{0}.timestamp'.format(prefix)
+        with self._client.pipeline() as multi:
+            try:
+                multi.watch(timestamp_key)
+                if multi.get(timestamp_key) != version:
+                    return False
+                multi.multi()
+                for rebuild in rebuilds:
+                    rebuild(multi)
+                multi.execute()
+            except redis.WatchError:
+                return False
+        return True
+
+    def _rebuild_sorted_index(self, multi, prefix, records, field, id_field):
+        sorted_key = '{0}.records.sorted.{1}'.format(prefix, field)
+        unsorted_key = '{0}.records.unsorted.{1}'.format(prefix, field)
+        scores = {}
+        unsorted = []
+        for record in records:
+            value = record.get(field)
+            if is_scalar(value):
+                scores[record[id_field]] = value
+            else:
+                unsorted.append(record[id_field])
+        multi.delete(sorted_key, unsorted_key)
+        if scores:
+            multi.zadd(sorted_key, scores)
+        if unsorted:
+            multi.sadd(unsorted_key, *unsorted)
+        multi.sadd('{0}.records.sorted'.format(prefix), field)
+
+    def _rebuild_unique_index(self, multi, prefix, field, values):
+        ids_key = '{0}.records.unique.{1}'.format(prefix, field)
+        values_key = '{0}.records.unique_values.{1}'.format(prefix, field)
+        multi.delete(ids_key, values_key)
+        if values:
+            ids = dict((value, _id) for (_id, value) in values.items())
+            multi.hmset(ids_key, ids)
+            multi.hmset(values_key, values)
+        multi.sadd('{0}.records.unique'.format(prefix), field)
+
+    def _rebuild_timeline(self, multi, timeline_key, records, id_field,
+                          modified_field):
+        timestamps = dict([(r[id_field], r[modified_field]) for r in records])
+        multi.delete(timeline_key)
+        if timestamps:
+            multi.zadd(timeline_key, timestamps)
+
+
+class RedisHash(Redis):
+    """Storage backend implementation using Redis, where the records (and
+    the tombstones) of a collection are stored in a single hash, instead
+    of a key per record.
+
+    This reduces the number of keys and the memory used by Redis for
+    collections of many small records.
+
+    Enable in configuration::
+
+        cliquet.storage_backend = cliquet.storage.redis
+        cliquet.storage_redis_layout = hash
+
+    Records stored with the default layout are moved into hashes by the
+    ``cliquet migrate`` command.
+    """
+    LAYOUT = HASH_LAYOUT
+
+    @wrap_redis_error
+    def initialize_schema(self):
+        migrate = self._client.register_script(MIGRATE_LAYOUT_SCRIPT)
+        # Every collection stored with the default layout has a timestamp
+        # key, next to the sets of ids of its records and tombstones.
+        keys = self._client.scan_iter(match='*.timestamp',
+                                      count=self._chunk_size)
+        for chunk in chunked(keys, self._chunk_size):
+            prefixes = [key.decode('utf-8')[:-len('.timestamp')]
+                        for key in chunk]
+            with self._client.pipeline(transaction=False) as pipe:
+                for key, prefix in zip(chunk, prefixes):
+                    pipe.type(key)
+                    pipe.type('{0}.records'.format(prefix))
+                    pipe.type('{0}.deleted'.format(prefix))
+                types = chunked(pipe.execute(), 3)
+
+            for prefix, (timestamp_type, records_type,
+                         deleted_type) in zip(prefixes, types):
+                if timestamp_type != b'string':
+                    continue
+                suffixes = [suffix for (suffix, type_)
+                            in [('records', records_type),
+                                ('deleted', deleted_type)]
+                            if type_ == b'set']
+                for suffix in suffixes:
+                    key = '{0}.{1}'.format(prefix, suffix)
+                    hash_key = self._hash_key(prefix, suffix)
+                    moved = 0
+                    while True:
+                        ids = self._client.srandmember(key, self._chunk_size)
+                        if not ids:
+                            break
+                        moved += migrate(keys=[key, hash_key],
+                                         args=[prefix, suffix] + ids)
+                    logger.info('Moved %s %s of %s into a hash.' % (
+                        moved, suffix, prefix))
+
+    def _hash_key(self, prefix, suffix):
+        return '{0}.{1}.hash'.format(prefix, suffix)
+
+    def _count_ids(self, pipe, prefix, suffix):
+        pipe.hlen(self._hash_key(prefix, suffix))
+
+    def _fetch(self, prefix, suffix, ids):
+        return self._client.hmget(self._hash_key(prefix, suffix), ids)
+
+    def _scan(self, prefix, suffix):
+        entries = self._client.hscan_iter(self._hash_key(prefix, suffix),
+                                          count=self._chunk_size)
+        for _id, encoded in entries:
+            yield encoded
+
+    def _fetch_entries(self, prefix, entries):
+        # Records and tombstones are fetched from their respective hashes.
+        ids = dict(records=[], deleted=[])
+        for (_, _id, is_deleted) in entries:
+            ids['deleted' if is_deleted else 'records'].append(_id)
+        fetched = dict((suffix, iter(self._fetch(prefix, suffix, ids)))
+                       for suffix, ids in ids.items() if ids)
+        return [next(fetched['deleted' if is_deleted else 'records'])
+                for (_, _, is_deleted) in entries]
+
+
+LAYOUTS = {
+    'keys': Redis,
+    'hash': RedisHash,
+}
+
 
 def load_from_config(config):
     settings = config.get_settings()
     uri = settings['cliquet.storage_url']
     uri = urlparse.urlparse(uri)
     pool_size = int(settings['cliquet.storage_pool_size'])
+    chunk_size = int(settings.get('cliquet.storage_fetch_chunk_size', 1000))
+    layout = settings.get('cliquet.storage_redis_layout', 'keys')
+    if layout not in LAYOUTS:
+        raise ValueError("Unknown Redis storage layout %r" % layout)
+    serializer = load_from_settings(settings, 'cliquet.storage')
 
-    return Redis(max_connections=pool_size,
-                 host=uri.hostname or 'localhost',
-                 port=uri.port or 6739,
-                 password=uri.password or None,
-                 db=int(uri.path[1:]) if uri.path else 0)
+    return LAYOUTS[layout](max_connections=pool_size,
+                           chunk_size=chunk_size,
+                           serializer=serializer,
+                           host=uri.hostname or 'localhost',
+                           port=uri.port or 6379,
+                           password=uri.password or None,
+                           db=int(uri.path[1:]) if uri.path else 0)
@@ -153,6 +153,36 @@ class PaginationTest(BaseTest):
         self.assertEqual(expected_results['data'],
                          results1['data'] + results2['data'])
 
+    def test_total_records_are_not_counted_if_specified(self):
+        self.resource.request.GET = {'_count': 'false'}
+        with mock.patch.object(self.collection, 'get_records',
+                               wraps=self.collection.get_records) as m:
+            self.resource.collection_get()
+        self.assertFalse(m.call_args[1]['count_total'])
+        self.assertNotIn('Total-Records', self.last_response.headers)
+
+    def test_count_parameter_is_only_passed_to_storage_if_skipped(self):
+        with mock.patch.object(self.collection.storage, 'get_all',
+                               wraps=self.collection.storage.get_all) as m:
+            self.resource.collection_get()
+            self.assertNotIn('count_total', m.call_args[1])
+            self.resource.request.GET = {'_count': 'false'}
+            self.resource.collection_get()
+            self.assertFalse(m.call_args[1]['count_total'])
+
+    def test_next_page_is_given_for_full_pages_if_not_counted(self):
+        self.resource.request.GET = {'_count': 'false', '_limit': '20'}
+        self.resource.collection_get()
+        queryparams = self._setup_next_page()
+        self.assertEqual(queryparams['_count'], ['false'])
+        result = self.resource.collection_get()
+        self.assertEqual(len(result['data']), 0)
+        self.assertNotIn('Next-Page', self.last_response.headers)
+
+    def test_wrong_count_raise_400(self):
+        self.resource.request.GET = {'_count': 'toto'}
+        self.assertRaises(HTTPBadRequest, self.resource.collection_get)
+
     def test_wrong_limit_raise_400(self):
         self.resource.request.GET = {'_since': '123', '_limit': 'toto'}
         self.assertRaises(HTTPBadRequest, self.resource.collection_get)
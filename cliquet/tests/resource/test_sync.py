@@ -52,6 +52,18 @@ class SinceModifiedTest(ThreadMixin, BaseTest):
         self.assertRaises(httpexceptions.HTTPBadRequest,
                           self.resource.collection_get)
 
+    def test_filter_with_since_older_than_tombstones_retention_fails(self):
+        settings = self.resource.request.registry.settings.copy()
+        settings['cliquet.storage_tombstones_retention'] = 3600
+        self.resource.request.registry.settings = settings
+        with mock.patch('cliquet.resource.msec_time',
+                        return_value=10000000):
+            self.resource.request.GET = {'_since': '6300000'}
+            self.assertRaises(httpexceptions.HTTPBadRequest,
+                              self.resource.collection_get)
+            self.resource.request.GET = {'_since': '6500000'}
+            self.resource.collection_get()  # not raising
+
     def test_filter_with_since_rejects_decimal_value(self):
         self.resource.request.GET = {'_since': '1.2'}
         self.assertRaises(httpexceptions.HTTPBadRequest,
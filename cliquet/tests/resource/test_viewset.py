@@ -1,7 +1,8 @@
 import colander
 import mock
 
-from cliquet.resource import ViewSet, register_resource
+from cliquet.resource import BaseResource, ViewSet, register_resource
+from cliquet.schema import ResourceSchema
 
 from cliquet.tests.support import unittest
 
@@ -349,3 +350,47 @@ class RegisterTest(unittest.TestCase):
                                       **self.viewset.service_arguments)
         service_class().add_view.assert_any_call(
             'PUT', 'put', klass=self.resource)
+
+    @mock.patch('cliquet.resource.Service')
+    def test_indexed_and_unique_fields_are_declared_to_storage(self, service):
+        class IndexedSchema(ResourceSchema):
+            class Options:
+                indexed_fields = ('author',)
+                unique_fields = ('isbn',)
+
+        class Indexed(BaseResource):
+            mapping = IndexedSchema()
+
+        venusian_callback = register_resource(Indexed, viewset=self.viewset)
+
+        context = mock.MagicMock()
+        context.config.with_package.return_value = context
+        venusian_callback(context, None, None)
+
+        storage = context.registry.storage
+        storage.set_indexed_fields.assert_called_with('indexed',
+                                                      ('author', 'isbn'))
+        storage.set_unique_fields.assert_called_with('indexed', ('isbn',))
+
+    @mock.patch('cliquet.resource.Service')
+    def test_fields_are_declared_for_the_collection_of_the_resource(self,
+                                                                    service):
+        class IndexedSchema(ResourceSchema):
+            class Options:
+                indexed_fields = ('author',)
+
+        class Indexed(BaseResource):
+            mapping = IndexedSchema()
+
+            @classmethod
+            def get_collection_id(cls):
+                return 'books'
+
+        venusian_callback = register_resource(Indexed, viewset=self.viewset)
+
+        context = mock.MagicMock()
+        context.config.with_package.return_value = context
+        venusian_callback(context, None, None)
+
+        storage = context.registry.storage
+        storage.set_indexed_fields.assert_called_with('books', ('author',))
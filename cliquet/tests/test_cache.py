@@ -154,6 +154,21 @@ class RedisCacheTest(BaseTestCache, unittest.TestCase):
             side_effect=redis.RedisError)
 
 
+class RedisMsgpackCacheTest(RedisCacheTest, unittest.TestCase):
+    settings = {
+        'cliquet.cache_url': '',
+        'cliquet.cache_pool_size': 10,
+        'cliquet.cache_codec': 'msgpack',
+        'cliquet.cache_compression_threshold': 64
+    }
+
+    def test_values_are_compressed_above_threshold(self):
+        self.cache.set('foobar', 'a' * 200)
+        encoded = self.cache._client.get('foobar')
+        self.assertLess(len(encoded), 200)
+        self.assertEqual(self.cache.get('foobar'), 'a' * 200)
+
+
 class PostgreSQLCacheTest(BaseTestCache, unittest.TestCase):
     backend = postgresql_backend
     settings = {
@@ -164,7 +179,14 @@ class PostgreSQLCacheTest(BaseTestCache, unittest.TestCase):
 
     def __init__(self, *args, **kwargs):
         super(PostgreSQLCacheTest, self).__init__(*args, **kwargs)
+        # Each test instance has its own pool: do not keep idle
+        # connections opened between tests.
+        self.cache.pool.closeall()
         self.client_error_patcher = mock.patch.object(
             self.cache.pool,
             'getconn',
             side_effect=psycopg2.DatabaseError)
+
+    def tearDown(self):
+        super(PostgreSQLCacheTest, self).tearDown()
+        self.cache.pool.closeall()
@@ -172,6 +172,14 @@ class StatsDConfigurationTest(unittest.TestCase):
         c = initialization.setup_statsd(self.config)
         c.watch_execution_time.assert_any_call({}, prefix='storage')
 
+    @mock.patch('cliquet.statsd.Client')
+    def test_statsd_is_given_to_backends_with_pools(self, mocked):
+        backend = mock.MagicMock(statsd=None)
+        self.config.registry.permission = backend
+        c = initialization.setup_statsd(self.config)
+        self.assertEqual(backend.statsd, c)
+        self.assertEqual(backend.statsd_prefix, 'permission')
+
     @mock.patch('cliquet.statsd.Client')
     def test_statsd_is_set_on_authentication(self, mocked):
         c = initialization.setup_statsd(self.config)
@@ -255,7 +255,14 @@ class PostgreSQLPermissionTest(BaseTestPermission, unittest.TestCase):
 
     def __init__(self, *args, **kwargs):
         super(PostgreSQLPermissionTest, self).__init__(*args, **kwargs)
+        # Each test instance has its own pool: do not keep idle
+        # connections opened between tests.
+        self.permission.pool.closeall()
         self.client_error_patcher = [mock.patch.object(
             self.permission.pool,
             'getconn',
             side_effect=psycopg2.DatabaseError)]
+
+    def tearDown(self):
+        super(PostgreSQLPermissionTest, self).tearDown()
+        self.permission.pool.closeall()
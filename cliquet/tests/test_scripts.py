@@ -15,3 +15,29 @@ class InitSchemaTest(unittest.TestCase):
                 cliquet_script.main()
                 self.assertTrue(fakeregistry.storage.initialize_schema.called)
                 self.assertTrue(fakeregistry.cache.initialize_schema.called)
+
+
+class PurgeTombstonesTest(unittest.TestCase):
+    def run_command(self, settings):
+        fakeregistry = mock.MagicMock(settings=settings)
+        with mock.patch('cliquet.scripts.cliquet.bootstrap') as mocked:
+            mocked.return_value = {'registry': fakeregistry}
+            with mock.patch('cliquet.scripts.cliquet.sys') as sys_mocked:
+                sys_mocked.argv = ['prog', '--ini', 'foo.ini',
+                                   'purge-tombstones']
+                result = cliquet_script.main()
+        return fakeregistry.storage, result
+
+    def test_tombstones_older_than_retention_are_purged(self):
+        settings = {'cliquet.storage_tombstones_retention': '3600'}
+        with mock.patch('cliquet.scripts.cliquet.msec_time',
+                        return_value=10000000):
+            storage, _ = self.run_command(settings)
+        storage.purge_deleted.assert_called_with(collection_id=None,
+                                                 parent_id=None,
+                                                 before=6400000)
+
+    def test_nothing_is_purged_without_retention(self):
+        storage, result = self.run_command({})
+        self.assertFalse(storage.purge_deleted.called)
+        self.assertEqual(result, 1)
@@ -0,0 +1,70 @@
+import mock
+
+from cliquet import serializers
+
+from .support import unittest
+
+
+class SerializerTest(unittest.TestCase):
+    def setUp(self):
+        self.value = {'id': 'abc', 'numbers': [1, 2.5], 'empty': {},
+                      'text': u'été'}
+
+    def test_json_is_used_by_default(self):
+        serializer = serializers.Serializer()
+        encoded = serializer.dumps(self.value)
+        self.assertEqual(encoded[:1], b'{')
+        self.assertEqual(serializer.loads(encoded), self.value)
+
+    def test_msgpack_values_start_with_marker(self):
+        serializer = serializers.Serializer(codec='msgpack')
+        encoded = serializer.dumps(self.value)
+        self.assertEqual(encoded[:1], serializers.MSGPACK_MARKER)
+        self.assertEqual(serializer.loads(encoded), self.value)
+
+    def test_unknown_codec_raises_value_error(self):
+        self.assertRaises(ValueError, serializers.Serializer, codec='xml')
+
+    def test_values_are_decoded_whatever_the_configured_codec(self):
+        as_json = serializers.Serializer().dumps(self.value)
+        as_msgpack = serializers.Serializer(codec='msgpack').dumps(self.value)
+        self.assertEqual(serializers.Serializer(codec='msgpack').loads(
+            as_json), self.value)
+        self.assertEqual(serializers.Serializer().loads(as_msgpack),
+                         self.value)
+
+    def test_values_are_compressed_above_threshold(self):
+        serializer = serializers.Serializer(compression_threshold=50)
+        small = serializer.dumps({'a': 1})
+        self.assertEqual(small[:1], b'{')
+        large = serializer.dumps({'a': 'b' * 100})
+        self.assertEqual(large[:1], serializers.COMPRESSED_MARKER)
+        self.assertEqual(serializer.loads(large), {'a': 'b' * 100})
+
+    def test_values_are_not_compressed_if_not_smaller(self):
+        serializer = serializers.Serializer(compression_threshold=0)
+        with mock.patch('cliquet.serializers.zlib.compress',
+                        return_value=b'x' * 100):
+            encoded = serializer.dumps({'a': 1})
+        self.assertEqual(encoded[:1], b'{')
+
+    def test_stamped_records_are_decoded_with_their_timestamp(self):
+        serializer = serializers.Serializer(codec='msgpack',
+                                            compression_threshold=0)
+        encoded = serializer.dumps(self.value)
+        stamped = (serializers.STAMPED_MARKER + b'1234:"last_modified"\n' +
+                   encoded)
+        expected = dict(self.value, last_modified=1234)
+        self.assertEqual(serializer.loads(stamped), expected)
+
+    def test_serializer_is_loaded_from_settings(self):
+        settings = {'cliquet.cache_codec': 'msgpack',
+                    'cliquet.cache_compression_threshold': '1024'}
+        serializer = serializers.load_from_settings(settings, 'cliquet.cache')
+        self.assertTrue(isinstance(serializer.codec,
+                                   serializers.MsgpackCodec))
+        self.assertEqual(serializer.compression_threshold, 1024)
+
+        serializer = serializers.load_from_settings({}, 'cliquet.cache')
+        self.assertTrue(isinstance(serializer.codec, serializers.JSONCodec))
+        self.assertIsNone(serializer.compression_threshold)
@@ -51,6 +51,16 @@ class StatsdClientTest(unittest.TestCase):
             self.client.count('click', unique='menu')
             mocked_client.set.assert_called_with('click', 'menu')
 
+    def test_gauge_sets_the_value_of_key(self):
+        with mock.patch.object(self.client, '_client') as mocked_client:
+            self.client.gauge('pool.idle', 3)
+            mocked_client.gauge.assert_called_with('pool.idle', 3)
+
+    def test_timing_records_the_duration_of_key(self):
+        with mock.patch.object(self.client, '_client') as mocked_client:
+            self.client.timing('pool.checkout', 12.5)
+            mocked_client.timing.assert_called_with('pool.checkout', 12.5)
+
     @mock.patch('cliquet.statsd.statsd_module')
     def test_load_from_config(self, module_mock):
         config = testing.setUp()
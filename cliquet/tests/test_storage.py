@@ -1,15 +1,22 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
 import time
 
 import mock
 import redis
 
 from cliquet.utils import psycopg2
-from cliquet import utils
+from cliquet import serializers, utils
+from cliquet.storage import columnar, persistence
 from cliquet.storage import (
     exceptions, Filter, generators, memory,
     redis as redisbackend, postgresql,
     Sort, StorageBase
 )
+from cliquet.storage.postgresql.pool import ConnectionPool, PoolTimeout
 
 from .support import unittest, ThreadMixin, DummyRequest, skip_if_travis
 
@@ -51,11 +58,18 @@ class StorageBaseTest(unittest.TestCase):
             (self.storage.update, '', '', '', {}),
             (self.storage.delete, '', '', ''),
             (self.storage.delete_all, '', ''),
+            (self.storage.purge_deleted, '', ''),
             (self.storage.get_all, '', ''),
         ]
         for call in calls:
             self.assertRaises(NotImplementedError, *call)
 
+    def test_indexed_fields_declaration_is_optional(self):
+        self.storage.set_indexed_fields('', ('phone',))  # not raising
+
+    def test_unique_fields_declaration_is_optional(self):
+        self.storage.set_unique_fields('', ('phone',))  # not raising
+
     def test_backend_error_message_provides_given_message_if_defined(self):
         error = exceptions.BackendError(message="Connection Error")
         self.assertEqual(str(error), "Connection Error")
@@ -452,6 +466,19 @@ class FieldsUnicityTest(object):
                           unique_fields=('phone',),
                           **self.storage_kw)
 
+    def test_updating_does_not_write_if_unicity_error_raised(self):
+        self.create_record({'phone': 'number'})
+        self.assertRaises(exceptions.UnicityError,
+                          self.storage.update,
+                          object_id=RECORD_ID,
+                          record={'phone': 'number'},
+                          unique_fields=('phone',),
+                          **self.storage_kw)
+        self.assertRaises(exceptions.RecordNotFoundError,
+                          self.storage.get,
+                          object_id=RECORD_ID,
+                          **self.storage_kw)
+
     def test_unicity_detection_supports_special_characters(self):
         record = self.create_record()
         values = ['b', 'http://moz.org', u"#131 \u2014 ujson",
@@ -483,6 +510,65 @@ class DeletedRecordsTest(object):
         record = self.create_record(record)
         return self.storage.delete(object_id=record['id'], **self.storage_kw)
 
+    def get_tombstones(self, **kwargs):
+        kw = dict(self.storage_kw, **kwargs)
+        records, _ = self.storage.get_all(include_deleted=True, **kw)
+        return [r for r in records if r.get('deleted')]
+
+    def test_purge_deleted_removes_tombstones_older_than_timestamp(self):
+        self.create_and_delete_record()
+        kept = self.create_and_delete_record()
+        self.create_record()
+        purged = self.storage.purge_deleted(before=kept['last_modified'],
+                                            **self.storage_kw)
+        self.assertEqual(purged, 1)
+        self.assertEqual(self.get_tombstones(), [kept])
+
+    def test_purge_deleted_removes_all_tombstones_by_default(self):
+        self.create_and_delete_record()
+        self.create_and_delete_record()
+        self.create_record()
+        purged = self.storage.purge_deleted(**self.storage_kw)
+        self.assertEqual(purged, 2)
+        self.assertEqual(self.get_tombstones(), [])
+
+    def test_purge_deleted_is_by_parent_id(self):
+        self.create_and_delete_record()
+        self.create_record()
+        other = self.create_record(parent_id=self.other_parent_id,
+                                   auth=self.other_auth)
+        self.storage.delete(object_id=other['id'],
+                            parent_id=self.other_parent_id,
+                            collection_id='test',
+                            auth=self.other_auth)
+        self.create_record(parent_id=self.other_parent_id,
+                           auth=self.other_auth)
+        self.storage.purge_deleted(**self.storage_kw)
+        tombstones = self.get_tombstones(parent_id=self.other_parent_id,
+                                         auth=self.other_auth)
+        self.assertEqual(len(tombstones), 1)
+
+    def test_purge_deleted_applies_to_every_collection_if_unspecified(self):
+        for parent_id in ('1234', self.other_parent_id):
+            record = self.create_record(parent_id=parent_id)
+            self.storage.delete(object_id=record['id'], parent_id=parent_id,
+                                collection_id='test')
+            self.create_record(parent_id=parent_id)
+        purged = self.storage.purge_deleted(collection_id=None,
+                                            parent_id=None)
+        self.assertEqual(purged, 2)
+        self.assertEqual(self.get_tombstones(), [])
+        self.assertEqual(self.get_tombstones(parent_id=self.other_parent_id),
+                         [])
+
+    def test_purge_deleted_does_not_change_collection_timestamp(self):
+        self.create_record()
+        self.create_and_delete_record()
+        timestamp = self.storage.collection_timestamp(**self.storage_kw)
+        self.storage.purge_deleted(**self.storage_kw)
+        self.assertEqual(
+            self.storage.collection_timestamp(**self.storage_kw), timestamp)
+
     def test_get_should_not_return_deleted_items(self):
         record = self.create_and_delete_record()
         self.assertRaises(exceptions.RecordNotFoundError,
@@ -797,6 +883,690 @@ class MemoryStorageTest(StorageTest, unittest.TestCase):
     def test_backenderror_message_default_to_original_exception_message(self):
         pass
 
+    def test_get_all_selects_first_records_without_full_sort(self):
+        for x in range(10):
+            self.create_record({'number': x % 4})
+        sorting = [Sort('number', -1), Sort('last_modified', 1)]
+        with mock.patch('cliquet.storage.memory.heapq.nsmallest',
+                        wraps=memory.heapq.nsmallest) as mocked:
+            records, total_records = self.storage.get_all(sorting=sorting,
+                                                          limit=3,
+                                                          **self.storage_kw)
+        self.assertTrue(mocked.called)
+        self.assertEqual(total_records, 10)
+        self.assertEqual([r['number'] for r in records], [3, 3, 2])
+        self.assertTrue(records[0]['last_modified'] <
+                        records[1]['last_modified'])
+
+    def test_flush_keeps_the_buckets_locks(self):
+        self.create_record()
+        lock = self.storage._bucket_lock('test', '1234')
+        self.storage.flush()
+        self.assertIs(self.storage._bucket_lock('test', '1234'), lock)
+
+    def test_flush_waits_for_operations_in_progress(self):
+        self.create_record()
+        lock = self.storage._bucket_lock('test', '1234')
+        flushed = threading.Event()
+
+        def flush():
+            self.storage.flush()
+            flushed.set()
+
+        with lock:
+            thread = self._create_thread(target=flush)
+            thread.start()
+            self.assertFalse(flushed.wait(0.05))
+            self.create_record()
+        thread.join()
+        records, count = self.storage.get_all(**self.storage_kw)
+        self.assertEqual(count, 0)
+
+    def test_concurrent_writes_keep_timestamps_and_tombstones(self):
+        obtained = []
+
+        def write(parent_id):
+            timestamps = []
+            kw = dict(collection_id='test', parent_id=parent_id)
+            for i in range(100):
+                record = self.storage.create(record={'number': i}, **kw)
+                timestamps.append(record['last_modified'])
+                if i % 2 == 0:
+                    tombstone = self.storage.delete(object_id=record['id'],
+                                                    **kw)
+                    timestamps.append(tombstone['last_modified'])
+                self.storage.get_all(sorting=[Sort('number', -1)],
+                                     limit=5, **kw)
+            obtained.append((parent_id, timestamps))
+
+        threads = [self._create_thread(target=write, args=(parent_id,))
+                   for parent_id in ['a', 'a', 'a', 'b', 'b', 'c']]
+        msec_time = utils.msec_time
+
+        def yielding_msec_time():
+            # Let other threads run while the timestamp is being bumped.
+            time.sleep(0)
+            return msec_time()
+
+        with mock.patch('cliquet.utils.msec_time',
+                        side_effect=yielding_msec_time):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        for parent_id, timestamps in obtained:
+            # Timestamps seen by each writer are strictly monotonic.
+            self.assertEqual(timestamps, sorted(set(timestamps)))
+
+        for parent_id, writers in [('a', 3), ('b', 2), ('c', 1)]:
+            merged = [ts for (p, timestamps) in obtained if p == parent_id
+                      for ts in timestamps]
+            # No timestamp was given twice within a collection.
+            self.assertEqual(len(set(merged)), len(merged))
+
+            records, count = self.storage.get_all(collection_id='test',
+                                                  parent_id=parent_id,
+                                                  include_deleted=True)
+            tombstones = [r for r in records if r.get('deleted')]
+            self.assertEqual(len(tombstones), writers * 50)
+            self.assertEqual(count, writers * 50)
+
+    def test_get_all_sorted_descending_selects_first_records(self):
+        for x in range(10):
+            self.create_record({'number': x % 4})
+        sorting = [Sort('number', -1), Sort('last_modified', -1)]
+        with mock.patch('cliquet.storage.memory.heapq.nlargest',
+                        wraps=memory.heapq.nlargest) as mocked:
+            records, _ = self.storage.get_all(sorting=sorting, limit=3,
+                                              **self.storage_kw)
+        self.assertTrue(mocked.called)
+        self.assertEqual([r['number'] for r in records], [3, 3, 2])
+        self.assertTrue(records[0]['last_modified'] >
+                        records[1]['last_modified'])
+
+    def test_compiled_plans_are_reused_across_queries(self):
+        self.create_record({'number': 2})
+        memory.compile_filters_plan.cache.clear()
+        memory.compile_sorting_plan.cache.clear()
+        sorting = [Sort('number', 1)]
+        for value in range(3):
+            filters = [Filter('number', value, utils.COMPARISON.MIN),
+                       Filter('status', 'done', utils.COMPARISON.NOT)]
+            self.storage.get_all(filters=filters, sorting=sorting,
+                                 **self.storage_kw)
+        self.assertEqual(len(memory.compile_filters_plan.cache), 1)
+        self.assertEqual(len(memory.compile_sorting_plan.cache), 1)
+
+    def test_compiled_plans_cache_is_bounded(self):
+        compiled = []
+
+        @memory.memoize(maxsize=2)
+        def compile_plan(signature):
+            compiled.append(signature)
+            return signature
+
+        for signature in ['a', 'b', 'a', 'c', 'b', 'a']:
+            compile_plan(signature)
+        self.assertEqual(compiled, ['a', 'b', 'c', 'b', 'a'])
+        self.assertEqual(list(compile_plan.cache.keys()),
+                         [('b',), ('a',)])
+
+
+class TimelineTest(unittest.TestCase):
+    def setUp(self):
+        self.timeline = memory.Timeline()
+        for _id, timestamp in [('a', 1), ('b', 3), ('c', 3), ('d', 5)]:
+            self.timeline.add(_id, timestamp)
+
+    def test_entries_are_kept_ordered_by_timestamp(self):
+        self.timeline.add('e', 2)
+        self.timeline.add('a', 4)
+        self.assertEqual(len(self.timeline), 5)
+        self.assertEqual(self.timeline.slice(),
+                         [(2, 'e'), (3, 'b'), (3, 'c'), (4, 'a'), (5, 'd')])
+
+    def test_entries_with_same_timestamp_can_be_discarded(self):
+        self.timeline.discard('c')
+        self.timeline.discard('unknown')
+        self.assertEqual(self.timeline.slice(lower=3, upper=3),
+                         [(3, 'b')])
+
+    def test_slice_can_be_reversed_and_limited(self):
+        self.assertEqual(self.timeline.slice(lower=2, reverse=True,
+                                             limit=2),
+                         [(5, 'd'), (3, 'c')])
+        self.assertEqual(self.timeline.count(lower=2, upper=4), 2)
+
+    def test_ids_can_be_ordered_by_timestamp(self):
+        self.assertEqual(self.timeline.ordered(set(['d', 'c', 'b', 'z'])),
+                         ['b', 'c', 'd'])
+
+
+class SelectionTest(unittest.TestCase):
+    def setUp(self):
+        self.records = [{'id': i, 'age': (i * 7) % 5} for i in range(20)]
+        self.sorting = [Sort('age', -1)]
+
+    def test_selection_is_the_same_as_sorting_the_whole_stream(self):
+        selection = memory.Selection(self.sorting, limit=3)
+        for record in self.records:
+            selection.add(record)
+        self.assertEqual(selection.records(),
+                         memory.apply_sorting(self.records, self.sorting, 3))
+
+    def test_buffer_is_bounded_by_the_limit(self):
+        selection = memory.Selection(self.sorting, limit=3)
+        for record in self.records:
+            selection.add(record)
+            self.assertTrue(len(selection._buffer) < 6)
+
+    def test_missing_values_are_those_of_the_first_record(self):
+        selection = memory.Selection([Sort('age', 1)], limit=1)
+        for record in [{'id': 'a', 'age': 2}, {'id': 'b', 'age': 3},
+                       {'id': 'c', 'age': 1}, {'id': 'd'}]:
+            selection.add(record)
+        self.assertEqual([r['id'] for r in selection.records()], ['c'])
+
+
+class MemoryIndexedStorageTest(MemoryStorageTest, unittest.TestCase):
+    def setUp(self):
+        super(MemoryIndexedStorageTest, self).setUp()
+        self.storage.set_indexed_fields('test', ('phone', 'line', 'status',
+                                                 'number', 'foo'))
+
+    def test_records_created_before_declaration_are_indexed(self):
+        self.create_record({'flavor': 'strawberry'})
+        self.storage.set_indexed_fields('test', ('flavor',))
+        filters = [Filter('flavor', 'strawberry', utils.COMPARISON.EQ)]
+        records, count = self.storage.get_all(filters=filters,
+                                              **self.storage_kw)
+        self.assertEqual(count, 1)
+
+    def test_equality_filters_do_not_scan_the_collection(self):
+        for x in range(10):
+            self.create_record({'number': x})
+        filters = [Filter('number', 3, utils.COMPARISON.EQ)]
+        with mock.patch.object(self.storage, 'apply_filters',
+                               wraps=self.storage.apply_filters) as mocked:
+            records, count = self.storage.get_all(filters=filters,
+                                                  **self.storage_kw)
+        self.assertEqual(len(list(mocked.call_args[0][0])), 1)
+        self.assertEqual(records[0]['number'], 3)
+
+    def test_records_of_indexes_are_read_in_timestamp_order(self):
+        created = [self.create_record({'number': 1}) for x in range(20)]
+        filters = [Filter('number', 1, utils.COMPARISON.EQ)]
+        records, _ = self.storage.get_all(filters=filters, **self.storage_kw)
+        self.assertEqual(records, created)
+
+    def test_exclusion_filters_use_the_index(self):
+        for x in range(10):
+            self.create_record({'number': x % 2})
+        filters = [Filter('number', 1, utils.COMPARISON.NOT)]
+        records, count = self.storage.get_all(filters=filters,
+                                              **self.storage_kw)
+        self.assertEqual(count, 5)
+
+    def test_index_is_updated_when_records_are_modified(self):
+        record = self.create_record({'status': 1})
+        self.storage.update(object_id=record['id'], record={'status': 2},
+                            **self.storage_kw)
+        filters = [Filter('status', 1, utils.COMPARISON.EQ)]
+        _, count = self.storage.get_all(filters=filters, **self.storage_kw)
+        self.assertEqual(count, 0)
+        filters = [Filter('status', 2, utils.COMPARISON.EQ)]
+        _, count = self.storage.get_all(filters=filters, **self.storage_kw)
+        self.assertEqual(count, 1)
+
+    def test_index_is_updated_when_records_are_deleted(self):
+        record = self.create_record({'status': 1})
+        self.storage.delete(object_id=record['id'], **self.storage_kw)
+        filters = [Filter('status', 1, utils.COMPARISON.EQ)]
+        _, count = self.storage.get_all(filters=filters, **self.storage_kw)
+        self.assertEqual(count, 0)
+
+    def test_sync_queries_do_not_scan_the_collection(self):
+        created = [self.create_record() for i in range(10)]
+        filters = [Filter('last_modified', created[-2]['last_modified'],
+                          utils.COMPARISON.MIN)]
+        sorting = [Sort('last_modified', -1)]
+        with mock.patch.object(self.storage, 'apply_filters') as mocked:
+            records, count = self.storage.get_all(filters=filters,
+                                                  sorting=sorting,
+                                                  include_deleted=True,
+                                                  **self.storage_kw)
+        self.assertFalse(mocked.called)
+        self.assertEqual(count, 2)
+        self.assertEqual(records[0], created[-1])
+
+    def test_sync_queries_with_empty_page_return_whole_set(self):
+        created = [self.create_record() for i in range(3)]
+        filters = [Filter('last_modified', created[0]['last_modified'],
+                          utils.COMPARISON.MIN)]
+        rules = [[Filter('last_modified', created[0]['last_modified'],
+                         utils.COMPARISON.LT)]]
+        records, count = self.storage.get_all(filters=filters,
+                                              pagination_rules=rules,
+                                              include_deleted=True,
+                                              **self.storage_kw)
+        self.assertEqual(count, 3)
+        self.assertEqual(len(records), 3)
+
+    def test_exact_timestamp_filters_are_not_answered_by_timelines(self):
+        created = [self.create_record() for i in range(3)]
+        filters = [Filter('last_modified', created[1]['last_modified'],
+                          utils.COMPARISON.EQ)]
+        records, count = self.storage.get_all(filters=filters,
+                                              **self.storage_kw)
+        self.assertEqual(records, [created[1]])
+
+    def test_recreated_records_are_listed_alike_with_or_without_timeline(self):
+        record = self.create_record({'status': 1})
+        self.storage.delete(object_id=record['id'], **self.storage_kw)
+        self.create_record({'id': record['id'], 'status': 1})
+        since = [Filter('last_modified', 0, utils.COMPARISON.GT)]
+        # The exclusion filter cannot be answered from the timelines.
+        excluded = [Filter('status', 2, utils.COMPARISON.NOT)]
+        listed = []
+        for filters in (since, since + excluded):
+            records, _ = self.storage.get_all(filters=filters,
+                                              sorting=[Sort('last_modified',
+                                                            -1)],
+                                              include_deleted=True,
+                                              **self.storage_kw)
+            listed.append(records)
+        self.assertEqual(len(listed[0]), 2)
+        self.assertEqual(listed[0], listed[1])
+
+    def test_unhashable_values_are_not_indexed(self):
+        self.create_record({'status': [1, 2]})
+        filters = [Filter('status', [1, 2], utils.COMPARISON.EQ)]
+        _, count = self.storage.get_all(filters=filters, **self.storage_kw)
+        self.assertEqual(count, 1)
+
+
+@unittest.skipIf(columnar.numpy is None, "NumPy is not installed.")
+class UniqueIndexTest(object):
+    def setUp(self):
+        super(UniqueIndexTest, self).setUp()
+        self.storage.set_unique_fields('test', ('phone', 'line'))
+
+    def test_unicity_checks_do_not_scan_the_collection(self):
+        for x in range(10):
+            self.create_record({'phone': str(x)})
+        record = self.create_record({'phone': 'abc'})
+        with mock.patch.object(self.storage, 'get_all') as mocked:
+            self.assertRaises(exceptions.UnicityError,
+                              self.create_record,
+                              {'phone': '3'},
+                              unique_fields=('phone',))
+            self.storage.update(object_id=record['id'],
+                                record={'phone': 'abc'},
+                                unique_fields=('phone',),
+                                **self.storage_kw)
+        self.assertFalse(mocked.called)
+
+    def test_unicity_checks_of_undeclared_fields_scan_the_collection(self):
+        self.create_record({'flavor': 'vanilla'})
+        with mock.patch.object(self.storage, 'get_all',
+                               wraps=self.storage.get_all) as mocked:
+            self.assertRaises(exceptions.UnicityError,
+                              self.create_record,
+                              {'flavor': 'vanilla'},
+                              unique_fields=('flavor',))
+        self.assertTrue(mocked.called)
+
+    def test_unique_values_are_released_by_updates_and_deletions(self):
+        record = self.create_record({'phone': 'abc', 'line': 'def'})
+        self.storage.update(object_id=record['id'], record={'line': 'def'},
+                            **self.storage_kw)
+        self.create_record({'phone': 'abc'}, unique_fields=('phone',))
+        self.storage.delete(object_id=record['id'], **self.storage_kw)
+        self.create_record({'line': 'def'}, unique_fields=('line',))
+
+    def test_unique_values_are_compared_like_filters(self):
+        self.create_record({'phone': 12})
+        self.assertRaises(exceptions.UnicityError,
+                          self.create_record,
+                          {'phone': 12.0},
+                          unique_fields=('phone',))
+
+
+class MemoryUniqueStorageTest(UniqueIndexTest, MemoryStorageTest,
+                              unittest.TestCase):
+    pass
+
+
+class MemoryColumnarStorageTest(MemoryIndexedStorageTest, unittest.TestCase):
+    settings = {
+        'cliquet.storage_columnar': 'true'
+    }
+
+    def get_all_vectorized(self, **kwargs):
+        kwargs.update(self.storage_kw)
+        with mock.patch.object(self.storage, 'extract_record_set',
+                               wraps=self.storage.extract_record_set) as m:
+            result = self.storage.get_all(**kwargs)
+        self.assertFalse(m.called)
+        return result
+
+    def test_equality_filters_do_not_scan_the_collection(self):
+        for x in range(10):
+            self.create_record({'number': x})
+        filters = [Filter('number', 3, utils.COMPARISON.EQ)]
+        records, count = self.get_all_vectorized(filters=filters)
+        self.assertEqual(records[0]['number'], 3)
+
+    def test_get_all_selects_first_records_without_full_sort(self):
+        for x in range(10):
+            self.create_record({'number': x % 4})
+        sorting = [Sort('number', -1), Sort('last_modified', 1)]
+        with mock.patch('cliquet.storage.columnar.numpy.partition',
+                        wraps=columnar.numpy.partition) as mocked:
+            records, _ = self.get_all_vectorized(sorting=sorting, limit=3)
+        self.assertTrue(mocked.called)
+        self.assertEqual([r['number'] for r in records], [3, 3, 2])
+        self.assertTrue(records[0]['last_modified'] <
+                        records[1]['last_modified'])
+
+    def test_get_all_sorted_descending_selects_first_records(self):
+        for x in range(10):
+            self.create_record({'number': x % 4})
+        sorting = [Sort('number', -1), Sort('last_modified', -1)]
+        records, _ = self.get_all_vectorized(sorting=sorting, limit=3)
+        self.assertEqual([r['number'] for r in records], [3, 3, 2])
+        self.assertTrue(records[0]['last_modified'] >
+                        records[1]['last_modified'])
+
+    def test_filters_sorting_and_pagination_are_vectorized(self):
+        for x in range(100):
+            self.create_record({'number': x % 10, 'status': x % 3})
+        filters = [Filter('number', 2, utils.COMPARISON.GT),
+                   Filter('status', 0, utils.COMPARISON.NOT)]
+        sorting = [Sort('number', -1), Sort('status', 1)]
+        rules = [[Filter('number', 8, utils.COMPARISON.LT)],
+                 [Filter('number', 9, utils.COMPARISON.EQ),
+                  Filter('status', 2, utils.COMPARISON.EQ)]]
+        records, count = self.get_all_vectorized(filters=filters,
+                                                 sorting=sorting,
+                                                 pagination_rules=rules,
+                                                 limit=5)
+        self.assertEqual(count, 46)
+        self.assertEqual([(r['number'], r['status']) for r in records],
+                         [(9, 2), (9, 2), (9, 2), (7, 1), (7, 1)])
+
+    def test_empty_page_falls_back_to_filtered_records(self):
+        for x in range(3):
+            self.create_record({'number': x})
+        rules = [[Filter('number', 10, utils.COMPARISON.GT)]]
+        records, count = self.get_all_vectorized(pagination_rules=rules)
+        self.assertEqual(count, 3)
+        self.assertEqual(len(records), 3)
+
+    def test_records_ties_keep_insertion_order(self):
+        created = [self.create_record({'number': x % 2}) for x in range(6)]
+        self.storage.update(object_id=created[0]['id'],
+                            record={'number': 0}, **self.storage_kw)
+        self.storage.delete(object_id=created[2]['id'], **self.storage_kw)
+        recreated = self.create_record({'number': 0})
+        records, _ = self.get_all_vectorized(sorting=[Sort('number', 1)],
+                                             limit=3)
+        self.assertEqual([r['id'] for r in records],
+                         [created[0]['id'], created[4]['id'],
+                          recreated['id']])
+
+    def test_columns_grow_with_the_collection(self):
+        for x in range(200):
+            self.create_record({'number': x})
+        filters = [Filter('number', 150, utils.COMPARISON.MIN)]
+        records, count = self.get_all_vectorized(filters=filters)
+        self.assertEqual(count, 50)
+        self.assertEqual(records[0]['number'], 150)
+
+    def test_mixed_types_fall_back_to_rows(self):
+        self.create_record({'number': 1})
+        self.create_record({'number': 'one'})
+        filters = [Filter('number', 1, utils.COMPARISON.EQ)]
+        with mock.patch.object(self.storage, 'extract_record_set',
+                               wraps=self.storage.extract_record_set) as m:
+            _, count = self.storage.get_all(filters=filters,
+                                            **self.storage_kw)
+        self.assertTrue(m.called)
+        self.assertEqual(count, 1)
+
+    def test_booleans_fall_back_to_rows(self):
+        self.create_record({'number': True})
+        self.create_record({'number': 1})
+        filters = [Filter('number', 1, utils.COMPARISON.EQ)]
+        with mock.patch.object(self.storage, 'extract_record_set',
+                               wraps=self.storage.extract_record_set) as m:
+            _, count = self.storage.get_all(filters=filters,
+                                            **self.storage_kw)
+        self.assertTrue(m.called)
+        self.assertEqual(count, 2)
+
+    def test_missing_values_fall_back_to_rows_when_comparing(self):
+        self.create_record({'number': 2})
+        self.create_record({})
+        filters = [Filter('number', 1, utils.COMPARISON.NOT)]
+        _, count = self.get_all_vectorized(filters=filters)
+        self.assertEqual(count, 2)
+        rules = [[Filter('number', 1, utils.COMPARISON.MAX)]]
+        with mock.patch.object(self.storage, 'extract_record_set') as m:
+            m.return_value = [], 0
+            self.storage.get_all(filters=filters, pagination_rules=rules,
+                                 **self.storage_kw)
+        self.assertTrue(m.called)
+
+    def test_ordering_filters_are_vectorized(self):
+        for x in range(10):
+            self.create_record({'number': x})
+        for operator, expected in [(utils.COMPARISON.LT, 4),
+                                   (utils.COMPARISON.MAX, 5),
+                                   (utils.COMPARISON.MIN, 6),
+                                   (utils.COMPARISON.GT, 5)]:
+            filters = [Filter('number', 4, operator)]
+            _, count = self.get_all_vectorized(filters=filters)
+            self.assertEqual(count, expected)
+
+    def test_missing_values_fall_back_to_rows_when_sorting(self):
+        self.create_record({'number': 2})
+        self.create_record({})
+        self.create_record({'number': 1})
+        with mock.patch.object(self.storage, 'extract_record_set',
+                               wraps=self.storage.extract_record_set) as m:
+            records, _ = self.storage.get_all(sorting=[Sort('number', 1)],
+                                              **self.storage_kw)
+        self.assertTrue(m.called)
+        self.assertEqual(records[0]['number'], 1)
+
+    def test_columns_are_added_for_fields_declared_later(self):
+        self.create_record({'size': 3})
+        self.create_record({'size': 1})
+        self.storage.set_indexed_fields('test', ('size',))
+        records, _ = self.get_all_vectorized(sorting=[Sort('size', 1)])
+        self.assertEqual([r['size'] for r in records], [1, 3])
+
+    def test_tombstones_are_not_vectorized(self):
+        record = self.create_record({'number': 1})
+        self.storage.delete(object_id=record['id'], **self.storage_kw)
+        records, count = self.storage.get_all(include_deleted=True,
+                                              **self.storage_kw)
+        self.assertTrue(records[0]['deleted'])
+
+
+class MemoryPersistentStorageTest(MemoryStorageTest, unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        self.path = tempfile.mkdtemp()
+        self.settings = {
+            'cliquet.storage_persistence_path': self.path,
+            'cliquet.storage_persistence_fsync': 'always'
+        }
+        super(MemoryPersistentStorageTest, self).__init__(*args, **kwargs)
+
+    def tearDown(self):
+        super(MemoryPersistentStorageTest, self).tearDown()
+        self.storage.close()
+        shutil.rmtree(self.path)
+
+    def restart(self, **settings):
+        self.storage.close()
+        self.settings.update(settings)
+        self.storage = self.backend.load_from_config(self._get_config())
+        return self.storage
+
+    def logged_operations(self):
+        filepath = os.path.join(self.path, 'operations.log')
+        with open(filepath) as f:
+            return f.read().splitlines()
+
+    def test_records_and_tombstones_are_recovered_after_restart(self):
+        self.storage.set_indexed_fields('test', ('number',))
+        kept = self.create_record({'number': 1})
+        deleted = self.create_record({'number': 2})
+        self.storage.delete(object_id=deleted['id'], **self.storage_kw)
+        timestamp = self.storage.collection_timestamp(**self.storage_kw)
+
+        # Replay operations, then load the snapshot of the first restart.
+        self.restart()
+        storage = self.restart()
+        storage.set_indexed_fields('test', ('number',))
+        records, count = storage.get_all(include_deleted=True,
+                                         **self.storage_kw)
+        self.assertEqual(records[0], kept)
+        self.assertTrue(records[1]['deleted'])
+        self.assertEqual(
+            storage.collection_timestamp(**self.storage_kw), timestamp)
+        filters = [Filter('number', 1, utils.COMPARISON.EQ)]
+        records, count = storage.get_all(filters=filters, **self.storage_kw)
+        self.assertEqual(records, [kept])
+
+    def test_operations_are_replayed_after_the_snapshot(self):
+        before = self.create_record()
+        self.storage._persistence.snapshot(self.storage._dump)
+        after = self.create_record()
+        self.storage.delete(object_id=before['id'], **self.storage_kw)
+        self.assertEqual(len(self.logged_operations()), 2)
+
+        storage = self.restart()
+        records, count = storage.get_all(**self.storage_kw)
+        self.assertEqual(records, [after])
+
+    def test_purges_are_replayed_after_restart(self):
+        self.create_and_delete_record()
+        kept = self.create_and_delete_record()
+        self.storage.purge_deleted(before=kept['last_modified'],
+                                   **self.storage_kw)
+        self.assertEqual(len(self.logged_operations()), 5)
+
+        self.restart()
+        self.assertEqual(self.get_tombstones(), [kept])
+
+    def test_recovery_starts_from_a_new_snapshot(self):
+        self.create_record()
+        self.restart()
+        self.assertEqual(self.logged_operations(), [])
+        with open(os.path.join(self.path, 'snapshot.json')) as f:
+            snapshot = utils.json.loads(f.read())
+        self.assertEqual(len(snapshot['buckets'][0]['records']), 1)
+
+    def test_interrupted_snapshot_is_recovered(self):
+        first = self.create_record()
+        os.rename(os.path.join(self.path, 'operations.log'),
+                  os.path.join(self.path, 'operations.log.1'))
+        self.storage._persistence._log = None
+        second = self.create_record()
+
+        storage = self.restart()
+        records, count = storage.get_all(**self.storage_kw)
+        self.assertEqual(records, [first, second])
+        self.assertFalse(os.path.exists(os.path.join(self.path,
+                                                     'operations.log.1')))
+
+    def test_truncated_last_operation_is_ignored(self):
+        record = self.create_record()
+        with open(os.path.join(self.path, 'operations.log'), 'a') as f:
+            f.write('["put", "test", "1234", "abc", {"id": ')
+
+        storage = self.restart()
+        records, count = storage.get_all(**self.storage_kw)
+        self.assertEqual(records, [record])
+
+    def test_corrupted_operations_log_is_not_ignored(self):
+        with open(os.path.join(self.path, 'operations.log'), 'a') as f:
+            f.write('["put", "test", \n\n')
+        self.assertRaises(ValueError, self.restart)
+
+    def test_flush_removes_persisted_records(self):
+        self.create_record()
+        self.storage._persistence.snapshot(self.storage._dump)
+        self.storage.flush()
+        storage = self.restart()
+        _, count = storage.get_all(**self.storage_kw)
+        self.assertEqual(count, 0)
+
+    def test_fsync_is_called_on_each_operation_with_always_policy(self):
+        with mock.patch('cliquet.storage.persistence.os.fsync') as mocked:
+            self.create_record()
+            self.create_record()
+        self.assertEqual(mocked.call_count, 2)
+
+    def test_fsync_is_batched_with_batch_policy(self):
+        storage = self.restart(**{
+            'cliquet.storage_persistence_fsync': 'batch',
+            'cliquet.storage_persistence_fsync_interval': 3600})
+        with mock.patch('cliquet.storage.persistence.os.fsync') as mocked:
+            self.create_record()
+            self.create_record()
+            self.assertEqual(mocked.call_count, 0)
+            storage._persistence.tick(storage._dump)
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(len(self.logged_operations()), 2)
+
+    def test_pending_operations_are_flushed_at_exit(self):
+        with mock.patch('cliquet.storage.memory.atexit.register') as mocked:
+            storage = self.restart(**{
+                'cliquet.storage_persistence_fsync': 'batch',
+                'cliquet.storage_persistence_fsync_interval': 3600})
+        record = self.create_record()
+        # Interpreter exit, without explicit sync().
+        on_exit = mocked.call_args[0][0]
+        on_exit()
+        self.assertIsNone(storage._persistence._log)
+        self.assertEqual(len(self.logged_operations()), 1)
+        self.storage = self.backend.load_from_config(self._get_config())
+        self.assertEqual(self.storage.get(object_id=record['id'],
+                                          **self.storage_kw), record)
+
+    def test_fsync_is_never_called_with_never_policy(self):
+        storage = self.restart(**{
+            'cliquet.storage_persistence_fsync': 'never',
+            'cliquet.storage_persistence_fsync_interval': 3600})
+        with mock.patch('cliquet.storage.persistence.os.fsync') as mocked:
+            self.create_record()
+            storage._persistence.tick(storage._dump)
+        self.assertEqual(mocked.call_count, 0)
+        self.assertEqual(len(self.logged_operations()), 1)
+
+    def test_snapshots_are_taken_periodically(self):
+        storage = self.restart(**{
+            'cliquet.storage_persistence_fsync_interval': 0.01,
+            'cliquet.storage_persistence_snapshot_interval': 0})
+        self.create_record()
+        time.sleep(0.1)
+        storage._persistence.close()
+        self.assertEqual(self.logged_operations(), [])
+
+    def test_persistence_folder_is_created(self):
+        path = os.path.join(self.path, 'sub', 'folder')
+        persistence.Persistence(path)
+        self.assertTrue(os.path.isdir(path))
+
+    def test_unknown_fsync_policy_is_refused(self):
+        self.assertRaises(ValueError, persistence.Persistence, self.path,
+                          fsync='sometimes')
+
 
 class RedisStorageTest(MemoryStorageTest, unittest.TestCase):
     backend = redisbackend
@@ -823,16 +1593,728 @@ class RedisStorageTest(MemoryStorageTest, unittest.TestCase):
                                side_effect=redis.RedisError):
             StorageTest.test_backend_error_is_raised_anywhere(self)
 
+    def test_flush_keeps_the_buckets_locks(self):
+        # Redis has no buckets locks.
+        pass
+
+    def test_flush_waits_for_operations_in_progress(self):
+        pass
+
     def test_get_all_handle_expired_values(self):
         record = '{"id": "foo"}'.encode('utf-8')
         mocked_smember = mock.patch.object(self.storage._client, "smembers",
-                                           return_value=['a', 'b'])
+                                           return_value=[b'a', b'b'])
         mocked_mget = mock.patch.object(self.storage._client, "mget",
                                         return_value=[record, None])
         with mocked_smember:
             with mocked_mget:
                 self.storage.get_all(**self.storage_kw)  # not raising
 
+    def test_get_all_handle_expired_values_in_timeline(self):
+        self.create_record()
+        self.create_record()
+        record = '{"id": "foo"}'.encode('utf-8')
+        with mock.patch.object(self.storage._client, "mget",
+                               return_value=[record, None]):
+            records, _ = self.storage.get_all(**self.storage_kw)
+        self.assertEqual(len(records), 1)
+
+    def test_timeline_is_rebuilt_if_incomplete(self):
+        before = self.create_record()
+        self.storage._client.delete('test.1234.records.timeline')
+        self.create_record()
+        filters = [Filter('last_modified', before['last_modified'] - 1,
+                          utils.COMPARISON.GT)]
+        records, count = self.storage.get_all(filters=filters,
+                                              **self.storage_kw)
+        self.assertEqual(count, 2)
+        timeline = self.storage._client.zcard('test.1234.records.timeline')
+        self.assertEqual(timeline, 2)
+
+    def test_deleted_timeline_is_rebuilt_if_incomplete(self):
+        before = self.create_record()
+        self.storage.delete(object_id=before['id'], **self.storage_kw)
+        self.storage._client.delete('test.1234.deleted.timeline')
+        filters = [Filter('last_modified', before['last_modified'],
+                          utils.COMPARISON.MIN)]
+        records, count = self.storage.get_all(filters=filters,
+                                              include_deleted=True,
+                                              **self.storage_kw)
+        self.assertEqual(len(records), 1)
+        timeline = self.storage._client.zcard('test.1234.deleted.timeline')
+        self.assertEqual(timeline, 1)
+
+    def test_delete_all_is_performed_in_one_round_trip(self):
+        for i in range(5):
+            self.create_record()
+        with mock.patch.object(self.storage._client, 'pipeline') as pipe:
+            with mock.patch.object(self.storage._client, 'evalsha',
+                                   wraps=self.storage._client.evalsha) as m:
+                deleted = self.storage.delete_all(**self.storage_kw)
+        self.assertFalse(pipe.called)
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(len(deleted), 5)
+
+    def test_writes_are_performed_in_one_round_trip(self):
+        record = self.create_record()
+        calls = [
+            (self.storage.create, dict(record={})),
+            (self.storage.update, dict(object_id=record['id'], record={})),
+            (self.storage.delete, dict(object_id=record['id'])),
+        ]
+        client = self.storage._client
+        for call, kwargs in calls:
+            kwargs.update(**self.storage_kw)
+            with mock.patch.object(client, 'pipeline') as pipe:
+                with mock.patch.object(client, 'evalsha',
+                                       wraps=client.evalsha) as m:
+                    call(**kwargs)
+            self.assertFalse(pipe.called)
+            self.assertEqual(m.call_count, 1)
+
+    def test_timestamp_is_bumped_without_optimistic_locking(self):
+        with mock.patch.object(self.storage._client, 'pipeline') as pipe:
+            self.storage.collection_timestamp(**self.storage_kw)
+        self.assertFalse(pipe.called)
+
+    def test_stored_record_is_stamped_by_the_script(self):
+        record = self.create_record({'age': 1.0, 'tags': [], 'sub': {},
+                                     'name': u'Rémy'})
+        stored = self.storage.get(object_id=record['id'], **self.storage_kw)
+        self.assertEqual(stored, record)
+        self.assertEqual(stored['tags'], [])
+        self.assertEqual(
+            stored['last_modified'],
+            self.storage.collection_timestamp(**self.storage_kw))
+        timeline = self.storage._client.zscore('test.1234.records.timeline',
+                                               record['id'])
+        self.assertEqual(timeline, record['last_modified'])
+
+    def test_empty_record_is_stamped_by_the_script(self):
+        record = self.storage.update(object_id='abc', record={},
+                                     **self.storage_kw)
+        stored = self.storage.get(object_id='abc', **self.storage_kw)
+        self.assertEqual(stored, record)
+        self.assertEqual(sorted(stored.keys()), ['id', 'last_modified'])
+
+    def test_previous_timestamp_of_updated_record_is_replaced(self):
+        record = self.create_record()
+        updated = self.storage.update(object_id=record['id'], record=record,
+                                      **self.storage_kw)
+        stored = self.storage.get(object_id=record['id'], **self.storage_kw)
+        self.assertEqual(stored['last_modified'], updated['last_modified'])
+        self.assertTrue(updated['last_modified'] > record['last_modified'])
+
+    def test_delete_all_gives_each_tombstone_its_own_timestamp(self):
+        records = [self.create_record() for i in range(5)]
+        deleted = self.storage.delete_all(**self.storage_kw)
+        timestamps = [r['last_modified'] for r in deleted]
+        self.assertEqual(len(set(timestamps)), 5)
+        self.assertTrue(min(timestamps) > records[-1]['last_modified'])
+        self.assertEqual(max(timestamps),
+                         self.storage.collection_timestamp(**self.storage_kw))
+        self.assertTrue(all(r['deleted'] for r in deleted))
+
+    def test_delete_all_with_filters_only_deletes_matching_records(self):
+        kept = self.create_record({'flavor': 'vanilla'})
+        removed = self.create_record({'flavor': 'strawberry'})
+        filters = [Filter('flavor', 'strawberry', utils.COMPARISON.EQ)]
+        deleted = self.storage.delete_all(filters=filters, **self.storage_kw)
+        self.assertEqual([r['id'] for r in deleted], [removed['id']])
+        records, _ = self.storage.get_all(include_deleted=True,
+                                          **self.storage_kw)
+        self.assertEqual(records[0], kept)
+        filters = [Filter('flavor', 'chocolate', utils.COMPARISON.EQ)]
+        deleted = self.storage.delete_all(filters=filters, **self.storage_kw)
+        self.assertEqual(deleted, [])
+
+    def test_records_are_fetched_by_chunks(self):
+        for i in range(5):
+            self.create_record({'flavor': 'vanilla'})
+        self.storage._chunk_size = 2
+        self.addCleanup(setattr, self.storage, '_chunk_size', 1000)
+        client = self.storage._client
+        filters = [Filter('flavor', 'vanilla', utils.COMPARISON.EQ)]
+        with mock.patch.object(client, 'smembers') as smembers:
+            with mock.patch.object(client, 'mget', wraps=client.mget) as m:
+                records, count = self.storage.get_all(filters=filters,
+                                                      **self.storage_kw)
+        self.assertFalse(smembers.called)
+        self.assertEqual(count, 5)
+        self.assertEqual([len(c[0][0]) for c in m.call_args_list],
+                         [2, 2, 1])
+
+    def test_records_are_filtered_as_they_are_fetched(self):
+        for i in range(5):
+            self.create_record({'flavor': 'vanilla'})
+        filters = [Filter('flavor', 'vanilla', utils.COMPARISON.EQ)]
+        with mock.patch.object(self.storage, 'extract_record_set',
+                               return_value=([], 0)) as m:
+            with mock.patch.object(self.storage._client, 'mget') as mget:
+                self.storage.get_all(filters=filters, **self.storage_kw)
+        self.assertFalse(mget.called)
+        records = m.call_args[0][1]
+        self.assertEqual(len(list(records)), 5)
+
+    def test_ids_scanned_several_times_are_fetched_once(self):
+        record = self.create_record()
+        _id = record['id'].encode('utf-8')
+        self.storage._client.delete('test.1234.records.timeline')
+        with mock.patch.object(self.storage._client, 'sscan_iter',
+                               return_value=iter([_id, _id])):
+            records, count = self.storage.get_all(sorting=[Sort('id', 1)],
+                                                  **self.storage_kw)
+        self.assertEqual(records, [record])
+        self.assertEqual(count, 1)
+
+    def test_timeline_is_scanned_by_chunks_after_the_last_timestamp(self):
+        client = self.storage._client
+        client.zadd('test.timeline', {'a': 1, 'b': 3, 'c': 3, 'd': 3,
+                                      'e': 5})
+        timeline = redisbackend.RedisTimeline(client, 'test.timeline')
+        with mock.patch.object(client, 'zrangebyscore',
+                               wraps=client.zrangebyscore) as m:
+            entries = list(timeline.scan(count=2))
+        self.assertEqual(entries,
+                         [(1, 'a'), (3, 'b'), (3, 'c'), (3, 'd'), (5, 'e')])
+        self.assertEqual([c[0][1] for c in m.call_args_list],
+                         ['-inf', 3, 3])
+
+    def test_records_modified_during_the_scan_are_returned_once(self):
+        self.storage._chunk_size = 1
+        self.addCleanup(setattr, self.storage, '_chunk_size', 1000)
+        first = self.create_record()
+        self.create_record()
+        timeline = self.storage._client.zrangebyscore
+
+        def scan_and_update(*args, **kwargs):
+            entries = timeline(*args, **kwargs)
+            if kwargs['start'] == 0:
+                self.storage.update(object_id=first['id'], record=first,
+                                    **self.storage_kw)
+            return entries
+
+        with mock.patch.object(self.storage._client, 'zrangebyscore',
+                               side_effect=scan_and_update):
+            records, count = self.storage.get_all(sorting=[Sort('id', 1)],
+                                                  **self.storage_kw)
+        self.assertEqual(len(records), 2)
+
+    def test_chunk_size_can_be_changed_in_settings(self):
+        settings = self.settings.copy()
+        settings['cliquet.storage_fetch_chunk_size'] = 10
+        config = self._get_config(settings=settings)
+        storage = self.backend.load_from_config(config)
+        self.assertEqual(storage._chunk_size, 10)
+
+    def test_sync_queries_only_fetch_the_current_page(self):
+        for i in range(10):
+            self.create_record()
+        sorting = [Sort('last_modified', -1)]
+        with mock.patch.object(self.storage._client, 'mget',
+                               wraps=self.storage._client.mget) as mocked:
+            records, count = self.storage.get_all(sorting=sorting, limit=3,
+                                                  **self.storage_kw)
+        self.assertEqual(count, 10)
+        self.assertEqual(len(mocked.call_args[0][0]), 3)
+
+
+class RedisHashStorageTest(RedisStorageTest, unittest.TestCase):
+    settings = {
+        'cliquet.storage_pool_size': 50,
+        'cliquet.storage_url': '',
+        'cliquet.storage_redis_layout': 'hash'
+    }
+
+    def test_backend_is_chosen_from_layout_setting(self):
+        self.assertTrue(isinstance(self.storage, redisbackend.RedisHash))
+        settings = self.settings.copy()
+        settings['cliquet.storage_redis_layout'] = 'table'
+        config = self._get_config(settings=settings)
+        self.assertRaises(ValueError, self.backend.load_from_config, config)
+
+    def test_records_and_tombstones_are_stored_in_hashes(self):
+        record = self.create_record()
+        self.create_record()
+        self.storage.delete(object_id=record['id'], **self.storage_kw)
+        client = self.storage._client
+        self.assertEqual(client.hlen('test.1234.records.hash'), 1)
+        self.assertEqual(client.hlen('test.1234.deleted.hash'), 1)
+        self.assertEqual(client.keys('*.records'), [])
+        self.assertEqual(client.keys('*.deleted'), [])
+
+    def test_get_all_handle_expired_values(self):
+        self.create_record({'flavor': 'vanilla'})
+        self.storage._client.delete('test.1234.records.timeline')
+        filters = [Filter('flavor', 'vanilla', utils.COMPARISON.EQ)]
+        with mock.patch.object(self.storage._client, 'hscan_iter',
+                               return_value=iter([(b'a', None)])):
+            records, _ = self.storage.get_all(filters=filters,
+                                              **self.storage_kw)
+        self.assertEqual(records, [])
+
+    def test_get_all_handle_expired_values_in_timeline(self):
+        self.create_record()
+        self.create_record()
+        record = '{"id": "foo"}'.encode('utf-8')
+        with mock.patch.object(self.storage._client, 'hmget',
+                               return_value=[record, None]):
+            records, _ = self.storage.get_all(**self.storage_kw)
+        self.assertEqual(len(records), 1)
+
+    def test_records_are_fetched_by_chunks(self):
+        for i in range(5):
+            self.create_record({'flavor': 'vanilla'})
+        self.storage._chunk_size = 2
+        self.addCleanup(setattr, self.storage, '_chunk_size', 1000)
+        filters = [Filter('flavor', 'vanilla', utils.COMPARISON.EQ)]
+        client = self.storage._client
+        with mock.patch.object(client, 'hmget', wraps=client.hmget) as m:
+            records, count = self.storage.get_all(filters=filters,
+                                                  **self.storage_kw)
+        self.assertEqual(count, 5)
+        self.assertEqual([len(c[0][1]) for c in m.call_args_list],
+                         [2, 2, 1])
+
+    def test_hash_is_scanned_by_chunks_to_rebuild_timeline(self):
+        for i in range(5):
+            self.create_record({'flavor': 'vanilla'})
+        self.storage._client.delete('test.1234.records.timeline')
+        filters = [Filter('flavor', 'vanilla', utils.COMPARISON.EQ)]
+        client = self.storage._client
+        with mock.patch.object(client, 'hscan_iter',
+                               wraps=client.hscan_iter) as m:
+            records, count = self.storage.get_all(filters=filters,
+                                                  **self.storage_kw)
+        self.assertEqual(count, 5)
+        self.assertEqual(m.call_args[1]['count'], 1000)
+
+    def test_ids_scanned_several_times_are_fetched_once(self):
+        record = self.create_record()
+        self.storage._client.delete('test.1234.records.timeline')
+        entry = (record['id'].encode('utf-8'),
+                 utils.json.dumps(record).encode('utf-8'))
+        with mock.patch.object(self.storage._client, 'hscan_iter',
+                               return_value=iter([entry, entry])):
+            records, count = self.storage.get_all(sorting=[Sort('id', 1)],
+                                                  **self.storage_kw)
+        self.assertEqual(records, [record])
+
+    def test_sync_queries_only_fetch_the_current_page(self):
+        for i in range(10):
+            self.create_record()
+        sorting = [Sort('last_modified', -1)]
+        with mock.patch.object(self.storage._client, 'hmget',
+                               wraps=self.storage._client.hmget) as mocked:
+            records, count = self.storage.get_all(sorting=sorting, limit=3,
+                                                  **self.storage_kw)
+        self.assertEqual(count, 10)
+        self.assertEqual(len(mocked.call_args[0][1]), 3)
+
+    def test_migration_moves_records_of_default_layout_into_hashes(self):
+        settings = self.settings.copy()
+        settings['cliquet.storage_redis_layout'] = 'keys'
+        config = self._get_config(settings=settings)
+        previous = self.backend.load_from_config(config)
+        previous._chunk_size = 2
+        kept = [previous.create(record={'number': i}, **self.storage_kw)
+                for i in range(5)]
+        deleted = previous.delete(object_id=kept.pop()['id'],
+                                  **self.storage_kw)
+        other_kw = dict(self.storage_kw, parent_id='5678')
+        other = previous.create(record={}, **other_kw)
+
+        with mock.patch('cliquet.storage.redis.logger') as logger:
+            self.storage.initialize_schema()
+        logger.info.assert_any_call('Moved 4 records of test.1234 into '
+                                    'a hash.')
+
+        records, count = self.storage.get_all(include_deleted=True,
+                                              **self.storage_kw)
+        self.assertEqual(sorted(records, key=lambda r: r['last_modified']),
+                         kept + [deleted])
+        self.assertEqual(count, 4)
+        self.assertEqual(self.storage.get(object_id=other['id'], **other_kw),
+                         other)
+        self.assertEqual(self.storage._client.keys('*.records'), [])
+        self.assertEqual(self.storage._client.keys('*.deleted'), [])
+
+        # Running it again has no effect.
+        self.storage.initialize_schema()
+        records, count = self.storage.get_all(**self.storage_kw)
+        self.assertEqual(count, 4)
+
+    def test_migration_only_moves_sets_of_records_ids(self):
+        client = self.storage._client
+        client.sadd('other.records', 'a')
+        client.set('other.a.records', 'not a record')
+        client.set('test.1234.timestamp', 42)
+        client.sadd('test.1234.records', 'a', 'b')
+        client.set('test.1234.a.records', '{"id": "a"}')
+        client.sadd('test.1234.b.records', 'not a record')
+
+        with mock.patch('cliquet.storage.redis.logger') as logger:
+            self.storage.initialize_schema()
+        logger.info.assert_called_once_with('Moved 1 records of test.1234 '
+                                            'into a hash.')
+
+        self.assertEqual(client.smembers('other.records'), set([b'a']))
+        self.assertEqual(client.get('other.a.records'), b'not a record')
+        self.assertEqual(client.type('test.1234.b.records'), b'set')
+        self.assertEqual(client.hkeys('test.1234.records.hash'), [b'a'])
+
+
+class RedisMsgpackStorageTest(RedisStorageTest, unittest.TestCase):
+    settings = {
+        'cliquet.storage_pool_size': 50,
+        'cliquet.storage_url': '',
+        'cliquet.storage_codec': 'msgpack',
+        'cliquet.storage_compression_threshold': 64
+    }
+
+    def test_records_are_stored_stamped_and_compressed(self):
+        record = self.create_record({'text': 'a' * 200})
+        key = 'test.1234.{0}.records'.format(record['id'])
+        encoded = self.storage._client.get(key)
+        self.assertEqual(encoded[:1], serializers.STAMPED_MARKER)
+        self.assertIn(b'\n' + serializers.COMPRESSED_MARKER, encoded)
+        self.assertLess(len(encoded), 200)
+
+    def test_records_stored_as_json_remain_readable(self):
+        settings = self.settings.copy()
+        settings['cliquet.storage_codec'] = 'json'
+        settings['cliquet.storage_compression_threshold'] = None
+        config = self._get_config(settings=settings)
+        previous = self.backend.load_from_config(config)
+        record = previous.create(record={'number': 1}, **self.storage_kw)
+        self.assertEqual(self.storage.get(object_id=record['id'],
+                                          **self.storage_kw), record)
+        updated = self.storage.update(object_id=record['id'],
+                                      record={'number': 2},
+                                      **self.storage_kw)
+        self.assertEqual(previous.get(object_id=record['id'],
+                                      **self.storage_kw), updated)
+
+
+class RedisUniqueStorageTest(UniqueIndexTest, RedisStorageTest,
+                             unittest.TestCase):
+    def test_records_stored_before_declaration_are_checked(self):
+        self.create_record({'flavor': 'vanilla'})
+        self.storage.set_unique_fields('test', ('flavor',))
+        with mock.patch.object(self.storage, 'get_all') as mocked:
+            self.assertRaises(exceptions.UnicityError,
+                              self.create_record,
+                              {'flavor': 'vanilla'},
+                              unique_fields=('flavor',))
+        self.assertFalse(mocked.called)
+
+    def test_unique_index_is_rebuilt_again_after_concurrent_writes(self):
+        self.create_record({'flavor': 'vanilla'})
+        self.storage.set_unique_fields('test', ('flavor',))
+        get_records_set = self.storage._get_records_set
+        concurrent = []
+
+        def scan_and_write(*args, **kwargs):
+            if not concurrent:
+                concurrent.append(self.create_record({'flavor': 'mint'}))
+            return get_records_set(*args, **kwargs)
+
+        with mock.patch.object(self.storage, '_get_records_set',
+                               side_effect=scan_and_write) as mocked:
+            self.assertRaises(exceptions.UnicityError,
+                              self.create_record,
+                              {'flavor': 'vanilla'},
+                              unique_fields=('flavor',))
+        self.assertEqual(mocked.call_count, 2)
+        ids = self.storage._client.hgetall('test.1234.records.unique.flavor')
+        self.assertEqual(ids[b'"mint"'], concurrent[0]['id'].encode('utf-8'))
+
+    def test_records_read_are_checked_if_index_cannot_be_rebuilt(self):
+        self.create_record({'flavor': 'vanilla'})
+        self.storage.set_unique_fields('test', ('flavor',))
+        with mock.patch.object(self.storage, '_rebuild_indexes',
+                               return_value=False) as mocked:
+            self.assertRaises(exceptions.UnicityError,
+                              self.create_record,
+                              {'flavor': 'vanilla'},
+                              unique_fields=('flavor',))
+        self.assertEqual(mocked.call_count, 3)
+        self.assertFalse(self.storage._client.sismember(
+            'test.1234.records.unique', 'flavor'))
+
+    def test_outdated_index_entries_are_ignored(self):
+        record = self.create_record({'phone': 'abc'},
+                                    unique_fields=('phone',))
+        self.storage._client.hset('test.1234.records.unique.phone',
+                                  '"def"', record['id'])
+        self.create_record({'phone': 'def'}, unique_fields=('phone',))
+
+    def test_values_that_cannot_be_indexed_are_checked_by_scan(self):
+        self.create_record({'phone': ['abc']})
+        self.assertRaises(exceptions.UnicityError,
+                          self.create_record,
+                          {'phone': ['abc']},
+                          unique_fields=('phone',))
+
+    def test_provided_ids_are_checked_without_scan(self):
+        record = self.create_record()
+        with mock.patch.object(self.storage, 'get_all') as mocked:
+            self.assertRaises(exceptions.UnicityError,
+                              self.create_record,
+                              {'id': record['id']})
+        self.assertFalse(mocked.called)
+
+
+class RedisIndexedStorageTest(RedisStorageTest, unittest.TestCase):
+    def setUp(self):
+        super(RedisIndexedStorageTest, self).setUp()
+        self.storage.set_indexed_fields('test', ('phone', 'line', 'status',
+                                                 'number', 'foo'))
+        self.sorting = [Sort('number', 1), Sort('last_modified', -1)]
+
+    def get_all_sorted(self, **kwargs):
+        """Query that must be answered from the sorted index."""
+        kwargs.setdefault('sorting', self.sorting)
+        kwargs.update(**self.storage_kw)
+        with mock.patch.object(self.storage, 'extract_record_set') as m:
+            with mock.patch.object(self.storage._client, 'mget') as mget:
+                result = self.storage.get_all(**kwargs)
+        self.assertFalse(m.called)
+        self.assertFalse(mget.called)
+        return result
+
+    def pagination_rules(self, last_record, sorting=None):
+        sorting = sorting or self.sorting
+        rules = []
+        while sorting:
+            rule = [Filter(f, last_record[f], utils.COMPARISON.EQ)
+                    for f, _ in sorting[:-1]]
+            field, direction = sorting[-1]
+            operator = (utils.COMPARISON.LT if direction < 0
+                        else utils.COMPARISON.GT)
+            rule.append(Filter(field, last_record[field], operator))
+            rules.append(rule)
+            sorting = sorting[:-1]
+        return rules
+
+    def test_get_all_selects_first_records_without_full_sort(self):
+        for x in range(10):
+            self.create_record({'number': x % 4})
+        sorting = [Sort('number', -1), Sort('last_modified', 1)]
+        records, _ = self.get_all_sorted(sorting=sorting, limit=3)
+        self.assertEqual([r['number'] for r in records], [3, 3, 2])
+        self.assertTrue(records[0]['last_modified'] <
+                        records[1]['last_modified'])
+
+    def test_get_all_sorted_descending_selects_first_records(self):
+        for x in range(10):
+            self.create_record({'number': x % 4})
+        sorting = [Sort('number', -1), Sort('last_modified', -1)]
+        records, _ = self.get_all_sorted(sorting=sorting, limit=3)
+        self.assertEqual([r['number'] for r in records], [3, 3, 2])
+        self.assertTrue(records[0]['last_modified'] >
+                        records[1]['last_modified'])
+
+    def test_sorted_queries_only_fetch_the_current_page(self):
+        for x in [3, 1, 2, 1.5, 0]:
+            self.create_record({'number': x})
+        records, count = self.get_all_sorted(limit=3)
+        self.assertEqual(count, 5)
+        self.assertEqual([r['number'] for r in records], [0, 1, 1.5])
+
+    def test_sorted_queries_can_be_descending(self):
+        for x in [3, 1, 2]:
+            self.create_record({'number': x})
+        records, _ = self.get_all_sorted(sorting=[Sort('number', -1)])
+        self.assertEqual([r['number'] for r in records], [3, 2, 1])
+
+    def test_records_with_same_value_are_sorted_by_timestamp(self):
+        created = [self.create_record({'number': x}) for x in [1, 2, 1, 1]]
+        records, _ = self.get_all_sorted(limit=2)
+        self.assertEqual([r['id'] for r in records],
+                         [created[3]['id'], created[2]['id']])
+
+        self.sorting = [Sort('number', -1), Sort('last_modified', 1)]
+        records, _ = self.get_all_sorted(limit=3)
+        self.assertEqual([r['id'] for r in records],
+                         [created[1]['id'], created[0]['id'],
+                          created[2]['id']])
+
+    def test_pages_follow_the_pagination_cursor(self):
+        created = [self.create_record({'number': x})
+                   for x in [1, 2, 1, 1, 0, 2]]
+        expected, _ = self.storage.get_all(sorting=self.sorting,
+                                           **self.storage_kw)
+        pages = []
+        rules = None
+        while True:
+            records, count = self.get_all_sorted(pagination_rules=rules,
+                                                 limit=2)
+            self.assertEqual(count, len(created))
+            pages.extend(records)
+            if len(pages) == len(created):
+                break
+            rules = self.pagination_rules(records[-1])
+        self.assertEqual(pages, expected)
+        self.assertEqual([r['number'] for r in pages], [0, 1, 1, 1, 2, 2])
+
+    def test_pages_without_timestamp_ordering(self):
+        for x in [3, 1, 2]:
+            self.create_record({'number': x})
+        sorting = [Sort('number', -1)]
+        rules = self.pagination_rules({'number': 3}, sorting)
+        records, _ = self.get_all_sorted(sorting=sorting,
+                                         pagination_rules=rules)
+        self.assertEqual([r['number'] for r in records], [2, 1])
+
+    def test_empty_page_falls_back_to_the_whole_set(self):
+        last = self.create_record({'number': 1})
+        self.create_record({'number': 0})
+        rules = self.pagination_rules(last)
+        records, count = self.get_all_sorted(pagination_rules=rules)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(count, 2)
+
+    def test_ranges_of_sorting_field_are_filtered_on_server(self):
+        for x in range(10):
+            self.create_record({'number': x})
+        filters = [Filter('number', 2, utils.COMPARISON.MIN),
+                   Filter('number', 6.5, utils.COMPARISON.LT),
+                   Filter('number', 2, utils.COMPARISON.GT)]
+        records, count = self.get_all_sorted(filters=filters, limit=2)
+        self.assertEqual(count, 4)
+        self.assertEqual([r['number'] for r in records], [3, 4])
+
+        filters = [Filter('number', 4, utils.COMPARISON.EQ)]
+        records, count = self.get_all_sorted(filters=filters)
+        self.assertEqual([r['number'] for r in records], [4])
+
+    def test_cursor_outside_filtered_range(self):
+        for x in range(5):
+            self.create_record({'number': x})
+        filters = [Filter('number', 3, utils.COMPARISON.MAX)]
+        rules = self.pagination_rules({'number': 3.5, 'last_modified': 0})
+        records, count = self.get_all_sorted(filters=filters,
+                                             pagination_rules=rules)
+        self.assertEqual(count, 4)
+        self.assertEqual([r['number'] for r in records], [0, 1, 2, 3])
+
+        filters = [Filter('number', 2, utils.COMPARISON.MIN)]
+        rules = self.pagination_rules({'number': 1.5, 'last_modified': 0})
+        records, count = self.get_all_sorted(filters=filters,
+                                             pagination_rules=rules)
+        self.assertEqual([r['number'] for r in records], [2, 3, 4])
+
+    def test_sorted_index_follows_updates_and_deletions(self):
+        first = self.create_record({'number': 1})
+        second = self.create_record({'number': 2})
+        self.create_record({'number': 3})
+        self.storage.update(object_id=first['id'], record={'number': 4},
+                            **self.storage_kw)
+        self.storage.delete(object_id=second['id'], **self.storage_kw)
+        records, count = self.get_all_sorted()
+        self.assertEqual([r['number'] for r in records], [3, 4])
+        filters = [Filter('number', 3, utils.COMPARISON.EQ)]
+        self.storage.delete_all(filters=filters, **self.storage_kw)
+        records, count = self.get_all_sorted()
+        self.assertEqual([r['number'] for r in records], [4])
+        self.storage.delete(object_id=first['id'], **self.storage_kw)
+        self.assertEqual(self.get_all_sorted(), ([], 0))
+        self.assertFalse(self.storage._client.exists(
+            'test.1234.records.sorted.number'))
+
+    def test_sorted_index_is_dropped_by_writes_without_the_field(self):
+        first = self.create_record({'number': 1})
+        self.create_record({'number': 2})
+        other = self.backend.load_from_config(self._get_config())
+        other.update(object_id=first['id'], record={'number': 3},
+                     **self.storage_kw)
+        self.assertFalse(self.storage._client.exists(
+            'test.1234.records.sorted.number'))
+        records, _ = self.storage.get_all(sorting=self.sorting,
+                                          **self.storage_kw)
+        self.assertEqual([r['number'] for r in records], [2, 3])
+        records, _ = self.get_all_sorted()
+        self.assertEqual([r['number'] for r in records], [2, 3])
+
+    def test_deletions_remove_records_from_every_sorted_index(self):
+        record = self.create_record({'number': 1})
+        other = self.backend.load_from_config(self._get_config())
+        other.delete(object_id=record['id'], **self.storage_kw)
+        self.create_record({'number': 2})
+        records, _ = self.get_all_sorted()
+        self.assertEqual([r['number'] for r in records], [2])
+
+    def test_indexes_are_not_rebuilt_if_collection_was_written(self):
+        self.create_record({'number': 1})
+        version = self.storage._client.get('test.1234.timestamp')
+        self.create_record({'number': 2})
+        rebuild = mock.MagicMock()
+        self.assertFalse(self.storage._rebuild_indexes('test.1234', version,
+                                                       [rebuild]))
+        self.assertFalse(rebuild.called)
+        version = self.storage._client.get('test.1234.timestamp')
+        self.assertTrue(self.storage._rebuild_indexes('test.1234', version,
+                                                      [rebuild]))
+        self.assertTrue(rebuild.called)
+
+    def test_non_numeric_values_are_sorted_in_memory(self):
+        self.create_record({'number': 1})
+        record = self.create_record({'number': True})
+        with mock.patch.object(self.storage, 'extract_record_set',
+                               wraps=self.storage.extract_record_set) as m:
+            records, _ = self.storage.get_all(sorting=self.sorting,
+                                              **self.storage_kw)
+        self.assertTrue(m.called)
+        self.assertEqual(len(records), 2)
+
+        self.storage.update(object_id=record['id'], record={'number': 2},
+                            **self.storage_kw)
+        records, _ = self.get_all_sorted()
+        self.assertEqual([r['number'] for r in records], [1, 2])
+
+    def test_records_stored_before_declaration_are_indexed(self):
+        self.create_record({'flavor': 3})
+        self.create_record({'flavor': 1})
+        unknown = self.create_record({'flavor': True})
+        self.storage.set_indexed_fields('test', ('flavor', 'color'))
+        sorting = [Sort('flavor', 1)]
+        records, _ = self.storage.get_all(sorting=sorting,
+                                          **self.storage_kw)
+        self.assertEqual(len(records), 3)
+        self.storage.delete(object_id=unknown['id'], **self.storage_kw)
+        records, _ = self.get_all_sorted(sorting=sorting)
+        self.assertEqual([r['flavor'] for r in records], [1, 3])
+
+        self.storage.get_all(sorting=[Sort('color', 1)], **self.storage_kw)
+        unsorted = self.storage._client.scard(
+            'test.1234.records.unsorted.color')
+        self.assertEqual(unsorted, 2)
+
+    def test_other_queries_are_answered_in_memory(self):
+        self.create_record({'number': 1, 'status': 2})
+        queries = [
+            dict(sorting=[Sort('number', 1), Sort('status', 1)]),
+            dict(sorting=[Sort('unknown', 1)]),
+            dict(sorting=self.sorting, include_deleted=True),
+            dict(sorting=self.sorting,
+                 filters=[Filter('status', 2, utils.COMPARISON.EQ)]),
+            dict(sorting=self.sorting,
+                 filters=[Filter('number', 2, utils.COMPARISON.NOT)]),
+            dict(sorting=self.sorting,
+                 pagination_rules=[[Filter('status', 2,
+                                           utils.COMPARISON.GT)]]),
+            dict(sorting=self.sorting,
+                 pagination_rules=self.pagination_rules(
+                     {'number': 1, 'last_modified': 1.5})),
+            dict(sorting=[Sort('number', 1), Sort('status', 1),
+                          Sort('last_modified', 1)]),
+        ]
+        for query in queries:
+            with mock.patch.object(self.storage, '_get_sorted_page') as m:
+                self.storage.get_all(**dict(self.storage_kw, **query))
+            self.assertFalse(m.called)
+
 
 class PostgresqlStorageTest(StorageTest, unittest.TestCase):
     backend = postgresql
@@ -845,11 +2327,18 @@ class PostgresqlStorageTest(StorageTest, unittest.TestCase):
 
     def __init__(self, *args, **kwargs):
         super(PostgresqlStorageTest, self).__init__(*args, **kwargs)
+        # Each test instance has its own pool: do not keep idle
+        # connections opened between tests.
+        self.storage.pool.closeall()
         self.client_error_patcher = mock.patch.object(
             self.storage.pool,
             'getconn',
             side_effect=psycopg2.DatabaseError)
 
+    def tearDown(self):
+        super(PostgresqlStorageTest, self).tearDown()
+        self.storage.pool.closeall()
+
     def test_number_of_fetched_records_can_be_limited_in_settings(self):
         for i in range(4):
             self.create_record({'phone': 'tel-%s' % i})
@@ -888,26 +2377,664 @@ class PostgresqlStorageTest(StorageTest, unittest.TestCase):
             cursor.execute(query)
             self.assertEqual(cursor.fetchone()[0], 1)
 
-    def test_pool_object_is_shared_among_backend_instances(self):
+    def test_pool_object_is_not_shared_among_backend_instances(self):
         config = self._get_config()
         storage1 = self.backend.load_from_config(config)
         storage2 = self.backend.load_from_config(config)
-        self.assertEqual(id(storage1.pool), id(storage2.pool))
+        self.assertIsNot(storage1.pool, storage2.pool)
 
-    def test_pool_object_is_shared_among_every_backends(self):
-        config = self._get_config()
-        storage1 = self.backend.load_from_config(config)
-        subclass = type('backend', (postgresql.PostgreSQLClient,), {})
-        storage2 = subclass(user='postgres', password='postgres',
-                            host='localhost', database='testdb',
-                            pool_size=10)
-        self.assertEqual(id(storage1.pool), id(storage2.pool))
-
-    def test_warns_if_configured_pool_size_differs_for_same_backend_type(self):
-        self.backend.load_from_config(self._get_config())
+    def test_pool_settings_are_read_for_each_backend(self):
+        settings = self.settings.copy()
+        settings['cliquet.storage_pool_size'] = 3
+        settings['cliquet.storage_pool_timeout'] = '0.5'
+        settings['cliquet.storage_pool_max_idle'] = 60
+        storage = self.backend.load_from_config(
+            self._get_config(settings=settings))
+        self.assertEqual(storage.pool.size, 3)
+        self.assertEqual(storage.pool.timeout, 0.5)
+        self.assertEqual(storage.pool.max_idle, 60.0)
+        self.assertIsNone(storage.pool.max_lifetime)
+
+    def test_connections_are_released_to_the_pool(self):
+        self.storage.get_all(**self.storage_kw)
+        self.assertEqual(self.storage.pool.stats['in_use'], 0)
+        self.assertEqual(self.storage.pool.stats['idle'], 1)
+
+    def test_pool_metrics_are_sent_to_statsd_periodically(self):
+        statsd = mock.MagicMock()
+        with mock.patch.object(self.storage, 'statsd', statsd):
+            with mock.patch('cliquet.storage.postgresql.threading.Thread'
+                            ) as thread:
+                self.storage.get_all(**self.storage_kw)
+                self.storage.get_all(**self.storage_kw)
+            self.assertEqual(thread.return_value.start.call_count, 1)
+            self.assertFalse(statsd.gauge.called)
+            self.storage._report_pools()
+        checkout = statsd.timing.call_args[0]
+        self.assertEqual(checkout[0], 'postgresql.pool.checkout')
+        statsd.gauge.assert_any_call('postgresql.pool.checkouts', 2)
+        statsd.gauge.assert_any_call('postgresql.pool.in_use', 0)
+        statsd.gauge.assert_any_call('postgresql.pool.idle', 1)
+        statsd.gauge.assert_any_call('postgresql.pool.waiting', 0)
+
+    def test_pool_timeout_is_a_backend_error(self):
+        statsd = mock.MagicMock()
+        with mock.patch.object(self.storage, 'statsd', statsd):
+            with mock.patch.object(self.storage.pool, 'getconn',
+                                   side_effect=PoolTimeout):
+                self.assertRaises(exceptions.BackendError,
+                                  self.storage.get_all, **self.storage_kw)
+        statsd.count.assert_called_with('postgresql.pool.timeout')
+
+    def pagination_rules(self, last_record, sorting):
+        rules = []
+        while sorting:
+            rule = [Filter(f, last_record[f], utils.COMPARISON.EQ)
+                    for f, _ in sorting[:-1]]
+            field, direction = sorting[-1]
+            operator = (utils.COMPARISON.LT if direction < 0
+                        else utils.COMPARISON.GT)
+            rule.append(Filter(field, last_record[field], operator))
+            rules.append(rule)
+            sorting = sorting[:-1]
+        return rules
+
+    def test_pages_are_read_with_keyset_pagination(self):
+        for i in range(7):
+            if i % 3 == 0:
+                self.create_and_delete_record()
+            else:
+                self.create_record()
+        for direction in (-1, 1):
+            sorting = [Sort('last_modified', direction), Sort('id', direction)]
+            expected, _ = self.storage.get_all(sorting=sorting,
+                                               include_deleted=True,
+                                               **self.storage_kw)
+            pages = []
+            rules = None
+            with mock.patch.object(self.storage, '_format_pagination') as m:
+                while len(pages) < len(expected):
+                    records, _ = self.storage.get_all(sorting=sorting,
+                                                      pagination_rules=rules,
+                                                      include_deleted=True,
+                                                      limit=2,
+                                                      **self.storage_kw)
+                    pages.extend(records)
+                    rules = self.pagination_rules(records[-1], sorting)
+            self.assertFalse(m.called)
+            self.assertEqual(pages, expected)
+
+    def test_keyset_pagination_keeps_total_count_of_records(self):
+        for i in range(5):
+            last_record = self.create_record()
+        sorting = [Sort('last_modified', 1)]
+        rules = self.pagination_rules(last_record, sorting)
+        records, count = self.storage.get_all(sorting=sorting,
+                                              pagination_rules=rules,
+                                              limit=2, **self.storage_kw)
+        self.assertEqual(records, [])
+        self.assertEqual(count, 5)
+
+    def test_keyset_pagination_is_not_used_if_not_applicable(self):
+        record = self.create_record({'number': 1})
+        queries = [
+            [Sort('number', 1), Sort('last_modified', 1)],
+            [Sort('last_modified', -1), Sort('id', 1)],
+        ]
+        for sorting in queries:
+            rules = self.pagination_rules(record, sorting)
+            self.assertIsNone(self.storage._format_keyset_pagination(
+                sorting, rules, 'id', 'last_modified'))
+
+        sorting = [Sort('last_modified', -1)]
+        rules = [[Filter('number', 1, utils.COMPARISON.EQ)]]
+        self.assertIsNone(self.storage._format_keyset_pagination(
+            sorting, rules, 'id', 'last_modified'))
+        rules = self.pagination_rules({'last_modified': 'a'}, sorting)
+        self.assertIsNone(self.storage._format_keyset_pagination(
+            sorting, rules, 'id', 'last_modified'))
+        rules = self.pagination_rules(record, [Sort('last_modified', -1),
+                                               Sort('id', -1)])
+        self.assertIsNone(self.storage._format_keyset_pagination(
+            sorting, rules[:1], 'id', 'last_modified'))
+
+    def test_records_of_collection_are_counted_by_triggers(self):
+        for i in range(3):
+            record = self.create_record()
+        self.storage.delete(object_id=record['id'], **self.storage_kw)
+        with self.storage.connect() as cursor:
+            cursor.execute("SELECT total FROM records_count;")
+            self.assertEqual(cursor.fetchone()['total'], 2)
+        _, count = self.storage.get_all(**self.storage_kw)
+        self.assertEqual(count, 2)
+
+    def test_count_of_filtered_records_can_be_skipped(self):
+        self.create_record({'number': 1})
+        filters = [Filter('number', 1, utils.COMPARISON.EQ)]
+        records, count = self.storage.get_all(filters=filters,
+                                              count_total=False,
+                                              **self.storage_kw)
+        self.assertEqual(len(records), 1)
+        self.assertIsNone(count)
+
+    def test_empty_pages_come_with_the_total_count(self):
+        for i in range(3):
+            self.create_record({'number': i})
+        filters = [Filter('number', 1, utils.COMPARISON.MIN)]
+        rules = [[Filter('number', 5, utils.COMPARISON.GT)]]
+        records, count = self.storage.get_all(filters=filters,
+                                              pagination_rules=rules,
+                                              **self.storage_kw)
+        self.assertEqual(records, [])
+        self.assertEqual(count, 2)
+
+    def test_records_are_updated_in_a_single_statement(self):
+        record = self.create_record({'phone': '1'})
+        statements = []
+
+        class CountingCursor(psycopg2.extras.DictCursor):
+            def execute(self, query, vars=None):
+                statements.append(query)
+                return super(CountingCursor, self).execute(query, vars)
+
+        with mock.patch.object(psycopg2.extras, 'DictCursor', CountingCursor):
+            for object_id in (record['id'], RECORD_ID):
+                self.storage.update(object_id=object_id,
+                                    record={'phone': object_id},
+                                    unique_fields=('phone',),
+                                    **self.storage_kw)
+        self.assertEqual(len(statements), 2)
+        records, _ = self.storage.get_all(**self.storage_kw)
+        self.assertEqual(len(records), 2)
+
+    def test_collection_timestamp_is_bumped_once_per_update(self):
+        record = self.create_record()
+        # Bumps from a timestamp in the future increment it by one.
+        with self.storage.connect() as cursor:
+            query = "UPDATE timestamps SET last_modified = %(timestamp)s;"
+            cursor.execute(query, dict(timestamp=2 ** 50))
+        updated = self.storage.update(object_id=record['id'],
+                                      record={'phone': '1'},
+                                      **self.storage_kw)
+        self.assertEqual(updated['last_modified'], 2 ** 50 + 1)
+        timestamp = self.storage.collection_timestamp(**self.storage_kw)
+        self.assertEqual(timestamp, 2 ** 50 + 1)
+
+    def test_collection_timestamp_is_bumped_once_per_upsert(self):
+        with self.storage.connect() as cursor:
+            query = "UPDATE timestamps SET last_modified = %(timestamp)s;"
+            cursor.execute(query, dict(timestamp=2 ** 50))
+        for i in range(1, 3):
+            updated = self.storage.update(object_id='abc',
+                                          record={'phone': str(i)},
+                                          **self.storage_kw)
+            self.assertEqual(updated['last_modified'], 2 ** 50 + i)
+            timestamp = self.storage.collection_timestamp(**self.storage_kw)
+            self.assertEqual(timestamp, 2 ** 50 + i)
+
+    def test_updates_setting_the_timestamp_are_bumped(self):
+        record = self.create_record()
+        self.create_record()
+        with self.storage.connect() as cursor:
+            query = """
+            UPDATE records SET last_modified = %(timestamp)s
+             WHERE id = %(object_id)s;
+            """
+            cursor.execute(query, dict(timestamp=record['last_modified'] - 1,
+                                       object_id=record['id']))
+        timestamp = self.storage.collection_timestamp(**self.storage_kw)
+        retrieved = self.storage.get(object_id=record['id'],
+                                     **self.storage_kw)
+        self.assertEqual(retrieved['last_modified'], timestamp)
+
+    def explain(self, filters=None, sorting=None, **kwargs):
+        """Return the plan of a lookup with the filters and sorting emitted
+        by the backend, with sequential scans disabled.
+        """
+        kwargs = dict(self.storage_kw, **kwargs)
+        placeholders = dict(parent_id=kwargs['parent_id'],
+                            collection_id=kwargs['collection_id'])
+        conditions = ''
+        if filters:
+            sql, holders = self.storage._format_conditions(
+                filters, 'id', 'last_modified')
+            conditions = 'AND %s' % sql
+            placeholders.update(**holders)
+        order = ''
+        if sorting:
+            order, holders = self.storage._format_sorting(
+                sorting, 'id', 'last_modified')
+            placeholders.update(**holders)
+        query = """
+        EXPLAIN SELECT id
+                  FROM records
+                 WHERE parent_id = %%(parent_id)s
+                   AND collection_id = %%(collection_id)s
+                   %s
+                 %s
+                 LIMIT 10;
+        """ % (conditions, order)
+        with self.storage.connect() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off;")
+            cursor.execute(query, placeholders)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def test_filters_on_indexed_fields_use_expression_indexes(self):
+        self.storage.set_indexed_fields('test', ('status',))
+        self.storage.initialize_schema()
+        index = self.storage._index_name('test', 'status')
+        for i in range(10):
+            self.create_record({'status': i % 3})
+        for operator in (utils.COMPARISON.EQ, utils.COMPARISON.MAX,
+                         utils.COMPARISON.GT):
+            filters = [Filter('status', 1, operator)]
+            self.assertIn(index, self.explain(filters=filters))
+
+    def test_sorting_on_indexed_fields_uses_expression_indexes(self):
+        self.storage.set_indexed_fields('test', ('status',))
+        self.storage.initialize_schema()
+        index = self.storage._index_name('test', 'status')
+        self.assertIn(index, self.explain(sorting=[Sort('status', 1)]))
+
+    def test_expression_indexes_are_partial_per_collection(self):
+        self.storage.set_indexed_fields('test', ('status',))
+        self.storage.initialize_schema()
+        index = self.storage._index_name('test', 'status')
+        filters = [Filter('status', 1, utils.COMPARISON.EQ)]
+        plan = self.explain(filters=filters, collection_id='other')
+        self.assertNotIn(index, plan)
+
+    def test_missing_fields_still_match_filters_on_empty_values(self):
+        self.create_record({'status': ''})
+        self.create_record({'status': 'b'})
+        self.create_record({})
+        expected = [
+            (utils.COMPARISON.EQ, '', 2),
+            (utils.COMPARISON.NOT, '', 1),
+            (utils.COMPARISON.MAX, 'a', 2),
+            (utils.COMPARISON.MIN, 'a', 1),
+            (utils.COMPARISON.LT, 'c', 3),
+            (utils.COMPARISON.GT, '', 1),
+        ]
+        for operator, value, total in expected:
+            filters = [Filter('status', value, operator)]
+            _, count = self.storage.get_all(filters=filters,
+                                            **self.storage_kw)
+            self.assertEqual(count, total)
+
+    def test_numbers_are_compared_numerically(self):
+        for price in (9, 10, 100, 50.5, '50'):
+            self.create_record({'price': price})
+        self.create_record({})
+        expected = [
+            (utils.COMPARISON.MIN, 10, [10, 50.5, 100]),
+            (utils.COMPARISON.LT, 50, [9, 10]),
+            (utils.COMPARISON.EQ, 10.0, [10]),
+        ]
+        sorting = [Sort('price', 1)]
+        for operator, value, prices in expected:
+            filters = [Filter('price', value, operator)]
+            records, _ = self.storage.get_all(filters=filters,
+                                              sorting=sorting,
+                                              **self.storage_kw)
+            self.assertEqual([r['price'] for r in records], prices)
+
+    def test_booleans_are_not_compared_to_strings(self):
+        self.create_record({'done': True})
+        self.create_record({'done': 'true'})
+        self.create_record({'done': False})
+        filters = [Filter('done', True, utils.COMPARISON.EQ)]
+        records, _ = self.storage.get_all(filters=filters, **self.storage_kw)
+        self.assertEqual([r['done'] for r in records], [True])
+        filters = [Filter('done', True, utils.COMPARISON.NOT)]
+        _, count = self.storage.get_all(filters=filters, **self.storage_kw)
+        self.assertEqual(count, 2)
+
+    def test_null_values_match_missing_fields(self):
+        self.create_record({'parent': None})
+        self.create_record({'parent': 'a'})
+        self.create_record({})
+        filters = [Filter('parent', None, utils.COMPARISON.EQ)]
+        _, count = self.storage.get_all(filters=filters, **self.storage_kw)
+        self.assertEqual(count, 2)
+        filters = [Filter('parent', None, utils.COMPARISON.NOT)]
+        _, count = self.storage.get_all(filters=filters, **self.storage_kw)
+        self.assertEqual(count, 1)
+
+    def test_numbers_are_sorted_numerically(self):
+        for price in (100, 9, 10):
+            self.create_record({'price': price})
+        records, _ = self.storage.get_all(sorting=[Sort('price', -1)],
+                                          **self.storage_kw)
+        self.assertEqual([r['price'] for r in records], [100, 10, 9])
+
+    def test_pagination_returns_values_of_all_types(self):
+        for price in (2, u'b', True, 1, u'a'):
+            self.create_record({'price': price})
+        sorting = [Sort('price', 1)]
+        prices = []
+        rules = None
+        while True:
+            records, _ = self.storage.get_all(sorting=sorting,
+                                              pagination_rules=rules,
+                                              limit=2,
+                                              **self.storage_kw)
+            if not records:
+                break
+            prices.extend(r['price'] for r in records)
+            last = records[-1]['price']
+            rules = [[Filter('price', last, utils.COMPARISON.GT)]]
+        # JSONB values are ordered by type, strings before numbers.
+        self.assertEqual(prices, [u'a', u'b', 1, 2, True])
+
+    def test_json_types_of_filters_values(self):
+        values = [(None, 'null'), (True, 'boolean'), (1, 'number'),
+                  (1.5, 'number'), (u'a', 'string'), ([1], 'array'),
+                  ({'a': 1}, 'object')]
+        for value, expected in values:
+            self.assertEqual(postgresql.json_type(value), expected)
+
+    def test_timestamps_and_ids_are_not_indexed_as_fields(self):
+        self.storage.set_indexed_fields('test', ('id', 'last_modified',
+                                                 'status'))
+        self.assertEqual(self.storage._indexed_fields['test'], {'status'})
+
+    def test_index_names_are_valid_identifiers(self):
+        names = [self.storage._index_name('test', 'a' * 100),
+                 self.storage._index_name('test', 'a' * 101),
+                 self.storage._index_name(u'tést', 'field"; DROP')]
+        self.assertEqual(len(set(names)), 3)
+        for name in names:
+            self.assertLessEqual(len(name), 63)
+            self.assertTrue(re.match('^[a-z0-9_]+$', name))
+
+    def test_invalid_indexes_are_created_again(self):
+        self.storage.set_indexed_fields('test', ('status',))
+        self.storage.initialize_schema()
+        index = self.storage._index_name('test', 'status')
+        query = """
+        UPDATE pg_index SET indisvalid = FALSE
+         WHERE indexrelid = %(name)s::regclass;
+        """
+        with self.storage.connect() as cursor:
+            cursor.execute(query, dict(name=index))
+        self.storage.initialize_schema()
+        query = """
+        SELECT indisvalid FROM pg_index WHERE indexrelid = %(name)s::regclass;
+        """
+        with self.storage.connect() as cursor:
+            cursor.execute(query, dict(name=index))
+            self.assertTrue(cursor.fetchone()[0])
+
+    def test_collection_timestamp_is_stored_by_triggers(self):
+        record = self.create_record()
+        with self.storage.connect() as cursor:
+            cursor.execute("SELECT last_modified FROM timestamps;")
+            self.assertEqual(cursor.fetchone()[0], record['last_modified'])
+
+    def test_collection_timestamp_is_kept_if_all_tombstones_are_purged(self):
+        self.create_record()
+        record = self.create_and_delete_record()
+        self.storage.purge_deleted(**self.storage_kw)
+        timestamp = self.storage.collection_timestamp(**self.storage_kw)
+        self.assertEqual(timestamp, record['last_modified'])
+
+    def replicated_storage(self, count=2, **kwargs):
+        conn_kwargs = postgresql._get_conn_kwargs(
+            self.settings['cliquet.storage_url'])
+        kwargs.setdefault('replicas', [conn_kwargs] * count)
+        return postgresql.PostgreSQL(pool_size=10, max_fetch_size=100,
+                                     **dict(conn_kwargs, **kwargs))
+
+    def test_reads_are_sent_to_replicas_in_turn(self):
+        storage = self.replicated_storage()
+        pools = storage._replica_pools
+        with mock.patch.object(pools[0], 'getconn',
+                               wraps=pools[0].getconn) as first:
+            with mock.patch.object(pools[1], 'getconn',
+                                   wraps=pools[1].getconn) as second:
+                for i in range(4):
+                    storage.get_all(**self.storage_kw)
+        self.assertEqual(first.call_count, 2)
+        self.assertEqual(second.call_count, 2)
+
+    def test_writes_are_sent_to_primary(self):
+        storage = self.replicated_storage(read_your_writes=False)
+        pools = storage._replica_pools
+        with mock.patch.object(pools[0], 'getconn') as replica:
+            storage.create(record={}, **self.storage_kw)
+        self.assertFalse(replica.called)
+
+    def test_reads_are_sent_to_primary_after_a_write(self):
+        storage = self.replicated_storage(count=1)
+        pools = storage._replica_pools
+        with mock.patch.object(pools[0], 'getconn') as replica:
+            with storage.pinned_reads():
+                record = storage.create(record={}, **self.storage_kw)
+                storage.get(object_id=record['id'], **self.storage_kw)
+        self.assertFalse(replica.called)
+
+    def test_reads_are_sent_to_replicas_after_the_unit_of_work(self):
+        storage = self.replicated_storage(count=1)
+        with storage.pinned_reads():
+            storage.create(record={}, **self.storage_kw)
+        self.assertIsNot(storage._get_read_pool(), storage.pool)
+        # Outside of any unit of work, writes do not pin the reads.
+        storage.create(record={}, **self.storage_kw)
+        self.assertIsNot(storage._get_read_pool(), storage.pool)
+
+    def test_writes_of_nested_units_pin_the_enclosing_unit(self):
+        storage = self.replicated_storage(count=1)
+        with storage.pinned_reads():
+            with storage.pinned_reads():
+                storage.create(record={}, **self.storage_kw)
+            self.assertIs(storage._get_read_pool(), storage.pool)
+
+    def test_reads_are_sent_to_replicas_if_read_your_writes_disabled(self):
+        storage = self.replicated_storage(count=1, read_your_writes=False)
+        pools = storage._replica_pools
+        record = storage.create(record={}, **self.storage_kw)
+        with mock.patch.object(pools[0], 'getconn',
+                               wraps=pools[0].getconn) as replica:
+            storage.get(object_id=record['id'], **self.storage_kw)
+        self.assertTrue(replica.called)
+
+    def test_unavailable_replicas_fall_back_to_primary(self):
+        unavailable = dict(host='localhost', port=1)
+        storage = self.replicated_storage(replicas=[unavailable])
+        record = self.create_record()
+        pools = storage._replica_pools
+        with mock.patch.object(pools[0], 'getconn',
+                               wraps=pools[0].getconn) as replica:
+            for i in range(2):
+                retrieved = storage.get(object_id=record['id'],
+                                        **self.storage_kw)
+                self.assertEqual(retrieved, record)
+        self.assertEqual(replica.call_count, 1)
+
+    def test_saturated_replicas_fall_back_to_primary(self):
+        storage = self.replicated_storage(count=1)
+        record = self.create_record()
+        pools = storage._replica_pools
+        with mock.patch.object(pools[0], 'getconn',
+                               side_effect=PoolTimeout()):
+            retrieved = storage.get(object_id=record['id'],
+                                    **self.storage_kw)
+        self.assertEqual(retrieved, record)
+        # Saturated replicas are not considered as failing.
+        self.assertIsNot(storage._get_read_pool(), storage.pool)
+
+    def test_replicas_failing_during_queries_are_not_used(self):
+        storage = self.replicated_storage(count=1)
+        with self.assertRaises(exceptions.BackendError):
+            with storage.connect(readonly=True):
+                raise psycopg2.OperationalError()
+        self.assertIs(storage._get_read_pool(), storage.pool)
+        storage.replica_retry_delay = -1
+        self.assertIsNot(storage._get_read_pool(), storage.pool)
+
+    def test_requests_that_write_read_from_primary(self):
+        for method, pinned in (('GET', False), ('POST', True)):
+            registry = mock.MagicMock()
+            handler = mock.MagicMock()
+            tween = postgresql._read_your_writes_tween_factory(handler,
+                                                               registry)
+            tween(mock.MagicMock(method=method))
+            self.assertTrue(handler.called)
+            registry.storage.pinned_reads.assert_called_with(pinned)
+
+    def test_replicas_are_read_from_settings(self):
         settings = self.settings.copy()
-        settings['cliquet.storage_pool_size'] = 1
-        msg = 'Pool size 1 ignored for PostgreSQL backend (Already set to 10).'
-        with mock.patch('cliquet.storage.postgresql.warnings.warn') as mocked:
-            self.backend.load_from_config(self._get_config(settings=settings))
-            mocked.assert_any_call(msg)
+        url = self.settings['cliquet.storage_url']
+        settings['cliquet.storage_replica_urls'] = '%s\n%s' % (url, url)
+        config = self._get_config(settings=settings)
+        storage = self.backend.load_from_config(config)
+        self.assertEqual(len(storage._replica_pools), 2)
+        self.assertTrue(config.add_tween.called)
+
+
+@mock.patch('cliquet.storage.postgresql.pool.psycopg2.connect',
+            side_effect=lambda **kwargs: mock.MagicMock(closed=False))
+class PostgresqlConnectionPoolTest(unittest.TestCase):
+    def test_connections_are_opened_on_demand(self, connect):
+        pool = ConnectionPool(size=2, host='db')
+        self.assertFalse(connect.called)
+        pool.getconn()
+        connect.assert_called_once_with(host='db')
+
+    def test_released_connections_are_reused(self, connect):
+        pool = ConnectionPool(size=2)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(connect.call_count, 1)
+
+    def test_stats_count_connections_in_use_and_idle(self, connect):
+        pool = ConnectionPool(size=2)
+        conn = pool.getconn()
+        pool.getconn()
+        pool.putconn(conn)
+        self.assertEqual(pool.stats, dict(in_use=1, idle=1, waiting=0))
+
+    def test_checkouts_are_counted_until_collected(self, connect):
+        pool = ConnectionPool(size=2)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        pool.getconn()
+        stats = pool.collect()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertIsNotNone(stats['checkout_duration'])
+        stats = pool.collect()
+        self.assertEqual(stats['checkouts'], 0)
+        self.assertIsNone(stats['checkout_duration'])
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_checkout_times_out_if_pool_is_exhausted(self, connect):
+        pool = ConnectionPool(size=1, timeout=0.01)
+        pool.getconn()
+        self.assertRaises(PoolTimeout, pool.getconn)
+        self.assertEqual(pool.stats['waiting'], 0)
+
+    def test_checkout_waits_for_a_connection_to_be_released(self, connect):
+        pool = ConnectionPool(size=1, timeout=5)
+        conn = pool.getconn()
+        threading.Timer(0.01, pool.putconn, args=(conn,)).start()
+        self.assertIs(pool.getconn(), conn)
+
+    def test_failed_connections_free_their_slot(self, connect):
+        pool = ConnectionPool(size=1, timeout=0)
+        connect.side_effect = psycopg2.OperationalError
+        self.assertRaises(psycopg2.OperationalError, pool.getconn)
+        connect.side_effect = None
+        pool.getconn()
+
+    def test_closed_connections_are_discarded(self, connect):
+        pool = ConnectionPool(size=1)
+        conn = pool.getconn()
+        conn.closed = True
+        pool.putconn(conn)
+        self.assertIsNot(pool.getconn(), conn)
+
+    def test_idle_connections_are_closed_after_max_idle(self, connect):
+        pool = ConnectionPool(size=1, max_idle=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        time.sleep(0.01)
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertTrue(conn.close.called)
+
+    def test_connections_are_closed_after_max_lifetime(self, connect):
+        pool = ConnectionPool(size=1, max_lifetime=0)
+        conn = pool.getconn()
+        time.sleep(0.01)
+        pool.putconn(conn)
+        self.assertTrue(conn.close.called)
+        self.assertEqual(pool.stats, dict(in_use=0, idle=0, waiting=0))
+
+    def test_closeall_closes_idle_connections_only(self, connect):
+        pool = ConnectionPool(size=2)
+        idle = pool.getconn()
+        in_use = pool.getconn()
+        pool.putconn(idle)
+        pool.closeall()
+        self.assertTrue(idle.close.called)
+        self.assertFalse(in_use.close.called)
+        self.assertIsNot(pool.getconn(), idle)
+
+    def test_connections_are_not_shared_with_forked_processes(self, connect):
+        pool = ConnectionPool(size=1)
+        inherited = pool.getconn()
+        pool.putconn(inherited)
+        with mock.patch('cliquet.storage.postgresql.pool.os.getpid',
+                        return_value=-1):
+            self.assertEqual(pool.stats, dict(in_use=0, idle=0, waiting=0))
+            conn = pool.getconn()
+        self.assertIsNot(conn, inherited)
+        self.assertFalse(inherited.close.called)
+
+    def test_connections_in_use_when_forked_are_not_released(self, connect):
+        pool = ConnectionPool(size=1)
+        inherited = pool.getconn()
+        with mock.patch('cliquet.storage.postgresql.pool.os.getpid',
+                        return_value=-1):
+            pool.putconn(inherited)
+            self.assertEqual(pool.stats, dict(in_use=0, idle=0, waiting=0))
+        self.assertFalse(inherited.close.called)
+
+    def test_backends_do_not_connect_until_used(self, connect):
+        postgresql.PostgreSQL(pool_size=10, max_fetch_size=100, host='db')
+        self.assertFalse(connect.called)
+
+
+@mock.patch('cliquet.storage.redis.redis.StrictRedis',
+            side_effect=lambda **kwargs: mock.MagicMock())
+class RedisClientTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = redisbackend.Redis(max_connections=3, host='db')
+
+    def test_client_is_created_on_first_use(self, client_class):
+        self.assertFalse(client_class.called)
+        self.assertIs(self.storage._client, self.storage._client)
+        self.assertEqual(client_class.call_count, 1)
+
+    def test_connection_pool_is_configured_with_backend_options(self, _):
+        with mock.patch('cliquet.storage.redis.redis.'
+                        'BlockingConnectionPool') as pool_class:
+            self.storage._client
+        pool_class.assert_called_with(max_connections=3, host='db')
+
+    def test_client_is_created_again_in_forked_processes(self, client_class):
+        client = self.storage._client
+        with mock.patch('cliquet.storage.redis.os.getpid', return_value=-1):
+            self.assertIsNot(self.storage._client, client)
+        self.assertEqual(client_class.call_count, 2)
+
+    def test_scripts_are_registered_with_the_current_client(self, _):
+        self.storage._bump_timestamp('test', '1234')
+        client = self.storage._client
+        self.assertEqual(client.register_script.call_count, 1)
+        with mock.patch('cliquet.storage.redis.os.getpid', return_value=-1):
+            self.storage._bump_timestamp('test', '1234')
+            self.assertIsNot(self.storage._client, client)
+            self.assertEqual(
+                self.storage._client.register_script.call_count, 1)
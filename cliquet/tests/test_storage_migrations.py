@@ -2,7 +2,7 @@ import os
 
 import mock
 
-from cliquet.storage import postgresql
+from cliquet.storage import postgresql, Sort
 from cliquet.utils import json
 
 from .support import unittest
@@ -41,9 +41,13 @@ class PostgresqlStorageMigrationTest(unittest.TestCase):
         DROP TABLE IF EXISTS records CASCADE;
         DROP TABLE IF EXISTS deleted CASCADE;
         DROP TABLE IF EXISTS metadata CASCADE;
+        DROP TABLE IF EXISTS records_count CASCADE;
+        DROP TABLE IF EXISTS timestamps CASCADE;
         DROP FUNCTION IF EXISTS resource_timestamp(VARCHAR, VARCHAR);
         DROP FUNCTION IF EXISTS collection_timestamp(VARCHAR, VARCHAR);
         DROP FUNCTION IF EXISTS bump_timestamp();
+        DROP FUNCTION IF EXISTS count_records();
+        DROP FUNCTION IF EXISTS copy_epoch_timestamp();
         """
         with self.storage.connect() as cursor:
             cursor.execute(q)
@@ -132,6 +136,76 @@ class PostgresqlStorageMigrationTest(unittest.TestCase):
 
         migrated, count = self.storage.get_all('test', 'jean-louis')
         self.assertEqual(migrated[0], before)
+        self.assertEqual(count, 1)
+
+    def test_timestamps_remain_unique_once_converted_to_integers(self):
+        self._delete_everything()
+        with self.storage.connect() as cursor:
+            here = os.path.abspath(os.path.dirname(__file__))
+            filepath = 'schema/postgresql-storage-1.6.sql'
+            old_schema = open(os.path.join(here, filepath)).read()
+            cursor.execute(old_schema)
+            # Timestamps that are equal once rounded to the millisecond.
+            query = """
+            ALTER TABLE records DISABLE TRIGGER USER;
+            INSERT INTO records (user_id, resource_name, last_modified)
+            VALUES ('jean-louis', 'test', '2015-07-01 00:00:00.0002'),
+                   ('jean-louis', 'test', '2015-07-01 00:00:00.0004'),
+                   ('jean-louis', 'test', '2015-07-01 00:00:00.0014');
+            ALTER TABLE records ENABLE TRIGGER USER;
+            """
+            cursor.execute(query)
+
+        self.storage.initialize_schema()
+
+        sorting = [Sort('last_modified', 1)]
+        records, _ = self.storage.get_all('test', 'jean-louis',
+                                          sorting=sorting)
+        epoch = 1435708800000
+        self.assertEqual([r['last_modified'] for r in records],
+                         [epoch, epoch + 1, epoch + 2])
+        timestamp = self.storage.collection_timestamp('test', 'jean-louis')
+        self.assertEqual(timestamp, epoch + 2)
+
+    def test_timestamps_written_during_conversion_are_converted(self):
+        self._delete_everything()
+        with self.storage.connect() as cursor:
+            here = os.path.abspath(os.path.dirname(__file__))
+            filepath = 'schema/postgresql-storage-1.6.sql'
+            old_schema = open(os.path.join(here, filepath)).read()
+            cursor.execute(old_schema)
+            query = """
+            INSERT INTO records (user_id, resource_name)
+            VALUES ('jean-louis', 'test'), ('jean-louis', 'test');
+            """
+            cursor.execute(query)
+
+        convert = self.storage._convert_timestamps_batches
+
+        def write_and_convert(table):
+            if table == 'records':
+                query = """
+                INSERT INTO records (id, parent_id, collection_id)
+                VALUES ('written', 'jean-louis', 'test');
+                """
+                with self.storage.connect() as cursor:
+                    cursor.execute(query)
+            return convert(table)
+
+        self.storage.migration_batch_size = 1
+        with mock.patch.object(self.storage, '_convert_timestamps_batches',
+                               side_effect=write_and_convert):
+            self.storage.initialize_schema()
+
+        sorting = [Sort('last_modified', 1)]
+        records, _ = self.storage.get_all('test', 'jean-louis',
+                                          sorting=sorting)
+        timestamps = [r['last_modified'] for r in records]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[-1]['id'], 'written')
+        self.assertEqual(sorted(set(timestamps)), timestamps)
+        timestamp = self.storage.collection_timestamp('test', 'jean-louis')
+        self.assertEqual(timestamp, timestamps[-1])
 
     def test_every_available_migration_succeeds_if_tables_were_flushed(self):
         # During tests, tables can be flushed.
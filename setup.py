@@ -44,6 +44,14 @@ else:
 DEPENDENCY_LINKS = [
 ]
 
+COLUMNAR_REQUIRES = [
+    'numpy',
+]
+
+MSGPACK_REQUIRES = [
+    'msgpack-python >= 0.5.2',
+]
+
 MONITORING_REQUIRES = [
     'raven',
     'statsd',
@@ -80,6 +88,8 @@ setup(name='cliquet',
       extras_require={
           'postgresql': REQUIREMENTS + POSTGRESQL_REQUIRES,
           'monitoring': REQUIREMENTS + MONITORING_REQUIRES,
+          'columnar': REQUIREMENTS + COLUMNAR_REQUIRES,
+          'msgpack': REQUIREMENTS + MSGPACK_REQUIRES,
       },
       dependency_links=DEPENDENCY_LINKS,
       entry_points=ENTRY_POINTS)